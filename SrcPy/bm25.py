@@ -0,0 +1,83 @@
+# bm25.py
+"""
+Okapi BM25 over a page's chunks, used by textify's chunk ranking.
+
+    index = BM25Index(chunks)               # one pass over the chunks builds the inverted index
+    index.search("query words", top_k=5)    # -> [(chunk_index, score), ...]
+
+Postings are numpy arrays per term, so a query costs O(sum of its terms' posting lengths)
+instead of a scan of every chunk. rrf() fuses rankings (e.g. BM25 + vector) by reciprocal rank.
+"""
+
+from __future__ import annotations
+import math, re
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index with BM25 term weights (k1, b) over a fixed list of documents."""
+
+    def __init__(self, docs: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.size = len(docs)
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for i, doc in enumerate(docs):
+            counts = Counter(tokenize(doc))
+            lengths[i] = sum(counts.values())
+            for term, tf in counts.items():
+                ids, tfs = postings[term]
+                ids.append(i)
+                tfs.append(tf)
+        avgdl = float(lengths.mean()) if self.size else 0.0
+        # per-document length normalisation, shared by every term
+        self._norm = k1 * (1 - b + b * lengths / avgdl) if avgdl else np.full(self.size, k1, dtype=np.float32)
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, (ids, tfs) in postings.items():
+            df = len(ids)
+            idf = math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+            self._postings[term] = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32), idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for the query."""
+        out = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            out[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        return out
+
+    def search(self, query: str, top_k: int = 5, candidates: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """Top-k (index, score) with score > 0, optionally only among `candidates`."""
+        scores = self.scores(query)
+        if candidates is not None:
+            pool = np.fromiter(candidates, dtype=np.int64)
+        else:
+            pool = np.flatnonzero(scores)
+        pool = pool[scores[pool] > 0]
+        if not len(pool) or top_k <= 0:
+            return []
+        k = min(top_k, len(pool))
+        top = pool[np.argpartition(-scores[pool], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def rrf(rankings: Iterable[Sequence[int]], top_k: int, k: int = 60) -> List[int]:
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over the rankings each item appears in."""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, 1):
+            fused[item] += 1.0 / (k + rank)
+    return [item for item, _ in sorted(fused.items(), key=lambda kv: -kv[1])[:top_k]]
@@ -1,42 +1,76 @@
-from openai import OpenAI
-
-class chat_api:
-    def __init__(self, api_url):
-        self.ask_client = OpenAI(api_key=api_url).responses.create
-
-    def askDefinition(self, word):
-        response = (self.ask_client(model="gpt-4o-mini", input=f"What is the definition of this {word}?. Give a concise answer.")).output_text
-        file = open(r"convoContext.txt", "w")
-        file.write(response)
-        file.close()
-        return response
-    
-    def askCuriculum(self, prompt, file_path):
-        file = open(file_path, "w")
-        file.write((self.ask_client(model="gpt-4o-mini", input=f"Create a curiculum to learn about {prompt}. Give me a step by step learning plan from the very fundamental to fully understand.")).output_text)
-        file.close()
-
-    def askSpecific(self, prompt):
-        return (self.ask_client(model="gpt-4o-mini", input=prompt)).output_text
-    
-    def findTopic(self, text, subject):
-        # The return format should be [topic, explanation]
-        response = (self.ask_client(model="gpt-4o-mini", input=f"Find the main topic of this text: {text}. Narrow it down to a singular main topic and explained why it related to {subject}. Your answer should be just the word that define the topic at first and then a comma and then the explaination that why it is related to said topic. Make the explaination short")).output_text
-        return response.split(", ", 1)
-    
-    def determineMood(self, text):
-        response = (self.ask_client(model="gpt-4o-mini", input=f"Determine the mood of this text: {text}. Your answer should be ""The next question mood is ""mood""."".")).output_text
-        return response
-    
-    def followupQuestion(self, question):
-        file = open(r"convoContext.txt", "r+")
-        file.write(f"\n{self.determineMood(question)}\n")
-        old_text = file.read()
-        file.close()
-        response = (self.ask_client(model="gpt-4o-mini", input=f"Continue this conversation {old_text}, The question is: {question}. Based on the current context answer this question")).output_text
-        file = open(r"convoContext.txt", "a")
-        file.write("\n" + response)
-        file.close()
-        return response
-    
+from llm_client import LLMClient
+from result_sinks import SinkWriter
+
+class chat_api:
+    # Bump an entry whenever its prompt changes so cached answers for the old prompt are not reused
+    prompt_versions = {"definition": 1, "curriculum": 1, "topic": 1, "mood": 1}
+
+    def __init__(self, api_url, sinks=None):
+        # Pooled async OpenAI client with deadlines, retries and a concurrency cap (llm_client.py);
+        # the methods below are its sync facade, so get_net's threads call them as before
+        self.llm = LLMClient(api_url)
+        # Results are returned directly; sinks (result_sinks.py) only get a copy, written on a background thread
+        self.sink_writer = SinkWriter(sinks) if sinks else None
+
+    def _record(self, operation, text, **meta):
+        if self.sink_writer is not None:
+            self.sink_writer.submit(operation, text, **meta)
+        return text
+
+    @property
+    def model(self):
+        return self.llm.model_for("specific")
+
+    def model_for(self, operation):
+        return self.llm.model_for(operation)
+
+    def close(self):
+        if self.sink_writer is not None:
+            self.sink_writer.close()
+        self.llm.close()
+
+    def askDefinition(self, word):
+        response = self.llm.ask("definition", f"What is the definition of this {word}?. Give a concise answer.")
+        return self._record("definition", response, subject=word)
+    
+    def askCurriculum(self, prompt):
+        response = self.llm.ask("curriculum", f"Create a curiculum to learn about {prompt}. Give me a step by step learning plan from the very fundamental to fully understand.")
+        return self._record("curriculum", response, subject=prompt)
+
+    def askCuriculum(self, prompt, file_path):
+        # Old name, kept for scripts that want the curriculum saved to a file of their own
+        curriculum = self.askCurriculum(prompt)
+        with open(file_path, "w", encoding="utf-8") as file:
+            file.write(curriculum)
+        return curriculum
+
+    def askSpecific(self, prompt):
+        return self._record("specific", self.llm.ask("specific", prompt))
+
+    def askSpecificStream(self, prompt):
+        # Yields the answer text piece by piece as the deltas arrive
+        parts = []
+        for delta in self.llm.ask_stream("specific", prompt):
+            parts.append(delta)
+            yield delta
+        self._record("specific", "".join(parts))
+    
+    def findTopic(self, text, subject):
+        # The return format should be [topic, explanation]
+        response = self.llm.ask("topic", f"Find the main topic of this text: {text}. Narrow it down to a singular main topic and explained why it related to {subject}. Your answer should be just the word that define the topic at first and then a comma and then the explaination that why it is related to said topic. Make the explaination short")
+        return self._record("topic", response, subject=subject).split(", ", 1)
+    
+    def determineMood(self, text):
+        response = self.llm.ask("mood", f"Determine the mood of this text: {text}. Your answer should be ""The next question mood is ""mood""."".")
+        return self._record("mood", response, subject=text)
+    
+    def summarizeConversation(self, summary, transcript, max_words):
+        # Folds new turns into the running summary that follow-up prompts carry
+        return self.llm.ask("summary", f"Here is the running summary of a conversation about a selected text: {summary or '(empty)'}. These turns came after it: {transcript}. Rewrite the summary so it covers both, in at most {max_words} words. Keep the facts, names, numbers and the user's goals and open questions. Answer with the summary only.")
+    
+    def followupQuestion(self, question, conversation):
+        # conversation: the earlier turns as text (e.g. ChatbotConversation.history_text()), no shared file
+        response = self.llm.ask("followup", f"Continue this conversation {conversation}, The question is: {question}. Based on the current context answer this question")
+        return self._record("followup", response, subject=question)
+    
     
\ No newline at end of file
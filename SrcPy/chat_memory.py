@@ -0,0 +1,65 @@
+# chat_memory.py
+"""
+Bounded conversation history for follow-up questions.
+
+The prompt carries a rolling summary of older turns plus the newest turns that fit a
+token window (TTTK_HISTORY_TOKENS). Turns that slide out of the window are folded into
+the summary off the request path (capped at TTTK_SUMMARY_TOKENS), so the history part
+of a prompt stays about HISTORY_TOKENS + SUMMARY_TOKENS however long the chat runs.
+
+    start = window_start(history, summarized_upto)       # oldest turn still in the window
+    text = history_prompt(summary, history[start:])      # "" for a new conversation
+    summary = fold_turns(summarize, summary, history[summarized_upto:start])
+"""
+
+from __future__ import annotations
+import os
+from typing import Callable, Dict, List
+
+from textify import count_tokens, truncate_tokens
+
+HISTORY_TOKENS = int(os.getenv("TTTK_HISTORY_TOKENS", 600))  # recent turns, verbatim
+SUMMARY_TOKENS = int(os.getenv("TTTK_SUMMARY_TOKENS", 200))  # rolling summary of everything older
+TURN_MAX_TOKENS = max(1, HISTORY_TOKENS // 2)  # one long answer can't take the whole window
+
+
+def format_turn(message: Dict, max_tokens: int = TURN_MAX_TOKENS) -> str:
+    question = message.get("user_question") or ""
+    answer = message.get("bot_response") or ""
+    # the question is usually short; whatever it leaves goes to the answer
+    question = truncate_tokens(question, max_tokens // 4)
+    answer = truncate_tokens(answer, max(1, max_tokens - count_tokens(question)))
+    return f"User: {question}\nAssistant: {answer}"
+
+
+def window_start(history: List[Dict], summarized_upto: int = 0, budget: int = HISTORY_TOKENS) -> int:
+    """Index of the oldest turn in the window: the newest turns (at least one) that fit `budget`."""
+    used, start = 0, len(history)
+    while start > summarized_upto:
+        cost = count_tokens(format_turn(history[start - 1]))
+        if used + cost > budget and start < len(history):
+            break
+        used += cost
+        start -= 1
+    return start
+
+
+def history_prompt(summary: str, turns: List[Dict]) -> str:
+    """The CONVERSATION section of a prompt, or "" when there is nothing to carry over."""
+    parts = []
+    if summary:
+        parts.append(f"Summary of the earlier conversation:\n{summary}")
+    if turns:
+        parts.append("Most recent turns:\n" + "\n\n".join(format_turn(m) for m in turns))
+    return "\n\n".join(parts)
+
+
+def fold_turns(summarize: Callable[[str, str, int], str], summary: str, turns: List[Dict],
+               max_tokens: int = SUMMARY_TOKENS) -> str:
+    """New rolling summary: `summarize(summary, transcript, max_words)` over the turns, capped in tokens."""
+    if not turns:
+        return summary
+    transcript = "\n\n".join(format_turn(m) for m in turns)
+    # ~0.75 words per token leaves the model some slack before the hard cut
+    updated = summarize(summary, transcript, max(20, int(max_tokens * 0.75))).strip()
+    return truncate_tokens(updated, max_tokens)
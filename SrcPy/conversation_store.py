@@ -0,0 +1,438 @@
+# conversation_store.py
+"""
+Storage backends behind get_net.ConversationManager.
+
+- InMemoryConversationStore : conversations live in this process (single worker)
+- SQLiteConversationStore   : conversations live in a WAL-mode SQLite file shared by
+                              every worker/process, so any worker can serve any conversation
+
+Stored objects expose conversation_id, last_activity, version, estimated_bytes(),
+to_state() and release(); the SQLite store rebuilds them with the `factory` it is given.
+After put(), changes are persisted per part with update(conversation, "context" | "summary" | "turn").
+"""
+
+from __future__ import annotations
+import json, logging, os, sqlite3, threading, time, zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_DB = os.path.join(os.path.expanduser("~"), ".cache", "tttk", "conversations.db")
+
+
+class ConversationStore:
+    """Interface every conversation backend implements."""
+
+    def put(self, conversation) -> None:
+        """Insert a new conversation (evicting others if over the limits)."""
+        raise NotImplementedError
+
+    def update(self, conversation, part: str) -> None:
+        """Persist one changed part ("context", "summary" or "turn") of a stored conversation."""
+        raise NotImplementedError
+
+    def load_context(self, conversation_id: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        (pending, context) as other workers see it, or None if the conversation is gone.
+        pending is the time.time() the running build was queued, 0.0 once the context is stored.
+        """
+        raise NotImplementedError
+
+    def get(self, conversation_id: str):
+        """Return the conversation and mark it as recently used, or None."""
+        raise NotImplementedError
+
+    def delete(self, conversation_id: str) -> bool:
+        raise NotImplementedError
+
+    def expire_idle(self, max_idle_seconds: float) -> int:
+        """Drop conversations idle for longer than max_idle_seconds; return how many."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def metrics(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+
+class InMemoryConversationStore(ConversationStore):
+    """
+    LRU-ordered dict guarded by a lock, bounded by count and estimated bytes. The byte total
+    is kept as it changes (put, update, evict, delete) rather than re-summed on every put.
+    """
+
+    def __init__(self, max_conversations: int, max_bytes: int):
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        # least recently used first; get/put move a conversation to the end in O(1)
+        self.active_conversations: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._sizes: Dict[str, int] = {}  # estimated_bytes() of each conversation when last put/updated
+        self._bytes = 0
+        self._evictions = {"count": 0, "bytes": 0, "idle": 0}
+
+    def put(self, conversation) -> None:
+        with self._lock:
+            self.active_conversations[conversation.conversation_id] = conversation
+            self.active_conversations.move_to_end(conversation.conversation_id)
+            self._resize(conversation)
+            self._enforce_limits()
+
+    def update(self, conversation, part: str) -> None:
+        # the store holds the live objects; only the byte total needs the new size
+        with self._lock:
+            if conversation.conversation_id in self.active_conversations:
+                self._resize(conversation)
+
+    def load_context(self, conversation_id: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            conversation = self.active_conversations.get(conversation_id)
+        if conversation is None:
+            return None
+        return conversation.context_pending, conversation.context
+
+    def get(self, conversation_id: str):
+        with self._lock:
+            conversation = self.active_conversations.get(conversation_id)
+            if conversation is not None:
+                self.active_conversations.move_to_end(conversation_id)
+                conversation.last_activity = datetime.now()
+            return conversation
+
+    def delete(self, conversation_id: str) -> bool:
+        with self._lock:
+            conversation = self.active_conversations.pop(conversation_id, None)
+            self._bytes -= self._sizes.pop(conversation_id, 0)
+        if conversation is None:
+            return False
+        conversation.release()
+        return True
+
+    def expire_idle(self, max_idle_seconds: float) -> int:
+        current_time = datetime.now()
+        expired = []
+        with self._lock:
+            # oldest activity sits at the front, so stop at the first live conversation
+            for conv_id, conversation in self.active_conversations.items():
+                if (current_time - conversation.last_activity).total_seconds() <= max_idle_seconds:
+                    break
+                expired.append(conv_id)
+            for conv_id in expired:
+                self.active_conversations.pop(conv_id).release()
+                self._bytes -= self._sizes.pop(conv_id, 0)
+            self._evictions["idle"] += len(expired)
+            self._enforce_limits()
+        return len(expired)
+
+    def clear(self) -> None:
+        with self._lock:
+            conversations = list(self.active_conversations.values())
+            self.active_conversations.clear()
+            self._sizes.clear()
+            self._bytes = 0
+        for conversation in conversations:
+            conversation.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "live_conversations": len(self.active_conversations),
+                "estimated_bytes": self._bytes,
+                "max_conversations": self.max_conversations,
+                "max_bytes": self.max_bytes,
+                "evictions": dict(self._evictions),
+            }
+
+    def _resize(self, conversation) -> None:
+        """Re-measure one conversation and adjust the byte total (lock held)."""
+        size = conversation.estimated_bytes()
+        self._bytes += size - self._sizes.get(conversation.conversation_id, 0)
+        self._sizes[conversation.conversation_id] = size
+
+    def _evict_oldest(self, reason: str) -> None:
+        conv_id, conversation = self.active_conversations.popitem(last=False)
+        self._bytes -= self._sizes.pop(conv_id, 0)
+        conversation.release()
+        self._evictions[reason] += 1
+
+    def _enforce_limits(self) -> None:
+        """Evict least recently used conversations until under the count and byte caps (lock held)."""
+        while len(self.active_conversations) > self.max_conversations:
+            self._evict_oldest("count")
+        while self._bytes > self.max_bytes and len(self.active_conversations) > 1:
+            self._evict_oldest("bytes")
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    Conversations in a WAL-mode SQLite database shared by every worker. A conversation is one
+    row (selection, context, summary) plus append-only rows for its chat turns, and each part
+    is written on its own (update()), so workers never overwrite each other's changes.
+    Every write bumps the row version; a small per-process cache keyed by that version
+    avoids re-decoding unchanged conversations. Triggers keep the row count and byte total
+    in conversation_stats, so the limits are checked without scanning the table.
+    """
+
+    def __init__(self, path: Optional[str], factory: Callable[[Dict[str, Any]], Any],
+                 max_conversations: int, max_bytes: int, cache_size: int = 256):
+        self.path = path or _DEFAULT_DB
+        self.factory = factory
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._evictions = {"count": 0, "bytes": 0, "idle": 0}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        db = self._db()
+        with db:
+            columns = [row[1] for row in db.execute("PRAGMA table_info(conversations)")]
+            if "state" in columns:
+                # whole-snapshot layout from earlier versions; conversations are short-lived, start over
+                logger.info("Dropping conversations stored in the old snapshot layout")
+                db.execute("DROP TABLE conversations")
+                db.execute("DROP TABLE IF EXISTS conversation_stats")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS conversations ("
+                " id TEXT PRIMARY KEY,"
+                " version INTEGER NOT NULL,"
+                " last_activity REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " selected_text TEXT NOT NULL,"
+                " current_url TEXT,"
+                " created_at TEXT NOT NULL,"
+                " context BLOB,"
+                " context_pending REAL NOT NULL DEFAULT 0,"
+                " summary TEXT NOT NULL DEFAULT '',"
+                " summarized_upto INTEGER NOT NULL DEFAULT 0)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_conversations_activity ON conversations(last_activity)")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS conversation_turns ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " conversation_id TEXT NOT NULL REFERENCES conversations(id) ON DELETE CASCADE,"
+                " message TEXT NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_turns_conversation ON conversation_turns(conversation_id, seq)")
+            # running totals, updated in the same transaction as every insert, resize and delete
+            db.execute("CREATE TABLE IF NOT EXISTS conversation_stats ("
+                       " id INTEGER PRIMARY KEY CHECK (id = 0), count INTEGER NOT NULL, bytes INTEGER NOT NULL)")
+            db.execute("INSERT OR IGNORE INTO conversation_stats (id, count, bytes)"
+                       " SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM conversations")
+            db.execute("CREATE TRIGGER IF NOT EXISTS conversations_stats_insert AFTER INSERT ON conversations BEGIN"
+                       " UPDATE conversation_stats SET count = count + 1, bytes = bytes + NEW.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS conversations_stats_delete AFTER DELETE ON conversations BEGIN"
+                       " UPDATE conversation_stats SET count = count - 1, bytes = bytes - OLD.size; END")
+            db.execute("CREATE TRIGGER IF NOT EXISTS conversations_stats_resize AFTER UPDATE OF size ON conversations"
+                       " BEGIN UPDATE conversation_stats SET bytes = bytes + NEW.size - OLD.size; END")
+
+    def put(self, conversation) -> None:
+        """Insert a new conversation (an existing row is left alone; changes go through update())."""
+        state = conversation.to_state()
+        context = _pack(state.get("context"))
+        size = len(state["selected_text"]) + len(state.get("current_url") or "") + len(context)
+        db = self._db()
+        with db:
+            inserted = db.execute(
+                "INSERT OR IGNORE INTO conversations (id, version, last_activity, size, selected_text, current_url,"
+                " created_at, context, context_pending) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (conversation.conversation_id, conversation.version, conversation.last_activity.timestamp(), size,
+                 state["selected_text"], state.get("current_url"), state["created_at"], context,
+                 float(state.get("context_pending") or 0.0)),
+            ).rowcount
+        if inserted:
+            self._cache_put(conversation)
+            self._enforce_limits()
+
+    def update(self, conversation, part: str) -> None:
+        """
+        Persist one part of a conversation: "context" (context + pending flag), "summary"
+        (rolling summary, only ever moved forward) or "turn" (its newest chat turn, appended).
+        A deleted or evicted conversation is not recreated.
+        """
+        state = conversation.to_state()
+        conv_id = conversation.conversation_id
+        db = self._db()
+        with db:
+            if part == "context":
+                context = _pack(state.get("context"))
+                changed = db.execute(
+                    "UPDATE conversations SET context = ?, context_pending = ?, version = version + 1,"
+                    " size = size - COALESCE(length(context), 0) + ? WHERE id = ?",
+                    (context, float(state.get("context_pending") or 0.0), len(context), conv_id)).rowcount
+            elif part == "summary":
+                # another worker may already have folded more turns; never move the summary back
+                changed = db.execute(
+                    "UPDATE conversations SET summary = ?, summarized_upto = ?, version = version + 1,"
+                    " size = size - length(summary) + ? WHERE id = ? AND summarized_upto < ?",
+                    (state["history_summary"], state["summarized_upto"], len(state["history_summary"]),
+                     conv_id, state["summarized_upto"])).rowcount
+            elif part == "turn":
+                message = json.dumps(state["chat_history"][-1])
+                changed = db.execute(
+                    "UPDATE conversations SET version = version + 1, size = size + ?, last_activity = ?"
+                    " WHERE id = ?", (len(message), time.time(), conv_id)).rowcount
+                if changed:
+                    db.execute("INSERT INTO conversation_turns (conversation_id, message) VALUES (?, ?)",
+                               (conv_id, message))
+            else:
+                raise ValueError(f"Unknown conversation part '{part}'")
+            row = db.execute("SELECT version FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+        if row is None:
+            self._cache_drop(conv_id)
+        elif not changed or row[0] != conversation.version:
+            # another worker wrote in between (or ours lost): this object is behind, reload on next get
+            conversation.version = -1
+
+    def load_context(self, conversation_id: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """(time the pending build was queued or 0.0, context) as stored, or None if the conversation is gone."""
+        row = self._db().execute("SELECT context_pending, context FROM conversations WHERE id = ?",
+                                 (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        return float(row[0]), _unpack(row[1]) or {}
+
+    def get(self, conversation_id: str):
+        db = self._db()
+        with db:
+            row = db.execute("SELECT version FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+            if row is None:
+                self._cache_drop(conversation_id)
+                return None
+            db.execute("UPDATE conversations SET last_activity = ? WHERE id = ?", (time.time(), conversation_id))
+        with self._cache_lock:
+            cached = self._cache.get(conversation_id)
+            if cached is not None and cached.version == row[0]:
+                self._cache.move_to_end(conversation_id)
+                cached.last_activity = datetime.now()
+                return cached
+        # changed by another worker (or not seen yet): rebuild from the stored row and turns
+        state_row = db.execute(
+            "SELECT version, selected_text, current_url, created_at, context, context_pending, summary,"
+            " summarized_upto FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        if state_row is None:
+            return None
+        turns = db.execute("SELECT message FROM conversation_turns WHERE conversation_id = ? ORDER BY seq",
+                           (conversation_id,)).fetchall()
+        version, selected_text, current_url, created_at, context, pending, summary, summarized_upto = state_row
+        conversation = self.factory({
+            "conversation_id": conversation_id, "selected_text": selected_text, "current_url": current_url,
+            "created_at": created_at, "last_activity": datetime.now().isoformat(), "version": version,
+            "context": _unpack(context), "context_pending": float(pending),
+            "history_summary": summary, "summarized_upto": summarized_upto,
+            "chat_history": [json.loads(t[0]) for t in turns],
+        })
+        self._cache_put(conversation)
+        return conversation
+
+    def delete(self, conversation_id: str) -> bool:
+        db = self._db()
+        with db:
+            deleted = db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,)).rowcount
+        self._cache_drop(conversation_id)
+        return bool(deleted)
+
+    def expire_idle(self, max_idle_seconds: float) -> int:
+        db = self._db()
+        with db:
+            expired = [row[0] for row in db.execute("DELETE FROM conversations WHERE last_activity < ? RETURNING id",
+                                                     (time.time() - max_idle_seconds,))]
+        for conv_id in expired:
+            self._cache_drop(conv_id)
+        self._evictions["idle"] += len(expired)
+        return len(expired)
+
+    def clear(self) -> None:
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM conversations")
+        with self._cache_lock:
+            conversations = list(self._cache.values())
+            self._cache.clear()
+        for conversation in conversations:
+            conversation.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        count, size = self._totals(self._db())
+        return {
+            "backend": "sqlite",
+            "live_conversations": count,
+            "estimated_bytes": size,
+            "max_conversations": self.max_conversations,
+            "max_bytes": self.max_bytes,
+            "evictions": dict(self._evictions),
+        }
+
+    # ---- internals --------------------------------------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("PRAGMA foreign_keys=ON")  # turns go with their conversation
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def _totals(db: sqlite3.Connection) -> Tuple[int, int]:
+        """(rows, bytes) from the trigger-maintained totals."""
+        return db.execute("SELECT count, bytes FROM conversation_stats WHERE id = 0").fetchone()
+
+    def _cache_put(self, conversation) -> None:
+        with self._cache_lock:
+            self._cache[conversation.conversation_id] = conversation
+            self._cache.move_to_end(conversation.conversation_id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, conversation_id: str) -> None:
+        with self._cache_lock:
+            conversation = self._cache.pop(conversation_id, None)
+        if conversation is not None:
+            conversation.release()
+
+    def _enforce_limits(self) -> None:
+        """Delete least recently active rows past the count and byte caps."""
+        db = self._db()
+        with db:
+            count, total = self._totals(db)
+            if count <= self.max_conversations and total <= self.max_bytes:
+                return
+            victims = []
+            for conv_id, size in db.execute("SELECT id, size FROM conversations ORDER BY last_activity"):
+                if count - len(victims) <= self.max_conversations and total <= self.max_bytes:
+                    break
+                if count - len(victims) <= 1:
+                    break
+                reason = "count" if count - len(victims) > self.max_conversations else "bytes"
+                self._evictions[reason] += 1
+                victims.append(conv_id)
+                total -= size
+            db.executemany("DELETE FROM conversations WHERE id = ?", [(v,) for v in victims])
+        for conv_id in victims:
+            self._cache_drop(conv_id)
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value or {}).encode("utf-8"))
+
+
+def _unpack(blob: Optional[bytes]) -> Any:
+    return json.loads(zlib.decompress(blob).decode("utf-8")) if blob else None
+
+
+def create_store(kind: str, factory: Callable[[Dict[str, Any]], Any], *, max_conversations: int,
+                 max_bytes: int, path: Optional[str] = None) -> ConversationStore:
+    """Build the backend named by `kind` ('memory' or 'sqlite')."""
+    if kind == "sqlite":
+        return SQLiteConversationStore(path, factory, max_conversations, max_bytes)
+    if kind != "memory":
+        logger.warning(f"Unknown conversation store '{kind}'; using memory")
+    return InMemoryConversationStore(max_conversations, max_bytes)
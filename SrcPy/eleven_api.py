@@ -2,10 +2,17 @@ from elevenlabs.client import ElevenLabs
 import os
 
 class voice_api:
-    def __init__(self):
-        self.ask_client = ElevenLabs(api_key=os.getenv('ELEVEN_API_KEY'))
+    model_id = "scribe_v1"
+    FAILED = "Transcription failed"
 
-    def transcribe(self, audio_file):
-        audio = open(audio_file, "rb")
-        response = self.ask_client.speech_to_text.convert(model_id="scribe_v1", file=audio)
-        return response.text if response else "Transcription failed"
\ No newline at end of file
+    def __init__(self, api_url=None):
+        self.ask_client = ElevenLabs(api_key=api_url or os.getenv('ELEVEN_API_KEY'))
+
+    def transcribe(self, audio_file, filename=None, content_type=None):
+        # audio_file: a path, or an open binary file that is streamed to the API as-is (e.g. a spooled upload)
+        if isinstance(audio_file, (str, os.PathLike)):
+            with open(audio_file, "rb") as audio:
+                return self.transcribe(audio, filename or os.path.basename(audio_file), content_type)
+        upload = (filename, audio_file, content_type) if filename and content_type else audio_file
+        response = self.ask_client.speech_to_text.convert(model_id=self.model_id, file=upload)
+        return response.text if response else self.FAILED
@@ -0,0 +1,191 @@
+# embedding_backend.py
+"""
+Pluggable sentence-embedding backends for textify.
+
+    backend = create_backend()            # TTTK_EMBED_BACKEND, default "sentence-transformers"
+    vecs = backend.encode(chunks)         # float32 matrix, rows L2-normalized
+
+- sentence-transformers : the SentenceTransformer model (baseline)
+- torch-int8            : same model with Linear layers dynamically quantized to int8
+- onnx                  : MiniLM exported to ONNX, run by onnxruntime (no torch needed at runtime)
+- onnx-int8             : the ONNX graph dynamically quantized to int8
+
+`vector_space` names the space the vectors live in. fp32 ONNX reproduces the baseline
+vectors, so it shares the baseline's space (and its cached embeddings); the int8
+variants get their own so quantized and full-precision vectors are never mixed.
+Compare backends with bench/bench_embeddings.py before switching.
+"""
+
+from __future__ import annotations
+import hashlib, os, time
+from typing import List, Optional
+
+import numpy as np
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+BACKENDS = ("sentence-transformers", "torch-int8", "onnx", "onnx-int8")
+
+_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tttk", "onnx")
+
+
+class EmbeddingBackend:
+    """encode(texts) -> float32 (len(texts), dim) matrix with L2-normalized rows."""
+
+    name = ""
+
+    def __init__(self, model: str = DEFAULT_MODEL, batch_size: Optional[int] = None,
+                 threads: Optional[int] = None):
+        self.model = model
+        self.batch_size = int(batch_size or os.getenv("TTTK_EMBED_BATCH_SIZE", 32))
+        self.threads = int(threads if threads is not None else os.getenv("TTTK_EMBED_THREADS", 0))
+        self.vector_space = vector_space_for(self.name, model)
+        self.load_seconds = 0.0
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def info(self) -> dict:
+        return {"backend": self.name, "model": self.model, "vector_space": self.vector_space,
+                "batch_size": self.batch_size, "threads": self.threads,
+                "load_seconds": round(self.load_seconds, 3)}
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The SentenceTransformer model as-is (torch, fp32)."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model: str = DEFAULT_MODEL, batch_size: Optional[int] = None,
+                 threads: Optional[int] = None):
+        super().__init__(model, batch_size, threads)
+        started = time.perf_counter()
+        from sentence_transformers import SentenceTransformer
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(model, device="cpu")
+        self.load_seconds = time.perf_counter() - started
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        vecs = self._model.encode(texts, batch_size=batch_size or self.batch_size,
+                                  convert_to_numpy=True, normalize_embeddings=True)
+        return vecs.astype("float32")
+
+
+class QuantizedTorchBackend(SentenceTransformerBackend):
+    """SentenceTransformer with its Linear layers dynamically quantized to int8."""
+
+    name = "torch-int8"
+
+    def __init__(self, model: str = DEFAULT_MODEL, batch_size: Optional[int] = None,
+                 threads: Optional[int] = None):
+        super().__init__(model, batch_size, threads)
+        started = time.perf_counter()
+        import torch
+        torch.quantization.quantize_dynamic(self._model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        self.load_seconds += time.perf_counter() - started
+
+
+class OnnxBackend(EmbeddingBackend):
+    """
+    MiniLM on onnxruntime: tokenizers -> transformer graph -> mean pooling -> L2 normalize,
+    the same pipeline SentenceTransformer runs for this model.
+    The graph comes from TTTK_ONNX_PATH, else the model repo's onnx/model.onnx on the Hub.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model: str = DEFAULT_MODEL, batch_size: Optional[int] = None,
+                 threads: Optional[int] = None, quantized: bool = False,
+                 onnx_path: Optional[str] = None, max_seq_length: int = 256):
+        super().__init__(model, batch_size, threads)
+        started = time.perf_counter()
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = onnx_path or os.getenv("TTTK_ONNX_PATH") or _hub_onnx(model)
+        if quantized:
+            path = _quantize_onnx(path)
+            self.name = "onnx-int8"
+            self.vector_space = vector_space_for(self.name, model)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_pretrained(model)
+        self._tokenizer.enable_truncation(max_length=max_seq_length)
+        self._tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        self.onnx_path = path
+        self.load_seconds = time.perf_counter() - started
+
+    def encode(self, texts: List[str], batch_size: Optional[int] = None) -> np.ndarray:
+        batch_size = batch_size or self.batch_size
+        out = []
+        # sorting by length keeps padding per batch small; rows are put back in order below
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            batch = [texts[i] for i in order[start:start + batch_size]]
+            out.append(self._encode_batch(batch))
+        if not out:
+            return np.zeros((0, 0), dtype="float32")
+        vecs = np.empty((len(texts), out[0].shape[1]), dtype="float32")
+        vecs[order] = np.vstack(out)
+        return vecs
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self._tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+        tokens = self._session.run(None, {k: v for k, v in feeds.items() if k in self._inputs})[0]
+        weights = mask[:, :, np.newaxis].astype("float32")
+        pooled = (tokens * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return (pooled / np.linalg.norm(pooled, axis=1, keepdims=True).clip(1e-12)).astype("float32")
+
+    def info(self) -> dict:
+        return {**super().info(), "onnx_path": self.onnx_path}
+
+
+def _hub_onnx(model: str) -> str:
+    from huggingface_hub import hf_hub_download
+    return hf_hub_download(model, "onnx/model.onnx")
+
+
+def _quantize_onnx(path: str) -> str:
+    """Dynamically quantize an fp32 ONNX graph to int8 once; cached under ~/.cache/tttk/onnx."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    stem = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:12]
+    target = os.path.join(_ONNX_DIR, f"{stem}-{digest}-int8.onnx")
+    if not os.path.exists(target):
+        os.makedirs(_ONNX_DIR, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        quantize_dynamic(path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, target)
+    return target
+
+
+def vector_space_for(kind: Optional[str] = None, model: str = DEFAULT_MODEL) -> str:
+    """The vector_space backend `kind` (default TTTK_EMBED_BACKEND) gives `model`, without loading it."""
+    kind = kind or os.getenv("TTTK_EMBED_BACKEND", "sentence-transformers")
+    return f"{model}+{kind}" if kind in ("torch-int8", "onnx-int8") else model
+
+
+def create_backend(kind: Optional[str] = None, model: str = DEFAULT_MODEL, batch_size: Optional[int] = None,
+                   threads: Optional[int] = None) -> EmbeddingBackend:
+    """Build the backend named by `kind` (default: TTTK_EMBED_BACKEND, else sentence-transformers)."""
+    kind = kind or os.getenv("TTTK_EMBED_BACKEND", "sentence-transformers")
+    if kind == "sentence-transformers":
+        return SentenceTransformerBackend(model, batch_size, threads)
+    if kind == "torch-int8":
+        return QuantizedTorchBackend(model, batch_size, threads)
+    if kind in ("onnx", "onnx-int8"):
+        return OnnxBackend(model, batch_size, threads, quantized=kind == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend '{kind}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,189 @@
+# fetch.py
+"""
+Shared HTTP fetch layer for textify.
+
+- one keep-alive connection pool for every thread (no new TCP+TLS handshake per page)
+- a single GET; the Content-Type (or %PDF magic) decides HTML vs PDF, no HEAD round trip
+- If-None-Match / If-Modified-Since revalidation -> {"not_modified": True} on 304
+- gzip/deflate (and brotli when installed) content encoding
+- HTML decoded by BOM, Content-Type charset or <meta charset>, else utf-8/windows-1252
+- strict connect/read timeouts, an overall deadline and a max-bytes cutoff
+- spool=True streams PDF bodies to a temp file instead of holding them in memory
+"""
+
+from __future__ import annotations
+import codecs, os, re, tempfile, threading, time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from telemetry import FETCH_BYTES, span
+
+try:  # urllib3 decodes "br" only when a brotli module is importable
+    import brotli  # noqa: F401
+    _ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        _ACCEPT_ENCODING = "gzip, deflate, br"
+    except ImportError:
+        _ACCEPT_ENCODING = "gzip, deflate"
+
+MAX_BYTES = int(os.getenv("TTTK_FETCH_MAX_BYTES", 20 * 1024 * 1024))
+CONNECT_TIMEOUT = float(os.getenv("TTTK_FETCH_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.getenv("TTTK_FETCH_READ_TIMEOUT", 15))
+DEADLINE = float(os.getenv("TTTK_FETCH_DEADLINE", 30))
+
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; TTTK/1.0)",
+    "Accept": "text/html,application/xhtml+xml,application/pdf;q=0.9,*/*;q=0.8",
+    "Accept-Encoding": _ACCEPT_ENCODING,
+}
+
+# every thread gets its own Session, all mounting this one adapter (and so one urllib3 pool)
+_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=1)
+_local = threading.local()
+
+
+class FetchTooLarge(ValueError):
+    """The response body exceeded the max-bytes cutoff."""
+
+
+def get_session() -> requests.Session:
+    """This thread's Session on the shared connection pool."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("http://", _adapter)
+        session.mount("https://", _adapter)
+        session.headers.update(_HEADERS)
+        _local.session = session
+    return session
+
+
+_BOMS = ((codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF32_LE, "utf-32"), (codecs.BOM_UTF32_BE, "utf-32"),
+         (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+# <meta charset="x"> and <meta http-equiv="Content-Type" content="text/html; charset=x">
+_META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([A-Za-z0-9_.:+-]+)""", re.I)
+
+
+def _charset(content_type: str) -> str:
+    for part in content_type.split(";"):
+        part = part.strip()
+        if part.lower().startswith("charset="):
+            return part.split("=", 1)[1].strip("\"' ")
+    return ""
+
+
+def _known(encoding: str) -> str:
+    try:
+        return codecs.lookup(encoding).name if encoding else ""
+    except LookupError:  # unknown charset label
+        return ""
+
+
+def decode_html(body: bytes, content_type: str = "") -> str:
+    """
+    HTML bytes -> str, sniffing the encoding the way browsers and bs4 do: a byte
+    order mark, then the Content-Type charset, then <meta charset> in the first 4 KB, then
+    utf-8, falling back to windows-1252 when the bytes aren't valid utf-8.
+    """
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            return body.decode(encoding, errors="replace")
+    match = _META_CHARSET.search(body[:4096])
+    encoding = _known(_charset(content_type)) or _known(match.group(1).decode("ascii") if match else "")
+    if encoding:
+        return body.decode(encoding, errors="replace")
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        return body.decode("windows-1252", errors="replace")
+
+
+def _is_pdf(content_type: str, head: bytes, url: str) -> bool:
+    return ("application/pdf" in content_type
+            or head[:5] == b"%PDF-"
+            or (content_type in ("", "application/octet-stream") and url.lower().endswith(".pdf")))
+
+
+def fetch_url(url: str, etag: str = "", last_modified: str = "", max_bytes: Optional[int] = None,
+              deadline: Optional[float] = None, spool: bool = False) -> Dict:
+    """
+    GET `url` through the shared pool.
+    Returns {"url", "status", "not_modified", "is_pdf", "content_type", "body": bytes,
+             "text": str (HTML only), "file", "etag", "last_modified"}.
+    With spool=True a PDF body is written to an anonymous temp file returned (rewound) as
+    "file" with an empty "body"; the caller closes it. "file" is None otherwise.
+    Raises requests.RequestException on HTTP/network errors and FetchTooLarge past max_bytes.
+    """
+    with span("fetch"):
+        return _fetch(url, etag, last_modified, max_bytes, deadline, spool)
+
+
+def _fetch(url: str, etag: str, last_modified: str, max_bytes: Optional[int], deadline: Optional[float],
+           spool: bool) -> Dict:
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    deadline = DEADLINE if deadline is None else deadline
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    started = time.monotonic()
+    with get_session().get(url, headers=headers, stream=True, allow_redirects=True,
+                        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)) as response:
+        result = {
+            "url": response.url,
+            "status": response.status_code,
+            "not_modified": response.status_code == 304,
+            "content_type": response.headers.get("Content-Type", "").lower(),
+            "etag": response.headers.get("ETag", "") or etag,
+            "last_modified": response.headers.get("Last-Modified", "") or last_modified,
+            "body": b"",
+            "text": "",
+            "file": None,
+            "is_pdf": False,
+        }
+        if result["not_modified"]:
+            return result
+        response.raise_for_status()
+
+        declared = response.headers.get("Content-Length")
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise FetchTooLarge(f"{url}: {declared} bytes exceeds limit of {max_bytes}")
+
+        parts, size, sink = [], 0, None
+        try:
+            for block in response.iter_content(chunk_size=64 * 1024):
+                if spool and size == 0 and _is_pdf(result["content_type"], block, url):
+                    sink = tempfile.TemporaryFile(prefix="tttk-", suffix=".pdf")
+                size += len(block)
+                if size > max_bytes:
+                    raise FetchTooLarge(f"{url}: body exceeds limit of {max_bytes} bytes")
+                if time.monotonic() - started > deadline:
+                    raise requests.Timeout(f"{url}: exceeded {deadline}s fetch deadline")
+                if sink is not None:
+                    sink.write(block)
+                else:
+                    parts.append(block)
+        except BaseException:
+            if sink is not None:
+                sink.close()
+            raise
+        body = b"".join(parts)
+
+    if sink is not None:
+        FETCH_BYTES.inc(size, kind="pdf")
+        sink.seek(0)
+        result.update(file=sink, is_pdf=True)
+        return result
+    content_type = result["content_type"]
+    result["body"] = body
+    result["is_pdf"] = _is_pdf(content_type, body, url)
+    FETCH_BYTES.inc(size, kind="pdf" if result["is_pdf"] else "html")
+    if not result["is_pdf"]:
+        result["text"] = decode_html(body, content_type)
+    return result
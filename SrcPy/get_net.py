@@ -1,14 +1,29 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import requests
 import uuid
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import threading
+import socket
+import time
 import logging
+import json
 import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__))) #don't delete this, this enables access to bot_api file
 from bot_api import chat_api
-from textify import build_context_from_source
+from textify import CONTEXT_TOKEN_BUDGET, build_context_from_source, embed_chunks, model_status, warm_up
+from conversation_store import create_store, InMemoryConversationStore
+from chat_memory import window_start, history_prompt, fold_turns
+from result_sinks import create_sinks
+from response_cache import ResponseCache
+from semantic_cache import SemanticCache
+from singleflight import metrics as singleflight_metrics
+from telemetry import (CACHE_EVENTS, REQUEST_SECONDS, collect_timings, render as render_metrics,
+                       server_timing, span, start_timings, stop_timings)
+from transcription import (TranscriptionBusy, TranscriptionJobs, TranscriptionUnavailable, UploadTooLarge,
+                           spool_upload)
 from typing import Dict, Any
 
 # Configure logging
@@ -17,7 +32,50 @@ logger = logging.getLogger(__name__)
 
 # Initialize OpenAI client (you'll need to set your API key)
 openai_api_key = os.getenv('OPENAI_API_KEY', 'your-api-key-here')
-chat_client = chat_api(openai_api_key)
+# Answers are returned in memory; TTTK_CHAT_SINKS optionally persists copies in the background
+chat_client = chat_api(openai_api_key, sinks=create_sinks())
+
+# Page context (fetch, extract, chunk, embed) is built on a bounded background pool
+CONTEXT_WORKERS = int(os.getenv('TTTK_CONTEXT_WORKERS', '4'))
+CONTEXT_MAX_PENDING = int(os.getenv('TTTK_CONTEXT_MAX_PENDING', '32'))
+CONTEXT_WAIT_SECONDS = float(os.getenv('TTTK_CONTEXT_WAIT_SECONDS', '30'))
+CONTEXT_POLL_SECONDS = 0.1  # how often a worker checks the shared store for another worker's build
+# a build still pending this long after it was queued died with its worker; others stop waiting for it
+CONTEXT_LEASE_SECONDS = float(os.getenv('TTTK_CONTEXT_LEASE_SECONDS', '120'))
+CONTEXT_TOP_K = 5
+CONTEXT_MAX_TOKENS = 320  # chunk size; pre-warmed pages (start_server.py ingest) must use the same
+context_executor = ThreadPoolExecutor(max_workers=CONTEXT_WORKERS, thread_name_prefix='context')
+_context_slots = threading.BoundedSemaphore(CONTEXT_MAX_PENDING)
+
+# Rolling history summaries are LLM calls: a small pool of their own, so they never delay page builds
+SUMMARY_WORKERS = int(os.getenv('TTTK_SUMMARY_WORKERS', '2'))
+SUMMARY_MAX_PENDING = int(os.getenv('TTTK_SUMMARY_MAX_PENDING', '16'))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix='summary')
+_summary_slots = threading.BoundedSemaphore(SUMMARY_MAX_PENDING)
+
+# Options 1-4 depend only on the selected text, so their answers are cached across conversations
+response_cache = ResponseCache()
+
+# Free-form questions are matched against earlier paraphrases asked over the same context
+# and the same last few questions (see ChatbotConversation.cache_scope)
+semantic_cache = SemanticCache(embed_chunks)
+SEMANTIC_CACHE_TURNS = int(os.getenv('TTTK_SEMANTIC_CACHE_TURNS', '1'))
+
+# Voice uploads are transcribed on a bounded pool; identical audio is served from a content-hash cache
+transcription_jobs = TranscriptionJobs()  # the provider (and its SDK) is loaded on the first upload
+TRANSCRIBE_MAX_WAIT = float(os.getenv('TTTK_TRANSCRIBE_MAX_WAIT', '30'))
+
+def cached_answer(operation, text, compute):
+    """Serve a selection-only answer from the response cache, calling compute() on a miss"""
+    computed = []
+    def compute_and_note():
+        computed.append(True)
+        return compute()
+    answer = response_cache.get_or_compute(
+        operation, chat_client.model_for(operation), text, chat_client.prompt_versions[operation], compute_and_note
+    )
+    CACHE_EVENTS.inc(cache='response', result='miss' if computed else 'hit')
+    return answer
 
 class ChatbotConversation:
     """Unique conversation object for each text selection"""
@@ -27,14 +85,181 @@ class ChatbotConversation:
         self.selected_text = selected_text
         self.current_url = current_url
         self.chat_history = []
+        self.history_summary = ''  # rolling summary of chat_history[:summarized_upto]
+        self.summarized_upto = 0
+        self.summary_future = None
         self.created_at = datetime.now()
         self.last_activity = datetime.now()
         self.context: Dict[str, Any] = {}
+        self.context_pending = 0.0  # time.time() a build was queued, here or in another worker; 0 = none
+        self.context_future = None
+        self.context_timings = None  # stage spans of the background build, reported once (Server-Timing)
+        self.version = 0
+        self._lock = threading.RLock()  # request thread vs. background context / summary jobs
+        self.on_change = None  # set by the conversation manager to report updates to the store: on_change(self, part)
+        self.load_context = None  # shared stores: (pending, context) as last written by any worker
+
+    def to_state(self):
+        """Serializable snapshot for out-of-process conversation stores"""
+        return {
+            'conversation_id': self.conversation_id,
+            'selected_text': self.selected_text,
+            'current_url': self.current_url,
+            'chat_history': self.chat_history,
+            'history_summary': self.history_summary,
+            'summarized_upto': self.summarized_upto,
+            'created_at': self.created_at.isoformat(),
+            'last_activity': self.last_activity.isoformat(),
+            'context': self.context,
+            'context_pending': self.context_pending,
+            'version': self.version
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a conversation from to_state()"""
+        conversation = cls(state['selected_text'], state.get('current_url'), state['conversation_id'])
+        conversation.chat_history = state.get('chat_history', [])
+        conversation.history_summary = state.get('history_summary', '')
+        conversation.summarized_upto = state.get('summarized_upto', 0)
+        conversation.created_at = datetime.fromisoformat(state['created_at'])
+        conversation.last_activity = datetime.fromisoformat(state['last_activity'])
+        conversation.context = state.get('context') or {}
+        conversation.context_pending = float(state.get('context_pending') or 0.0)
+        conversation.version = state.get('version', 0)
+        return conversation
+
+    def _changed(self, part):
+        """Bump the version and report `part` ('context', 'summary' or 'turn') to the store"""
+        self.version += 1
+        if self.on_change is not None:
+            self.on_change(self, part)
+
+    def release(self):
+        """Called when the conversation is evicted or deleted"""
+        # don't keep building context for a conversation nobody can reach anymore
+        if self.context_future is not None:
+            self.context_future.cancel()
+        if self.summary_future is not None:
+            self.summary_future.cancel()
     
     def set_context(self, context: Dict[str, Any]):
         """Store the full context dictionary (from build_context_from_source)."""
-        self.context = context
+        with self._lock:
+            self.context = context
+            self.context_pending = 0.0
+            self._changed('context')
+
+    def fallback_context(self):
+        """Selection-only context used when the page can't be processed"""
+        return {
+            "title": "",
+            "context": f"Selection: {self.selected_text}",
+            "selected_indices": [],
+            "selected_chunks": []
+        }
+
+    def _build_context_job(self):
+        with collect_timings() as timings:
+            try:
+                with span('context_build'):
+                    ctx = build_context_from_source(
+                        selected_text=self.selected_text,
+                        url_or_html=self.current_url,
+                        top_k=CONTEXT_TOP_K,
+                        max_tokens=CONTEXT_MAX_TOKENS,
+                        token_budget=CONTEXT_TOKEN_BUDGET
+                    )
+                logger.info(f"Context for {self.conversation_id}: {len(ctx['selected_indices'])} chunks, "
+                            f"{ctx['tokens_used']}/{ctx['token_budget']} tokens (anchor: {ctx['anchor'] or 'none'}); "
+                            f"{server_timing(timings)}")
+            except Exception as e:
+                logger.warning(f"Context build failed; fallback to selection only: {e}")
+                ctx = self.fallback_context()
+        self.context_timings = timings
+        self.set_context(ctx)  # <-- store dict as-is
+        return ctx
+
+    def take_context_timings(self):
+        """The background build's stage spans, once (None before the build finishes or after)"""
+        if self.context_future is None or not self.context_future.done():
+            return None
+        timings, self.context_timings = self.context_timings, None
+        return timings
+
+    def start_context_build(self):
+        """Queue the page context build on the background pool and return immediately"""
+        if not self.current_url:
+            self.set_context(self.fallback_context())
+            return
+        if not _context_slots.acquire(blocking=False):
+            logger.warning(f"Context pool saturated; conversation {self.conversation_id} uses selection only")
+            self.set_context(self.fallback_context())
+            return
+        # other workers serving this conversation see the pending build and wait for it too
+        self.context_pending = time.time()
+        self._changed('context')
+        self.context_future = context_executor.submit(self._build_context_job)
+        self.context_future.add_done_callback(lambda _: _context_slots.release())
+
+    def context_status(self):
+        """'ready' once the context is available, 'pending' while it is still being built"""
+        if self.context_future is not None:
+            return 'ready' if self.context_future.done() else 'pending'
+        return 'pending' if self.context_pending and not self.context_lease_expired() else 'ready'
+
+    def context_lease_expired(self, pending=None):
+        """True when a build queued by some worker is past CONTEXT_LEASE_SECONDS (that worker is gone)"""
+        pending = self.context_pending if pending is None else pending
+        return bool(pending) and time.time() - pending > CONTEXT_LEASE_SECONDS
+
+    def wait_for_context(self, timeout=None):
+        """Block until the background context build finishes (or the timeout passes)"""
+        future = self.context_future
+        if future is None:
+            if self.context_pending and self.load_context is not None:
+                self._poll_shared_context(CONTEXT_WAIT_SECONDS if timeout is None else timeout)
+            return
+        if future.done():
+            return
+        try:
+            with span('context_wait'):
+                future.result(timeout=CONTEXT_WAIT_SECONDS if timeout is None else timeout)
+        except FutureTimeout:
+            logger.warning(f"Context for {self.conversation_id} not ready in time; answering with selection only")
         
+    def _poll_shared_context(self, timeout):
+        """Wait for a build running in another worker to store the context (shared stores only)"""
+        deadline = time.monotonic() + timeout
+        with span('context_wait'):
+            while True:
+                stored = self.load_context(self.conversation_id)
+                if stored is None:
+                    return  # deleted meanwhile
+                pending, context = stored
+                if not pending:
+                    self.context, self.context_pending = context, 0.0
+                    return
+                if self.context_lease_expired(pending):
+                    # store the fallback so no other worker waits for this build either
+                    logger.warning(f"Context build for {self.conversation_id} was abandoned; using selection only")
+                    self.set_context(self.fallback_context())
+                    return
+                if time.monotonic() >= deadline:
+                    break
+                time.sleep(CONTEXT_POLL_SECONDS)
+        logger.warning(f"Context for {self.conversation_id} not ready in time; answering with selection only")
+
+    def estimated_bytes(self):
+        """Rough memory held by this conversation (selection, context and chat history text)"""
+        size = len(self.selected_text) + len(self.current_url or '')
+        context = self.context if isinstance(self.context, dict) else {}
+        size += len(context.get("context") or '') + len(self.history_summary)
+        size += sum(len(c) for c in context.get("selected_chunks", []))
+        for message in self.chat_history:
+            size += len(message['user_question'] or '') + len(message['bot_response'] or '') + 128
+        return size
+
     def add_message(self, user_question, bot_response=None):
         """Add a message to the conversation history"""
         message = {
@@ -43,8 +268,45 @@ class ChatbotConversation:
             'bot_response': bot_response,
             'message_id': str(uuid.uuid4())
         }
-        self.chat_history.append(message)
-        self.last_activity = datetime.now()
+        with self._lock:
+            self.chat_history.append(message)
+            self.last_activity = datetime.now()
+            self._changed('turn')
+            self.schedule_summary()
+
+    def history_text(self):
+        """Rolling summary + the recent turns that fit the history window ('' for a new chat)"""
+        start = window_start(self.chat_history, self.summarized_upto)
+        return history_prompt(self.history_summary, self.chat_history[start:])
+
+    def schedule_summary(self):
+        """Fold turns that slid out of the history window into the rolling summary, in the background"""
+        with self._lock:
+            if self.summary_future is not None and not self.summary_future.done():
+                return  # the running job reschedules itself when it finishes
+            end = window_start(self.chat_history, self.summarized_upto)
+            if end <= self.summarized_upto:
+                return
+            if not _summary_slots.acquire(blocking=False):
+                return  # pool saturated: the turns stay pending and are retried with the next message
+            begin = self.summarized_upto
+            self.summary_future = summary_executor.submit(self._summary_job, begin, end, self.history_summary,
+                                                          self.chat_history[begin:end])
+            self.summary_future.add_done_callback(lambda _: _summary_slots.release())
+
+    def _summary_job(self, begin, end, summary, turns):
+        try:
+            summary = fold_turns(chat_client.summarizeConversation, summary, turns)
+        except Exception as e:
+            # the turns stay pending and are retried with the next message
+            logger.warning(f"History summary failed for {self.conversation_id}: {e}")
+            return
+        with self._lock:
+            if self.summarized_upto == begin:
+                self.history_summary, self.summarized_upto = summary, end
+                self._changed('summary')  # persists only the summary fields
+            self.summary_future = None
+            self.schedule_summary()  # more turns may have slid out while this one ran
         
     def get_page_url(self):
         """Get the stored page URL for this conversation"""
@@ -73,78 +335,142 @@ Please choose from these options (type the number):
 
 Type a number (1-5) to choose, or ask your own question directly."""
 
-    def generate_llm_response(self, user_question):
-        """Generate LLM response based on selected text, conversation history, and question type"""
+    def match_option(self, user_input):
+        """Return the predefined option ('1'-'5') the input asks for, or None for a free-form question"""
+        # Handle numbered options
+        if user_input in ['1', '2', '3', '4', '5']:
+            return user_input
+
+        # Check for option keywords
+        if any(keyword in user_input.lower() for keyword in ['definition', 'define', 'meaning']):
+            return '1'
+        elif any(keyword in user_input.lower() for keyword in ['curriculum', 'learning plan', 'study plan']):
+            return '2'
+        elif any(keyword in user_input.lower() for keyword in ['topic', 'categorize', 'category']):
+            return '3'
+        elif any(keyword in user_input.lower() for keyword in ['mood', 'tone', 'emotion']):
+            return '4'
+        return None
+
+    def context_text(self):
+        """Context string for free-form questions (waits for the background build)"""
+        # Only free-form questions need the page context, so only they wait for it
+        self.wait_for_context()
+        return (
+            self.context.get("context")
+            if isinstance(self.context, dict) and self.context.get("context")
+            else f"Selection: {self.selected_text}"
+        )
+
+    def build_prompt(self, user_question, ctx_text=None, history=None):
+        """Build the askSpecific prompt from the stored context, the conversation so far and the user's question"""
+        # For general questions: prioritize the stored context, but allow extra info if clearly marked
+        if ctx_text is None:
+            ctx_text = self.context_text()
+        if history is None:
+            history = self.history_text()
+        conversation = f"CONVERSATION SO FAR:\n{history}\n\n" if history else ""
+
+        return (
+            "Answer using BOTH the provided CONTEXT and your general knowledge.\n"
+            "Guidelines:\n"
+            "1) Lead with general knowledge and provide the best, up-to-date, consensus answer.\n"
+            "2) If the CONTEXT adds a useful quote, number, definition, or example, incorporate it and cite the chunk like [Chunk 2].\n"
+            "3) If CONTEXT and general knowledge conflict, explain the discrepancy and prefer the most reliable/consensus view.\n"
+            "4) If the CONTEXT is sparse or off-topic, say so briefly and proceed using general knowledge.\n"
+            "5) Keep the answer clear and concise\n"
+            "6) Use the CONVERSATION SO FAR (if any) to resolve follow-ups like 'why?' or 'tell me more'\n\n"
+            f"CONTEXT:\n{ctx_text}\n\n"
+            f"{conversation}"
+            f"QUESTION:\n{user_question}"
+        )
+
+    def cache_scope(self, ctx_text):
+        """Semantic cache scope: the context plus the last SEMANTIC_CACHE_TURNS questions"""
+        # "why?" after one question means something else after another, so the scope follows
+        # the recent questions; the answers and the rolling summary are left out, so the same
+        # short thread over the same page hits in any conversation. A follow-up that leans on
+        # turns older than that may get an answer given after a different earlier thread.
+        recent = self.chat_history[-SEMANTIC_CACHE_TURNS:] if SEMANTIC_CACHE_TURNS > 0 else []
+        return semantic_cache.scope_key("\n\n".join([ctx_text] + [m['user_question'] or '' for m in recent]))
+
+    def generate_llm_response(self, user_question, use_cache=True):
+        """Generate LLM response based on selected text, conversation history, and question type.
+        Returns (response, cache_hit); the flag is per call, as requests can share a conversation"""
         try:
             # Check if user is selecting a predefined option
-            user_input = user_question.strip()
-            
-            # Handle numbered options
-            if user_input in ['1', '2', '3', '4', '5']:
-                return self.handle_predefined_option(user_input)
-            
-            # Check for option keywords
-            if any(keyword in user_input.lower() for keyword in ['definition', 'define', 'meaning']):
-                return self.handle_predefined_option('1')
-            elif any(keyword in user_input.lower() for keyword in ['curriculum', 'learning plan', 'study plan']):
-                return self.handle_predefined_option('2')
-            elif any(keyword in user_input.lower() for keyword in ['topic', 'categorize', 'category']):
-                return self.handle_predefined_option('3')
-            elif any(keyword in user_input.lower() for keyword in ['mood', 'tone', 'emotion']):
-                return self.handle_predefined_option('4')
-            
+            option = self.match_option(user_question.strip())
+            if option is not None:
+                return self.handle_predefined_option(option), False
+
             # For general questions, use askSpecific
             # return chat_client.askSpecific(f"Based on this selected text: '{self.selected_text}', please answer: {user_question}")
+            ctx_text = self.context_text()
+            history = self.history_text()
+            scope = self.cache_scope(ctx_text)
+            cached, question_vec = semantic_cache.lookup(scope, user_question) if use_cache else (None, None)
+            # no question vector: the lookup was skipped (useCache off, cache disabled or no embedder)
+            CACHE_EVENTS.inc(cache='semantic', result='hit' if cached is not None
+                             else 'miss' if question_vec is not None else 'bypass')
+            if cached is not None:
+                return cached, True
 
-            # For general questions: prioritize the stored context, but allow extra info if clearly marked
-            ctx_text = (
-                self.context.get("context")
-                if isinstance(self.context, dict) else f"Selection: {self.selected_text}"
-            )
-
-            prompt = (
-                "Answer using BOTH the provided CONTEXT and your general knowledge.\n"
-                "Guidelines:\n"
-                "1) Lead with general knowledge and provide the best, up-to-date, consensus answer.\n"
-                "2) If the CONTEXT adds a useful quote, number, definition, or example, incorporate it and cite the chunk like [Chunk 2].\n"
-                "3) If CONTEXT and general knowledge conflict, explain the discrepancy and prefer the most reliable/consensus view.\n"
-                "4) If the CONTEXT is sparse or off-topic, say so briefly and proceed using general knowledge.\n"
-                "5) Keep the answer clear and concise\n\n"
-                f"CONTEXT:\n{ctx_text}\n\n"
-                f"QUESTION:\n{user_question}"
-            )
-
-            return chat_client.askSpecific(prompt)
+            answer = chat_client.askSpecific(self.build_prompt(user_question, ctx_text, history))
+            if use_cache:
+                semantic_cache.store(scope, user_question, answer, question_vec)
+            return answer, False
 
-            
         except Exception as e:
             logger.error(f"Error generating LLM response: {str(e)}")
-            return f"I apologize, but I encountered an error processing your question. Please try again."
+            return "I apologize, but I encountered an error processing your question. Please try again.", False
+
+    def stream_llm_response(self, user_question, use_cache=True):
+        """Yield (delta, cache_hit) pairs; predefined options and cache hits arrive as a single piece"""
+        option = self.match_option(user_question.strip())
+        if option is not None:
+            yield self.handle_predefined_option(option), False
+            return
+        try:
+            ctx_text = self.context_text()
+            history = self.history_text()
+            scope = self.cache_scope(ctx_text)
+            cached, question_vec = semantic_cache.lookup(scope, user_question) if use_cache else (None, None)
+            # no question vector: the lookup was skipped (useCache off, cache disabled or no embedder)
+            CACHE_EVENTS.inc(cache='semantic', result='hit' if cached is not None
+                             else 'miss' if question_vec is not None else 'bypass')
+            if cached is not None:
+                yield cached, True
+                return
+
+            parts = []
+            for delta in chat_client.askSpecificStream(self.build_prompt(user_question, ctx_text, history)):
+                parts.append(delta)
+                yield delta, False
+            if use_cache:
+                semantic_cache.store(scope, user_question, "".join(parts), question_vec)
+        except Exception as e:
+            logger.error(f"Error streaming LLM response: {str(e)}")
+            yield "I apologize, but I encountered an error processing your question. Please try again.", False
     
     def handle_predefined_option(self, option):
         """Handle predefined question options"""
         try:
             if option == '1':  # Definition
-                return chat_client.askDefinition(self.selected_text)
+                return cached_answer('definition', self.selected_text,
+                                     lambda: chat_client.askDefinition(self.selected_text))
             elif option == '2':  # Curriculum
-                # For curriculum, we'll return the content instead of writing to file
-                temp_file = "temp_curriculum.md"
-                chat_client.askCurriculum(self.selected_text, temp_file)
-                try:
-                    with open(temp_file, "r", encoding='utf-8') as file:
-                        curriculum_content = file.read()
-                    os.remove(temp_file)  # Clean up temp file
-                    return curriculum_content
-                except:
-                    return "I created a learning curriculum, but there was an issue retrieving it. Please try again."
+                return cached_answer('curriculum', self.selected_text,
+                                     lambda: chat_client.askCurriculum(self.selected_text))
             elif option == '3':  # Find Topic
-                topic_result = chat_client.findTopic(self.selected_text, "general knowledge")
+                topic_result = cached_answer('topic', self.selected_text,
+                                             lambda: chat_client.findTopic(self.selected_text, "general knowledge"))
                 if isinstance(topic_result, list) and len(topic_result) >= 2:
                     return f"Main Topic: {topic_result[0]}\n\nExplanation: {topic_result[1]}"
                 else:
                     return f"Main Topic: {topic_result}"
             elif option == '4':  # Determine Mood
-                mood = chat_client.determineMood(self.selected_text)
+                mood = cached_answer('mood', self.selected_text,
+                                     lambda: chat_client.determineMood(self.selected_text))
                 return f"The mood/tone of this text is: {mood}"
             elif option == '5':  # Specific question
                 return "Please go ahead and ask your specific question about the selected text."
@@ -155,42 +481,86 @@ Type a number (1-5) to choose, or ask your own question directly."""
             return f"I encountered an error processing your request. Please try again."
 
 class ConversationManager:
-    """Manages all active conversations"""
+    """Manages all active conversations on top of a pluggable store (memory or SQLite)"""
     
-    def __init__(self):
-        self.active_conversations = {}
+    def __init__(self, store=None, idle_ttl_seconds=None, sweep_interval=None):
+        self.idle_ttl_seconds = float(idle_ttl_seconds or os.getenv('TTTK_CONVERSATION_IDLE_SECONDS', str(24 * 3600)))
+        self.sweep_interval = float(sweep_interval or os.getenv('TTTK_CONVERSATION_SWEEP_SECONDS', '60'))
+        self.store = store or create_store(
+            os.getenv('TTTK_CONVERSATION_STORE', 'memory'),
+            ChatbotConversation.from_state,
+            max_conversations=int(os.getenv('TTTK_MAX_CONVERSATIONS', '1000')),
+            max_bytes=int(os.getenv('TTTK_MAX_CONVERSATION_BYTES', str(256 * 1024 * 1024))),
+            path=os.getenv('TTTK_CONVERSATION_DB')
+        )
+        # shared stores persist each update; the in-process store only re-measures the conversation
+        shared = not isinstance(self.store, InMemoryConversationStore)
+        self._on_change = self.store.update
+        self._load_context = self.store.load_context if shared else None
+        self._stop = threading.Event()
+        self._sweeper = None
+        self.start_sweeper()
+
+    @property
+    def active_conversations(self):
+        """Live conversation objects (in-memory store only)"""
+        return getattr(self.store, 'active_conversations', {})
         
     def create_conversation(self, selected_text, current_url=None):
         """Create a new conversation for selected text"""
         conversation = ChatbotConversation(selected_text, current_url)
-        self.active_conversations[conversation.conversation_id] = conversation
+        conversation.on_change, conversation.load_context = self._on_change, self._load_context
+        self.store.put(conversation)
         logger.info(f"Created new conversation: {conversation.conversation_id} for URL: {current_url}")
         return conversation
         
     def get_conversation(self, conversation_id):
         """Get existing conversation by ID"""
-        return self.active_conversations.get(conversation_id)
+        conversation = self.store.get(conversation_id)
+        if conversation is not None:
+            conversation.on_change, conversation.load_context = self._on_change, self._load_context
+        return conversation
         
     def delete_conversation(self, conversation_id):
         """Delete conversation when chat window is closed"""
-        if conversation_id in self.active_conversations:
-            del self.active_conversations[conversation_id]
+        if self.store.delete(conversation_id):
             logger.info(f"Deleted conversation: {conversation_id}")
             return True
         return False
+
+    def clear(self):
+        """Drop every conversation"""
+        self.store.clear()
         
-    def cleanup_old_conversations(self, max_age_hours=24):
-        """Clean up old conversations"""
-        current_time = datetime.now()
-        to_delete = []
-        
-        for conv_id, conversation in self.active_conversations.items():
-            age = current_time - conversation.last_activity
-            if age.total_seconds() > max_age_hours * 3600:
-                to_delete.append(conv_id)
-                
-        for conv_id in to_delete:
-            self.delete_conversation(conv_id)
+    def cleanup_old_conversations(self, max_age_hours=None):
+        """Clean up conversations idle for longer than max_age_hours (default: the idle TTL)"""
+        max_age = self.idle_ttl_seconds if max_age_hours is None else max_age_hours * 3600
+        expired = self.store.expire_idle(max_age)
+        if expired:
+            logger.info(f"Expired {expired} idle conversations")
+        return expired
+
+    def metrics(self):
+        """Live count, eviction counters and estimated memory held by conversations"""
+        return {**self.store.metrics(), 'idle_ttl_seconds': self.idle_ttl_seconds}
+
+    def start_sweeper(self):
+        """Run cleanup_old_conversations periodically on a daemon thread"""
+        if self.sweep_interval <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(target=self._sweep_loop, name='conversation-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try:
+                self.cleanup_old_conversations()
+            except Exception as e:
+                logger.error(f"Conversation sweep failed: {str(e)}")
 
 app = Flask(__name__)
 # Enable CORS for the specific Chrome extension
@@ -199,6 +569,42 @@ CORS(app)  # Allow all origins for development
 # Initialize conversation manager
 conversation_manager = ConversationManager()
 
+@app.before_request
+def start_request_timing():
+    """Collect this request's stage spans (fetch, chunk, llm_*, ...) for the Server-Timing header"""
+    g.request_started = time.perf_counter()
+    g.timings, g.timings_token = start_timings()
+
+@app.after_request
+def add_server_timing(response):
+    """Observe the request latency and expose its stage breakdown to the extension's devtools"""
+    started = g.get('request_started')
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(total, route=route, method=request.method, status=response.status_code)
+    # the background context build's stages show up once, on the first response after it finished
+    parts = [server_timing(g.timings), server_timing(g.get('context_timings') or [], prefix='ctx-'),
+             f"total;dur={total * 1000:.1f}"]
+    response.headers['Server-Timing'] = ", ".join(p for p in parts if p)
+    response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.teardown_request
+def stop_request_timing(exc):
+    token = g.pop('timings_token', None)
+    if token is not None:
+        try:
+            stop_timings(token)
+        except ValueError:  # streamed responses finish in another context
+            pass
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Counters and histograms in the Prometheus text format (stages, LLM calls, fetch bytes, caches)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # @app.route('/api/chat/new', methods=['POST'])
 # def create_new_chat():
 #     """Create a new chat conversation for selected text"""
@@ -246,23 +652,8 @@ def create_new_chat():
         # Create new conversation
         conversation = conversation_manager.create_conversation(selected_text, current_url)
 
-        try:
-            
-            ctx = build_context_from_source(
-                selected_text=selected_text,
-                url_or_html=current_url,
-                top_k=5,
-                max_tokens=320
-            )
-            conversation.set_context(ctx)  # <-- store dict as-is
-        except Exception as e:
-            logger.warning(f"Context build failed; fallback to selection only: {e}")
-            conversation.set_context({
-                "title": "",
-                "context": f"Selection: {selected_text}",
-                "selected_indices": [],
-                "selected_chunks": []
-            })
+        # Build the page context in the background; only free-form questions wait for it
+        conversation.start_context_build()
 
         initial_message = conversation.generate_initial_message()
 
@@ -272,7 +663,8 @@ def create_new_chat():
             "selected_text": selected_text,
             "initial_message": initial_message,
             'current_url': current_url,
-            'created_at': conversation.created_at.isoformat()
+            'created_at': conversation.created_at.isoformat(),
+            'context_status': conversation.context_status()
             # optional debug fields pulled from the dict
             # "context_ready": bool(conversation.context.get("context")),
             # "context_title": conversation.context.get("title", ""),
@@ -290,6 +682,7 @@ def send_chat_message():
         data = request.get_json()
         conversation_id = data.get('conversation_id', '')
         user_question = data.get('userQuestion', '')
+        use_cache = data.get('useCache', True) is not False
         
         if not conversation_id or not user_question:
             return jsonify({'error': 'Missing conversation_id or userQuestion'}), 400
@@ -301,24 +694,83 @@ def send_chat_message():
             
         # Generate LLM response
         logger.info(f"Generating LLM response for question: {user_question}")
-        bot_response = conversation.generate_llm_response(user_question)
+        bot_response, cache_hit = conversation.generate_llm_response(user_question, use_cache=use_cache)
         logger.info(f"Generated bot response: {bot_response[:100]}...")
         
         # Add message to conversation
         conversation.add_message(user_question, bot_response)
+        g.context_timings = conversation.take_context_timings()
         
         return jsonify({
             'success': True,
             'conversation_id': conversation_id,
             'user_question': user_question,
             'bot_response': bot_response,
-            'message_count': len(conversation.chat_history)
+            'message_count': len(conversation.chat_history),
+            'cache_hit': cache_hit
         })
         
     except Exception as e:
         logger.error(f"Error sending chat message: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def _sse(payload, event=None):
+    """Format one Server-Sent Event"""
+    head = f"event: {event}\n" if event else ""
+    return f"{head}data: {json.dumps(payload)}\n\n"
+
+@app.route('/api/chat/message/stream', methods=['POST'])
+def stream_chat_message():
+    """Send a message and stream the reply back as Server-Sent Events"""
+    try:
+        data = request.get_json()
+        conversation_id = data.get('conversation_id', '')
+        user_question = data.get('userQuestion', '')
+        use_cache = data.get('useCache', True) is not False
+
+        if not conversation_id or not user_question:
+            return jsonify({'error': 'Missing conversation_id or userQuestion'}), 400
+
+        conversation = conversation_manager.get_conversation(conversation_id)
+        if not conversation:
+            return jsonify({'error': 'Conversation not found'}), 404
+
+        logger.info(f"Streaming LLM response for question: {user_question}")
+
+        def generate():
+            parts = []
+            recorded = False
+            cache_hit = False
+            try:
+                for delta, cache_hit in conversation.stream_llm_response(user_question, use_cache=use_cache):
+                    parts.append(delta)
+                    yield _sse({'delta': delta})
+                conversation.add_message(user_question, "".join(parts))
+                recorded = True
+                yield _sse({
+                    'success': True,
+                    'conversation_id': conversation_id,
+                    'bot_response': "".join(parts),
+                    'message_count': len(conversation.chat_history),
+                    'cache_hit': cache_hit,
+                    # headers are gone by now, so the stage breakdown rides on the final event
+                    'server_timing': server_timing(g.timings)
+                }, event='done')
+            finally:
+                # client went away mid-stream: keep whatever was generated
+                if not recorded:
+                    conversation.add_message(user_question, "".join(parts))
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    except Exception as e:
+        logger.error(f"Error streaming chat message: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # @app.route('/api/chat/history/<conversation_id>', methods=['GET'])
 # def get_chat_history(conversation_id):
 #     """Get chat history for a conversation"""
@@ -351,6 +803,100 @@ def delete_chat_conversation(conversation_id):
         logger.error(f"Error deleting conversation: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 503 until the embedding model has finished loading (or is known unavailable)"""
+    status = model_status()
+    return jsonify({'ready': status['ready'], 'models': status}), (200 if status['ready'] else 503)
+
+def warm_models_when_listening(host, port, timeout=60):
+    """Load textify's models on a background thread once the server socket accepts connections"""
+    def _wait_then_warm():
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection((host, port), timeout=1):
+                    break
+            except OSError:
+                time.sleep(0.1)
+        logger.info("Warming up embedding model...")
+        warm_up()
+        logger.info(f"Models ready: {model_status()}")
+
+    thread = threading.Thread(target=_wait_then_warm, name='model-warmup', daemon=True)
+    thread.start()
+    return thread
+
+@app.route('/api/conversations/metrics', methods=['GET'])
+def conversation_metrics():
+    """Conversation store metrics (live count, evictions, estimated memory)"""
+    return jsonify({'success': True, **conversation_manager.metrics()})
+
+@app.route('/api/cache/metrics', methods=['GET'])
+def cache_metrics():
+    """Response and semantic cache hit/miss counters, and calls coalesced with an identical one in flight"""
+    return jsonify({
+        'success': True,
+        'response_cache': response_cache.stats(),
+        'semantic_cache': semantic_cache.stats(),
+        'coalesced': singleflight_metrics()
+    })
+
+@app.route('/api/llm/metrics', methods=['GET'])
+def llm_metrics():
+    """Per-operation LLM call latency (p50/p95/max), retries, errors and deadline misses"""
+    return jsonify({'success': True, **chat_client.llm.metrics()})
+
+def transcription_response(job):
+    """200 with the text once done, 202 (poll Location) while pending, 502 if the provider failed"""
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown transcription job'}), 404
+    if job['status'] == 'done':
+        return jsonify({'success': True, **job}), 200
+    if job['status'] == 'error':
+        return jsonify({'success': False, **job}), 502
+    response = jsonify({'success': True, **job})
+    response.headers['Location'] = f"/api/voice/transcribe/{job['job_id']}"
+    return response, 202
+
+@app.route('/api/voice/transcribe', methods=['POST'])
+def transcribe_voice():
+    """Transcribe a recording sent as the raw body or as the multipart field 'audio' (?wait=seconds to block)"""
+    upload = request.files.get('audio')
+    stream = upload.stream if upload else request.stream
+    filename = (upload.filename if upload else request.args.get('filename')) or 'audio'
+    content_type = (upload.mimetype if upload else request.mimetype) or 'application/octet-stream'
+    try:
+        with span('upload'):
+            audio, digest, size = spool_upload(stream)
+    except UploadTooLarge as e:
+        return jsonify({'success': False, 'error': str(e)}), 413
+    if size == 0:
+        audio.close()
+        return jsonify({'success': False, 'error': 'No audio uploaded'}), 400
+
+    try:
+        job = transcription_jobs.submit(audio, digest, size, filename, content_type)
+    except TranscriptionBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '5'}
+    except TranscriptionUnavailable as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    wait = min(request.args.get('wait', 0, type=float), TRANSCRIBE_MAX_WAIT)
+    if wait > 0 and job['status'] in ('queued', 'running'):
+        with span('transcribe_wait'):
+            job = transcription_jobs.wait(job['job_id'], wait)
+    return transcription_response(job)
+
+@app.route('/api/voice/transcribe/<job_id>', methods=['GET'])
+def transcription_status(job_id):
+    """Poll a transcription job"""
+    return transcription_response(transcription_jobs.get(job_id))
+
+@app.route('/api/voice/metrics', methods=['GET'])
+def transcription_metrics():
+    """Transcription jobs by status, pool limits and cache hit/miss counters"""
+    return jsonify({'success': True, **transcription_jobs.metrics()})
+
 # @app.route('/api/conversations', methods=['GET'])
 # def list_active_conversations():
 #     """List all active conversations (for debugging)"""
@@ -0,0 +1,168 @@
+# ingest.py
+"""
+Bulk ingestion to pre-warm the page cache before users open the pages.
+
+    report = ingest_sources(["https://docs.example.com/intro",
+                             "saved/page.html=https://docs.example.com/page",
+                             "paper.pdf=https://example.com/paper.pdf"])
+
+Stages (timed separately in the report):
+- fetch : URLs and local files read concurrently on a bounded thread pool
+- parse : html_to_markdown + chunk_markdown on a process pool
+- embed : every chunk of every page encoded in large SentenceTransformer batches
+- store : artifacts written to the page cache / vector store
+
+Everything is cached under a URL, since the server only ever looks pages up by the URL the
+user is reading: a local file is given as "path=URL" (the saved copy of that URL), and a
+later build_context_from_source(url) hits. A bare path is rejected. PDFs cut short by
+TTTK_PDF_MAX_PAGES are stored as incomplete, as the server would store them.
+"""
+
+from __future__ import annotations
+import os, re, sys, time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__))) #don't delete this, this enables access to textify
+import textify
+from fetch import decode_html, fetch_url
+
+_LOCAL_SOURCE = re.compile(r"^(.+?)=(https?://.+)$")  # path=URL
+
+
+def _fetch(source: str) -> Dict:
+    """
+    Read one source (a URL or "path=URL") -> {"source", "key" (the URL), "kind": "html"|"pdf", "body",
+    "bytes", "etag", "last_modified"}. PDFs are extracted page by page here (body = page-marked
+    markdown, "complete" False if cut short) from a spooled temp file.
+    """
+    if source.startswith(("http://", "https://")):
+        response = fetch_url(source, spool=True)
+        doc = {"source": source, "key": source, "etag": response["etag"],
+               "last_modified": response["last_modified"]}
+        if response["file"] is not None:
+            with response["file"] as fp:
+                size = os.fstat(fp.fileno()).st_size
+                page = textify.pdf_page(fp, os.path.basename(source))
+            return {**doc, "kind": "pdf", "body": page["markdown"], "complete": page["complete"], "bytes": size}
+        return {**doc, "kind": "html", "body": response["text"], "bytes": len(response["body"])}
+
+    match = _LOCAL_SOURCE.match(source)
+    if match is None:
+        raise ValueError("local files need the URL they are a copy of: path=URL")
+    path, url = os.path.abspath(match.group(1)), match.group(2)
+    if path.lower().endswith(".pdf"):
+        with open(path, "rb") as fp:
+            page = textify.pdf_page(fp, os.path.basename(path))
+        return {"source": source, "key": url, "kind": "pdf", "body": page["markdown"],
+                "complete": page["complete"], "bytes": os.path.getsize(path)}
+    with open(path, "rb") as f:
+        raw = f.read()
+    # decoded as a fetch of its URL would be, so both produce the same chunks under that key
+    return {"source": source, "key": url, "kind": "html", "body": decode_html(raw), "bytes": len(raw)}
+
+
+def _parse(kind: str, body: str, source: str, max_tokens: int):
+    """Process-pool worker: markdown + chunks for one fetched document."""
+    if kind == "pdf":
+        page = {"title": os.path.basename(source), "markdown": body}
+    else:
+        page = textify.html_to_markdown(body)
+    return page, textify.chunk_markdown(page["markdown"], max_tokens=max_tokens)
+
+
+def _stage(seconds: float, items: int, **extra) -> Dict:
+    return {"seconds": round(seconds, 4), "items": items,
+            "items_per_sec": round(items / seconds, 2) if seconds > 0 else None, **extra}
+
+
+def ingest_sources(sources: List[str], max_tokens: int = 320, fetch_workers: int = 8,
+                   parse_workers: Optional[int] = None, batch_size: int = 256) -> Dict:
+    """
+    Fetch, parse, embed and cache every source. parse_workers=0 parses in-process.
+    Returns a report with per-stage throughput and any per-source failures.
+    """
+    started = time.perf_counter()
+    failed = []
+
+    # 1) fetch
+    t0 = time.perf_counter()
+    fetched = []
+    with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as pool:
+        futures = [(s, pool.submit(_fetch, s)) for s in sources]
+        for source, future in futures:
+            try:
+                fetched.append(future.result())
+            except Exception as e:
+                failed.append({"source": source, "stage": "fetch", "error": str(e)})
+    fetch_s = time.perf_counter() - t0
+    fetched_bytes = sum(d["bytes"] for d in fetched)
+
+    # 2) parse + chunk
+    t0 = time.perf_counter()
+    parsed = []
+    jobs = [(d["kind"], d["body"], d["source"], max_tokens) for d in fetched]
+    results = []
+    if parse_workers == 0 or len(jobs) <= 1:
+        for job in jobs:
+            try:
+                results.append(_parse(*job))
+            except Exception as e:
+                results.append(e)
+    else:
+        with ProcessPoolExecutor(max_workers=parse_workers) as pool:
+            futures = [pool.submit(_parse, *job) for job in jobs]
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+    for doc, result in zip(fetched, results):
+        if isinstance(result, Exception):
+            failed.append({"source": doc["source"], "stage": "parse", "error": str(result)})
+            continue
+        page, chunks = result
+        page["etag"] = doc.get("etag", "")
+        page["last_modified"] = doc.get("last_modified", "")
+        page["complete"] = doc.get("complete", True)  # truncated PDFs must not be served as whole
+        parsed.append((doc, page, chunks))
+    parse_s = time.perf_counter() - t0
+
+    # 3) embed every chunk of every page in large batches
+    t0 = time.perf_counter()
+    all_chunks = [c["text"] for _, _, chunks in parsed for c in chunks]
+    matrix = textify.embed_chunks(all_chunks, batch_size=batch_size)
+    embed_s = time.perf_counter() - t0
+
+    # 4) store
+    t0 = time.perf_counter()
+    row = 0
+    for doc, page, chunks in parsed:
+        vecs = matrix[row:row + len(chunks)] if matrix is not None else None
+        row += len(chunks)
+        try:
+            textify.store_page(doc["key"], page, chunks, embeddings=vecs, max_tokens=max_tokens)
+        except Exception as e:
+            failed.append({"source": doc["source"], "stage": "store", "error": str(e)})
+    store_s = time.perf_counter() - t0
+
+    return {
+        "sources": len(sources),
+        "pages": len(parsed) - sum(1 for f in failed if f["stage"] == "store"),
+        "chunks": len(all_chunks),
+        "failed": failed,
+        "stages": {
+            "fetch": _stage(fetch_s, len(fetched), bytes=fetched_bytes,
+                            mb_per_sec=round(fetched_bytes / fetch_s / 1e6, 3) if fetch_s > 0 else None),
+            "parse": _stage(parse_s, len(parsed)),
+            "embed": _stage(embed_s, len(all_chunks) if matrix is not None else 0),
+            "store": _stage(store_s, len(parsed)),
+        },
+        "total_seconds": round(time.perf_counter() - started, 4),
+    }
+
+
+def read_source_list(path: str) -> List[str]:
+    """One URL or path=URL per line; blank lines and # comments are skipped."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
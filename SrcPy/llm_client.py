@@ -0,0 +1,257 @@
+# llm_client.py
+"""
+Async OpenAI Responses client shared by every chat_api call.
+
+    llm = LLMClient(api_key)
+    text = llm.ask("definition", prompt)                  # sync facade, blocks the calling thread
+    for delta in llm.ask_stream("specific", prompt): ...
+    text = await llm.aask("summary", prompt)              # from a coroutine on llm.loop
+
+One AsyncOpenAI client on one pooled httpx connection pool runs on a private event
+loop thread, so Flask threads only wait on futures. Every call:
+- waits for a slot of a global semaphore (TTTK_LLM_CONCURRENCY) before going upstream
+- has a deadline covering queueing, retries and backoff (TTTK_LLM_DEADLINE, streams:
+  TTTK_LLM_STREAM_DEADLINE); past it the caller gets LLMDeadlineExceeded
+- retries timeouts, connection errors, 429 and 5xx up to TTTK_LLM_RETRIES times with
+  full-jitter exponential backoff (streams only until the first delta has been sent)
+- uses the model for its operation: TTTK_LLM_MODEL_<OPERATION>, else TTTK_LLM_MODEL
+ask() also coalesces: concurrent calls with the same operation, model and prompt (e.g. the
+same definition requested by many users at once) wait on one upstream call and share it.
+Latency, retries and failures per operation are in metrics(); latency and token usage also
+feed the tttk_llm_* metrics on /metrics, and the sync facade records an llm_<operation> span.
+"""
+
+from __future__ import annotations
+import asyncio, hashlib, json, logging, os, queue, random, threading, time
+from collections import defaultdict, deque
+from concurrent.futures import TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional
+
+import httpx
+from openai import (AsyncOpenAI, DefaultAsyncHttpxClient, APIConnectionError, APIStatusError,
+                    APITimeoutError, RateLimitError)
+
+from singleflight import SingleFlight
+from telemetry import LLM_SECONDS, LLM_TOKENS, span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("TTTK_LLM_MODEL", "gpt-4o-mini")
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The call (including queueing and retries) did not finish before its deadline."""
+
+
+def _retryable(error: BaseException) -> bool:
+    if isinstance(error, (APITimeoutError, APIConnectionError, RateLimitError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+class LLMClient:
+    """Pooled AsyncOpenAI client on a background event loop, with a sync facade."""
+
+    def __init__(self, api_key: str, concurrency: Optional[int] = None, deadline: Optional[float] = None,
+                 stream_deadline: Optional[float] = None, retries: Optional[int] = None,
+                 max_connections: Optional[int] = None):
+        self.concurrency = int(concurrency or os.getenv("TTTK_LLM_CONCURRENCY", 16))
+        self.deadline = float(deadline or os.getenv("TTTK_LLM_DEADLINE", 45))
+        self.stream_deadline = float(stream_deadline or os.getenv("TTTK_LLM_STREAM_DEADLINE", 120))
+        self.retries = int(retries if retries is not None else os.getenv("TTTK_LLM_RETRIES", 2))
+        self.backoff_base, self.backoff_cap = 0.5, 8.0
+        max_connections = int(max_connections or os.getenv("TTTK_LLM_MAX_CONNECTIONS", self.concurrency))
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="llm-loop", daemon=True)
+        self._thread.start()
+        # retries are ours (bounded by the deadline), so the SDK's own are off
+        self._client = AsyncOpenAI(
+            api_key=api_key, max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                timeout=httpx.Timeout(self.stream_deadline, connect=5.0),
+            ),
+        )
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._flight = SingleFlight("llm")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = defaultdict(
+            lambda: {"calls": 0, "errors": 0, "retries": 0, "deadline_exceeded": 0, "latency": deque(maxlen=512)})
+
+    # -- models ---------------------------------------------------------------
+
+    def model_for(self, operation: str) -> str:
+        return os.getenv(f"TTTK_LLM_MODEL_{operation.upper()}", DEFAULT_MODEL)
+
+    # -- async API --------------------------------------------------------------
+
+    async def aask(self, operation: str, prompt: str, deadline: Optional[float] = None) -> str:
+        """output_text of one Responses call, retried within the deadline."""
+        started, ok = time.monotonic(), False
+        ends = started + (deadline or self.deadline)
+        try:
+            async with self._slot(operation, ends):
+                for attempt in range(self.retries + 1):
+                    try:
+                        response = await self._within(operation, ends, self._client.responses.create(
+                            model=self.model_for(operation), input=prompt))
+                        ok = True
+                        self._count_tokens(operation, response)
+                        return response.output_text
+                    except Exception as e:
+                        await self._before_retry(operation, e, attempt, ends)
+        finally:
+            self._record(operation, started, ok)
+
+    async def aask_stream(self, operation: str, prompt: str, deadline: Optional[float] = None) -> AsyncIterator[str]:
+        """Text deltas of a streamed Responses call; retried only until the first delta."""
+        started, ok = time.monotonic(), False
+        ends = started + (deadline or self.stream_deadline)
+        try:
+            async with self._slot(operation, ends):
+                for attempt in range(self.retries + 1):
+                    sent = False
+                    try:
+                        stream = await self._within(operation, ends, self._client.responses.create(
+                            model=self.model_for(operation), input=prompt, stream=True))
+                        async with stream:
+                            events = stream.__aiter__()
+                            while True:
+                                try:
+                                    event = await self._within(operation, ends, events.__anext__())
+                                except StopAsyncIteration:
+                                    ok = True
+                                    return
+                                if event.type == "response.output_text.delta":
+                                    sent = True
+                                    yield event.delta
+                                elif event.type == "response.completed":
+                                    self._count_tokens(operation, event.response)
+                    except Exception as e:
+                        if sent:
+                            raise
+                        await self._before_retry(operation, e, attempt, ends)
+        finally:
+            self._record(operation, started, ok)
+
+    # -- sync facade --------------------------------------------------------------
+
+    def ask(self, operation: str, prompt: str, deadline: Optional[float] = None) -> str:
+        """Like aask; identical concurrent calls (operation, model, prompt) share one upstream call."""
+        request = json.dumps([operation, self.model_for(operation), prompt])
+        fingerprint = hashlib.sha256(request.encode("utf-8")).hexdigest()
+        with span(f"llm_{operation}"):
+            return self._flight.do(fingerprint, lambda: self._ask(operation, prompt, deadline))
+
+    def _ask(self, operation: str, prompt: str, deadline: Optional[float]) -> str:
+        future = asyncio.run_coroutine_threadsafe(self.aask(operation, prompt, deadline), self.loop)
+        try:
+            # the coroutine enforces the deadline; the margin only covers loop scheduling
+            return future.result((deadline or self.deadline) + 5)
+        except LLMDeadlineExceeded:
+            raise
+        except FutureTimeout:  # not the builtin TimeoutError before Python 3.11
+            future.cancel()
+            raise LLMDeadlineExceeded(f"{operation}: no answer within {deadline or self.deadline:.0f}s")
+
+    def ask_stream(self, operation: str, prompt: str, deadline: Optional[float] = None) -> Iterator[str]:
+        deltas: "queue.Queue[tuple]" = queue.Queue()
+
+        async def pump():
+            try:
+                async for delta in self.aask_stream(operation, prompt, deadline):
+                    deltas.put(("delta", delta))
+                deltas.put(("end", None))
+            except Exception as e:
+                deltas.put(("error", e))
+
+        future = asyncio.run_coroutine_threadsafe(pump(), self.loop)
+        try:
+            with span(f"llm_{operation}"):
+                while True:
+                    kind, value = deltas.get()
+                    if kind == "delta":
+                        yield value
+                    elif kind == "error":
+                        raise value
+                    else:
+                        return
+        finally:
+            future.cancel()  # the consumer stopped early (e.g. the SSE client went away)
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._client.close(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    # -- internals ------------------------------------------------------------------
+
+    async def _within(self, operation: str, ends: float, awaitable):
+        """Await `awaitable`, raising LLMDeadlineExceeded if `ends` passes first."""
+        remaining = ends - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            return await asyncio.wait_for(awaitable, remaining)
+        except asyncio.TimeoutError:
+            if hasattr(awaitable, "close"):
+                awaitable.close()  # never scheduled: don't leave an un-awaited coroutine behind
+            self._count(operation, "deadline_exceeded")
+            raise LLMDeadlineExceeded(f"{operation}: deadline passed") from None
+
+    @asynccontextmanager
+    async def _slot(self, operation: str, ends: float):
+        await self._within(operation, ends, self._slots.acquire())
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    async def _before_retry(self, operation: str, error: Exception, attempt: int, ends: float) -> None:
+        """Re-raise unless `error` is retryable and a jittered backoff still fits before the deadline."""
+        if not _retryable(error) or attempt >= self.retries:
+            raise error
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if time.monotonic() + delay >= ends:
+            raise error
+        self._count(operation, "retries")
+        logger.info(f"LLM {operation} attempt {attempt + 1} failed ({type(error).__name__}); retrying in {delay:.2f}s")
+        await asyncio.sleep(delay)
+
+    def _count(self, operation: str, key: str) -> None:
+        with self._lock:
+            self._stats[operation][key] += 1
+
+    def _record(self, operation: str, started: float, ok: bool = True) -> None:
+        elapsed = time.monotonic() - started
+        LLM_SECONDS.observe(elapsed, operation=operation, outcome="ok" if ok else "error")
+        with self._lock:
+            stats = self._stats[operation]
+            if ok:
+                stats["calls"] += 1
+                stats["latency"].append(elapsed)
+            else:
+                stats["errors"] += 1
+
+    @staticmethod
+    def _count_tokens(operation: str, response) -> None:
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            LLM_TOKENS.inc(getattr(usage, "input_tokens", 0) or 0, operation=operation, direction="input")
+            LLM_TOKENS.inc(getattr(usage, "output_tokens", 0) or 0, operation=operation, direction="output")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per operation: calls, errors, retries, deadline_exceeded, model and p50/p95/max latency (s)."""
+        out = {}
+        with self._lock:
+            for operation, stats in self._stats.items():
+                latency = sorted(stats["latency"])
+                row = {k: v for k, v in stats.items() if k != "latency"}
+                row["model"] = self.model_for(operation)
+                if latency:
+                    row.update(p50=round(latency[len(latency) // 2], 3),
+                               p95=round(latency[min(len(latency) - 1, int(len(latency) * 0.95))], 3),
+                               max=round(latency[-1], 3))
+                out[operation] = row
+        return {"concurrency": self.concurrency, "coalesced": self._flight.metrics(), "operations": out}
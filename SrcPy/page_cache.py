@@ -0,0 +1,303 @@
+# page_cache.py
+"""
+On-disk cache of processed pages for build_context_from_source.
+
+Each entry keeps the cleaned markdown, the chunk_markdown chunks (texts plus their
+offsets, headings and pages) and their embedding matrix, so a second selection on the same page only pays for one
+query embedding and a top-k search.
+
+- Entries are keyed by normalized URL (or content hash for raw HTML) and chunk size.
+- ETag / Last-Modified are stored for revalidation, plus a hash of the markdown so
+  an unchanged page can reuse its chunks and embeddings after a refetch.
+- Entries older than `ttl_seconds` are stale; the least recently used entries are
+  evicted once the cache grows past `max_bytes`.
+- index.json is shared by every worker: each change reloads it under a file lock, applies
+  itself and writes it back, so entries written by other workers are counted and evicted
+  too. Access times from get() are merged in on the next write.
+"""
+
+from __future__ import annotations
+import hashlib, json, os, threading, time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import numpy as np
+
+from vector_store import FileLock, file_stamp
+
+_DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tttk", "pages")
+_TRACKING_PREFIXES = ("utm_",)
+_TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref"}
+_INDEX_FLUSH_SECONDS = 30.0
+_ORPHAN_SECONDS = 300.0  # files this old with no index entry were left by a crashed writer
+
+
+def normalize_url(url: str) -> str:
+    """Lowercase scheme/host, drop fragments, default ports and tracking params."""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if k not in _TRACKING_PARAMS and not k.startswith(_TRACKING_PREFIXES)
+    ]
+    path = parts.path or "/"
+    return urlunsplit((scheme, host, path, urlencode(sorted(query)), ""))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8", "ignore")).hexdigest()
+
+
+def is_url(url_or_html: str) -> bool:
+    return url_or_html.startswith(("http://", "https://"))
+
+
+class PageCache:
+    """Persistent page-artifact cache with TTL freshness and LRU-by-bytes eviction."""
+
+    def __init__(self, root: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        self.root = root or os.getenv("TTTK_PAGE_CACHE_DIR", _DEFAULT_DIR)
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None
+                                 else os.getenv("TTTK_PAGE_CACHE_TTL", 3600))
+        self.max_bytes = int(max_bytes if max_bytes is not None
+                             else os.getenv("TTTK_PAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(self.root, ".lock"))
+        self._index_path = os.path.join(self.root, "index.json")
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._index_stamp: Optional[tuple] = None  # (inode, mtime_ns, size) of the index.json we loaded
+        self._bytes = 0  # sum of the entries' "bytes", kept as they change
+        self._accessed: Dict[str, float] = {}  # last_access times not yet written to index.json
+        self._last_flush = 0.0
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            self._drop_orphans_locked()
+
+    # ---- keys -------------------------------------------------------------
+
+    @staticmethod
+    def key_for(url_or_html: str, max_tokens: int, chunker: str = "") -> str:
+        """
+        Cache key for a source: normalized URL for links, content hash for raw HTML.
+        `chunker` names the chunking settings, so changing them doesn't serve old chunks.
+        """
+        source = ("url:" + normalize_url(url_or_html)) if is_url(url_or_html) \
+            else ("html:" + content_hash(url_or_html))
+        return content_hash(f"{source}|{max_tokens}|{chunker}" if chunker else f"{source}|{max_tokens}")[:32]
+
+    # ---- lookup -----------------------------------------------------------
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored entry (fresh or stale) or None.
+        {"title", "markdown", "chunks", "spans", "embeddings", "meta", "fresh"}
+        """
+        with self._lock:
+            self._reload_locked()  # index.json is replaced atomically, so reading needs no file lock
+            meta = self._index.get(key)
+            if meta is None:
+                return None
+            meta["last_access"] = self._accessed[key] = time.time()
+            meta = dict(meta)
+        try:
+            with open(self._path(key, ".json"), "r", encoding="utf-8") as f:
+                page = json.load(f)
+            emb_path = self._path(key, ".npy")
+            embeddings = np.load(emb_path) if os.path.exists(emb_path) else None
+        except (OSError, ValueError):
+            self._drop(key)
+            return None
+        self._maybe_flush()
+        return {
+            "title": page.get("title", ""),
+            "markdown": page.get("markdown", ""),
+            "chunks": page.get("chunks", []),
+            "spans": page.get("spans", []),
+            "embeddings": embeddings,
+            "meta": meta,
+            "fresh": self.is_fresh(meta),
+        }
+
+    def is_fresh(self, meta: Dict[str, Any]) -> bool:
+        return (time.time() - meta.get("validated_at", 0.0)) < self.ttl_seconds
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as revalidated (e.g. after a 304 Not Modified)."""
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            meta = self._index.get(key)
+            if meta is None:
+                return
+            meta["validated_at"] = meta["last_access"] = time.time()
+            self._flush_locked()
+
+    # ---- store ------------------------------------------------------------
+
+    def put(self, key: str, *, source: str, title: str, markdown: str, chunks: List[str],
+            spans: Optional[List[Dict[str, Any]]] = None, embeddings: Optional[np.ndarray] = None,
+            model: str = "", etag: str = "", last_modified: str = "", complete: bool = True) -> None:
+        """
+        Write page artifacts atomically and evict if over budget. spans[i] describes chunks[i]
+        (character offsets, headings, page); complete=False marks a partial PDF.
+        """
+        page_bytes = json.dumps({"title": title, "markdown": markdown, "chunks": chunks, "spans": spans or []},
+                                ensure_ascii=False).encode("utf-8")
+        emb_tmp = self._save_tmp(key, embeddings) if embeddings is not None else None
+        now = time.time()
+        meta = {
+            "source": normalize_url(source) if is_url(source) else "",
+            "etag": etag or "",
+            "last_modified": last_modified or "",
+            "content_hash": content_hash(markdown),
+            "model": model,
+            "complete": complete,
+            "bytes": len(page_bytes) + (os.path.getsize(emb_tmp) if emb_tmp else 0),
+            "validated_at": now,
+            "last_access": now,
+        }
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            self._atomic_write(self._path(key, ".json"), page_bytes)
+            emb_path = self._path(key, ".npy")
+            if emb_tmp:
+                os.replace(emb_tmp, emb_path)
+            elif os.path.exists(emb_path):
+                os.remove(emb_path)
+            self._set_locked(key, meta)
+            self._evict_locked()
+            self._flush_locked()
+
+    def put_embeddings(self, key: str, embeddings: np.ndarray) -> None:
+        """Add chunk embeddings to an existing entry (pages are stored before they are embedded)."""
+        tmp = self._save_tmp(key, embeddings)
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            meta = self._index.get(key)
+            if meta is None:
+                os.remove(tmp)
+                return
+            emb_path = self._path(key, ".npy")
+            os.replace(tmp, emb_path)
+            self._set_locked(key, {**meta, "bytes": os.path.getsize(self._path(key, ".json"))
+                                   + os.path.getsize(emb_path)})
+            self._evict_locked()
+            self._flush_locked()
+
+    def clear(self) -> None:
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            for key in list(self._index):
+                self._remove_files(key)
+            self._index.clear()
+            self._accessed.clear()
+            self._bytes = 0
+            self._flush_locked()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._reload_locked()
+            return {
+                "entries": len(self._index),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    # ---- internals --------------------------------------------------------
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key + ext)
+
+    def _save_tmp(self, key: str, embeddings: np.ndarray) -> str:
+        """Save embeddings under a name unique to this process and thread; returns its path."""
+        tmp = f"{self._path(key, '.npy')}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp, np.ascontiguousarray(embeddings, dtype=np.float32))
+        return tmp
+
+    def _set_locked(self, key: str, meta: Dict[str, Any]) -> None:
+        old = self._index.get(key)
+        self._bytes += meta.get("bytes", 0) - (old.get("bytes", 0) if old else 0)
+        self._index[key] = meta
+
+    def _evict_locked(self) -> None:
+        if self._bytes <= self.max_bytes:
+            return
+        for key, meta in sorted(self._index.items(), key=lambda kv: kv[1].get("last_access", 0.0)):
+            if self._bytes <= self.max_bytes:
+                break
+            self._bytes -= meta.get("bytes", 0)
+            self._remove_files(key)
+            del self._index[key]
+            self._accessed.pop(key, None)
+
+    def _drop(self, key: str) -> None:
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            meta = self._index.pop(key, None)
+            if meta is not None:
+                self._bytes -= meta.get("bytes", 0)
+            self._accessed.pop(key, None)
+            self._remove_files(key)
+            self._flush_locked()
+
+    def _remove_files(self, key: str) -> None:
+        for ext in (".json", ".npy"):
+            try:
+                os.remove(self._path(key, ext))
+            except FileNotFoundError:
+                pass
+
+    def _reload_locked(self) -> None:
+        """Re-read index.json if another worker has written it since (thread lock held)."""
+        stamp = file_stamp(self._index_path)
+        if stamp is None or stamp == self._index_stamp:
+            return
+        try:
+            with open(self._index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, ts in self._accessed.items():
+            if key in index:
+                index[key]["last_access"] = max(index[key].get("last_access", 0.0), ts)
+        self._index, self._index_stamp = index, stamp
+        self._bytes = sum(m.get("bytes", 0) for m in index.values())
+
+    def _drop_orphans_locked(self) -> None:
+        """Remove page files no index entry points at (both locks held), e.g. from a crashed writer."""
+        cutoff = time.time() - _ORPHAN_SECONDS
+        for name in os.listdir(self.root):
+            if name == "index.json" or name.startswith(".") or name.partition(".")[0] in self._index:
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _maybe_flush(self) -> None:
+        if time.time() - self._last_flush < _INDEX_FLUSH_SECONDS:
+            return
+        with self._lock, self._file_lock:
+            self._reload_locked()
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        """Write the index (both locks held, just after _reload_locked)."""
+        self._atomic_write(self._index_path, json.dumps(self._index).encode("utf-8"))
+        self._index_stamp = file_stamp(self._index_path)
+        self._accessed.clear()
+        self._last_flush = time.time()
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
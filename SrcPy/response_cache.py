@@ -0,0 +1,120 @@
+# response_cache.py
+"""
+Content-addressed cache for selection-only LLM answers (definition / curriculum / topic / mood).
+
+Keys are sha256(operation, model, normalized text, prompt version), so changing the
+model or bumping a prompt version naturally misses. Values live in an in-process LRU
+and, when `db_path` is set, in an on-disk SQLite tier shared across restarts/workers.
+"""
+
+from __future__ import annotations
+import hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+_MISS = object()
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace and case so trivially different selections share an entry."""
+    return " ".join(text.split()).casefold()
+
+
+class ResponseCache:
+    """In-process LRU + optional SQLite tier with TTL and hit/miss counters."""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None,
+                 db_path: Optional[str] = None):
+        self.max_entries = int(max_entries or os.getenv("TTTK_RESPONSE_CACHE_ENTRIES", 10_000))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("TTTK_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+        self.db_path = db_path if db_path is not None else os.getenv("TTTK_RESPONSE_CACHE_DB", "")
+        self._lru: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0}
+        if self.db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._db().execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, stored_at REAL, value TEXT)"
+            )
+
+    @staticmethod
+    def key(operation: str, model: str, text: str, prompt_version: Any) -> str:
+        raw = json.dumps([operation, model, normalize_text(text), prompt_version])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """Return the cached value or the module-level _MISS sentinel."""
+        now = time.time()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl_seconds:
+                    self._lru.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._lru[key]
+        if self.db_path:
+            row = self._db().execute("SELECT stored_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and now - row[0] < self.ttl_seconds:
+                value = json.loads(row[1])
+                self._remember(key, row[0], value)
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                return value
+        with self._lock:
+            self._stats["misses"] += 1
+        return _MISS
+
+    def put(self, key: str, value: Any) -> None:
+        now = time.time()
+        self._remember(key, now, value)
+        if self.db_path:
+            db = self._db()
+            with db:
+                db.execute("INSERT OR REPLACE INTO responses (key, stored_at, value) VALUES (?, ?, ?)",
+                           (key, now, json.dumps(value)))
+
+    def get_or_compute(self, operation: str, model: str, text: str, prompt_version: Any,
+                       compute: Callable[[], Any]) -> Any:
+        """Serve (operation, model, text, prompt_version) from cache, computing and storing on a miss."""
+        key = self.key(operation, model, text, prompt_version)
+        value = self.get(key)
+        if value is _MISS:
+            value = compute()
+            if value:  # never cache empty/failed answers
+                self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+        if self.db_path:
+            db = self._db()
+            with db:
+                db.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "entries": len(self._lru),
+                "hit_rate": (lookups - self._stats["misses"]) / lookups if lookups else 0.0,
+                "disk_tier": bool(self.db_path),
+            }
+
+    def _remember(self, key: str, stored_at: float, value: Any) -> None:
+        with self._lock:
+            self._lru[key] = (stored_at, value)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _db(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
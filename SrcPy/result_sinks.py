@@ -0,0 +1,119 @@
+# result_sinks.py
+"""
+Optional persistence for chat_api results, written off the request path.
+
+chat_api returns every answer directly; when sinks are configured it also hands each
+result to a SinkWriter, whose thread delivers it to the sinks. The request never
+waits on disk, and a full queue drops records (counted) instead of blocking.
+
+    TTTK_CHAT_SINKS="dir:/var/lib/tttk/answers,jsonl:/var/log/tttk/answers.jsonl"
+
+- dir:<path>   : one file per result (<operation>-<time>-<id>.md), so writers never collide
+- jsonl:<path> : one JSON line per result, appended by the single writer thread
+"""
+
+from __future__ import annotations
+import json, logging, os, queue, threading, time, uuid
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResultSink:
+    """write(record) persists one record: {"operation", "text", "time", "id", **meta}."""
+
+    def write(self, record: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class DirectorySink(ResultSink):
+    """Each result as its own markdown file."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(record["time"]))
+        path = os.path.join(self.directory, f"{record['operation']}-{stamp}-{record['id'][:8]}.md")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(record["text"])
+
+
+class JsonlSink(ResultSink):
+    """All results appended to one JSON-lines file (only the writer thread touches it)."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class SinkWriter:
+    """Bounded queue + one daemon thread fanning records out to the sinks."""
+
+    def __init__(self, sinks: List[ResultSink], max_pending: int = 1024):
+        self.sinks = sinks
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=max_pending)
+        self._stats = {"written": 0, "dropped": 0, "failed": 0}
+        self._lock = threading.Lock()  # "dropped" is counted by the submitting threads
+        self._thread = threading.Thread(target=self._run, name="result-sinks", daemon=True)
+        self._thread.start()
+
+    def submit(self, operation: str, text: str, **meta) -> None:
+        record = {"operation": operation, "text": text, "time": time.time(), "id": uuid.uuid4().hex, **meta}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+
+    def _run(self) -> None:
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            for sink in self.sinks:
+                try:
+                    sink.write(record)
+                    self._stats["written"] += 1
+                except Exception as e:
+                    self._stats["failed"] += 1
+                    logger.warning(f"{type(sink).__name__} failed to write {record['operation']}: {e}")
+        for sink in self.sinks:
+            sink.close()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Deliver what is queued, then stop the thread."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {**self._stats, "pending": self._queue.qsize(), "sinks": [type(s).__name__ for s in self.sinks]}
+
+
+def create_sinks(spec: Optional[str] = None) -> List[ResultSink]:
+    """Sinks from a comma-separated "kind:path" list (default: TTTK_CHAT_SINKS, none when unset)."""
+    spec = os.getenv("TTTK_CHAT_SINKS", "") if spec is None else spec
+    sinks: List[ResultSink] = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, path = item.partition(":")
+        if kind == "dir" and path:
+            sinks.append(DirectorySink(path))
+        elif kind == "jsonl" and path:
+            sinks.append(JsonlSink(path))
+        else:
+            raise ValueError(f"Unknown result sink '{item}' (expected dir:<path> or jsonl:<path>)")
+    return sinks
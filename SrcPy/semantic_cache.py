@@ -0,0 +1,110 @@
+# semantic_cache.py
+"""
+Near-duplicate cache for free-form (askSpecific) questions.
+
+Questions are embedded with the same model textify uses for chunks and compared by
+cosine similarity against earlier questions asked over the *same* context (scope =
+hash of the context text). A stored answer is reused when similarity >= threshold.
+"""
+
+from __future__ import annotations
+import hashlib, os, threading, time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class SemanticCache:
+    """Per-scope question embeddings + answers, LRU over scopes, TTL per entry."""
+
+    def __init__(self, embed: Callable[[List[str]], Optional[np.ndarray]],
+                 threshold: Optional[float] = None, max_scopes: Optional[int] = None,
+                 max_per_scope: int = 64, ttl_seconds: Optional[float] = None,
+                 enabled: Optional[bool] = None):
+        self.embed = embed
+        self.threshold = float(threshold if threshold is not None
+                               else os.getenv("TTTK_SEMANTIC_CACHE_THRESHOLD", 0.92))
+        self.max_scopes = int(max_scopes or os.getenv("TTTK_SEMANTIC_CACHE_SCOPES", 2048))
+        self.max_per_scope = max_per_scope
+        self.ttl_seconds = float(ttl_seconds or os.getenv("TTTK_SEMANTIC_CACHE_TTL", 24 * 3600))
+        self.enabled = enabled if enabled is not None else os.getenv("TTTK_SEMANTIC_CACHE", "1") != "0"
+        # scope -> {"vecs": float32 matrix (rows L2-normalized), "answers": [...], "times": [...]}
+        self._scopes: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0}
+
+    @staticmethod
+    def scope_key(context_text: str) -> str:
+        return hashlib.sha256(context_text.encode("utf-8", "ignore")).hexdigest()
+
+    def lookup(self, scope: str, question: str) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Return (answer, question_vec). answer is None on a miss; pass question_vec to
+        store() afterwards so the question is embedded only once. question_vec is None
+        when the lookup was bypassed (cache disabled or no embedder).
+        """
+        if not self.enabled:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return None, None
+        vec = self._embed(question)
+        if vec is None:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return None, None
+        now = time.time()
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is not None:
+                self._scopes.move_to_end(scope)
+                sims = entry["vecs"] @ vec
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold and now - entry["times"][best] < self.ttl_seconds:
+                    self._stats["hits"] += 1
+                    return entry["answers"][best], vec
+            self._stats["misses"] += 1
+        return None, vec
+
+    def store(self, scope: str, question: str, answer: str, vec: Optional[np.ndarray] = None) -> None:
+        if not self.enabled or not answer:
+            return
+        if vec is None:
+            vec = self._embed(question)
+            if vec is None:
+                return
+        now = time.time()
+        with self._lock:
+            entry = self._scopes.get(scope)
+            if entry is None:
+                entry = {"vecs": vec[np.newaxis, :], "answers": [answer], "times": [now]}
+                self._scopes[scope] = entry
+            else:
+                entry["vecs"] = np.vstack([entry["vecs"], vec])[-self.max_per_scope:]
+                entry["answers"] = (entry["answers"] + [answer])[-self.max_per_scope:]
+                entry["times"] = (entry["times"] + [now])[-self.max_per_scope:]
+            self._scopes.move_to_end(scope)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "scopes": len(self._scopes),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        vecs = self.embed([text])
+        if vecs is None:
+            return None
+        v = np.asarray(vecs[0], dtype=np.float32)
+        return v / (np.linalg.norm(v) + 1e-9)
@@ -0,0 +1,64 @@
+# singleflight.py
+"""
+Coalescing of concurrent identical calls.
+
+    pages = SingleFlight("page")
+    page = pages.do(key, lambda: load_page(url))   # callers with the same key share one load_page
+
+The first caller for a key runs fn(); callers arriving while it is in flight block and get
+the same result (or the same exception). Nothing is cached: once the call returns, the
+next caller for the key runs fn() again. Counts per group are in metrics() and in
+tttk_singleflight_calls_total{flight, result="executed"|"coalesced"} on /metrics.
+"""
+
+from __future__ import annotations
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from telemetry import SINGLEFLIGHT_CALLS
+
+_groups: List["SingleFlight"] = []
+
+
+class SingleFlight:
+    """Per-key in-flight call table; results are shared, never kept."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._stats = {"executed": 0, "coalesced": 0}
+        _groups.append(self)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """fn()'s result, or that of the call already in flight for `key` (waiting up to `timeout`)."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._stats["executed" if leader else "coalesced"] += 1
+        SINGLEFLIGHT_CALLS.inc(flight=self.name, result="executed" if leader else "coalesced")
+        if not leader:
+            return future.result(timeout)
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "in_flight": len(self._calls)}
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """metrics() of every SingleFlight group, by name."""
+    return {group.name: group.metrics() for group in _groups}
@@ -0,0 +1,176 @@
+# telemetry.py
+"""
+In-process counters / histograms, rendered in the Prometheus text format, and per-request
+stage spans for the Server-Timing header.
+
+    with span("fetch"):                      # observes tttk_stage_seconds{stage="fetch"}
+        ...
+    with collect_timings() as timings:       # spans in this context are also appended here
+        ...                                  # -> server_timing(timings) = "fetch;dur=12.3, ..."
+
+Spans are recorded per context (contextvars), so concurrent requests and background
+jobs each see only their own. No dependency on prometheus_client; render() is what
+GET /metrics serves.
+"""
+
+from __future__ import annotations
+import threading, time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: Sequence[str], values: Tuple[str, ...], le: Optional[str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_label_str(self.labels, key)} {value:g}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [count per bucket..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labels)
+        with self._lock:
+            row = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += 1
+            row[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, row in items:
+            for bound, count in zip(self.buckets, row):
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, key, f'{bound:g}')} {count:g}")
+            lines.append(f"{self.name}_bucket{_label_str(self.labels, key, '+Inf')} {row[-2]:g}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, key)} {row[-2]:g}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {row[-1]:.6f}")
+        return lines
+
+
+_metrics: Dict[str, object] = {}
+_metrics_lock = threading.Lock()
+
+
+def _register(metric):
+    with _metrics_lock:
+        return _metrics.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    with _metrics_lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# -- shared metrics -----------------------------------------------------------------
+
+STAGE_SECONDS = histogram("tttk_stage_seconds", "Duration of pipeline stages (fetch, extract, chunk, embed, ...)", ["stage"])
+REQUEST_SECONDS = histogram("tttk_http_request_seconds", "HTTP request handling time", ["route", "method", "status"])
+LLM_SECONDS = histogram("tttk_llm_call_seconds", "LLM call latency including queueing and retries",
+                        ["operation", "outcome"], buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120))
+LLM_TOKENS = counter("tttk_llm_tokens_total", "Tokens sent to / received from the LLM", ["operation", "direction"])
+FETCH_BYTES = counter("tttk_fetch_bytes_total", "Response body bytes fetched", ["kind"])
+PAGE_CHUNKS = histogram("tttk_page_chunks", "Chunks per processed page", buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000))
+CACHE_EVENTS = counter("tttk_cache_events_total", "Cache lookups by cache and result", ["cache", "result"])
+SINGLEFLIGHT_CALLS = counter("tttk_singleflight_calls_total", "Calls that ran vs. joined an identical call in flight",
+                             ["flight", "result"])
+
+
+# -- spans -----------------------------------------------------------------------------
+
+_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("tttk_timings", default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block: observed in tttk_stage_seconds and appended to the current timings, if any."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def start_timings():
+    """Start collecting this context's spans: returns (timings list, token for stop_timings)."""
+    timings: List[Tuple[str, float]] = []
+    return timings, _timings.set(timings)
+
+
+def stop_timings(token) -> None:
+    _timings.reset(token)
+
+
+@contextmanager
+def collect_timings():
+    """Collect the (stage, seconds) spans recorded in this context until the block ends."""
+    timings, token = start_timings()
+    try:
+        yield timings
+    finally:
+        stop_timings(token)
+
+
+def server_timing(timings: List[Tuple[str, float]], prefix: str = "") -> str:
+    """Server-Timing header value; repeated stages are summed, in first-seen order."""
+    totals: Dict[str, float] = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{prefix}{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
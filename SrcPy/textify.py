@@ -1,148 +1,403 @@
 # textify.py
 """
 Tiny helpers:
-- html_to_markdown(url_or_file) -> {"title": str, "markdown": str}
+- html_to_markdown(url_or_file) -> {"title": str, "markdown": str, "etag": str, "last_modified": str}
 - split_markdown(markdown, max_tokens=350) -> [chunk1, chunk2, ...]
+- chunk_markdown(markdown, max_tokens=350) -> the same chunks with their offsets, headings and pages
+- load_page(url_or_html, max_tokens) -> markdown, chunks, their spans and chunk embeddings
+  (served from the page cache)
 
 If tiktoken is installed, max_tokens is accurate; otherwise we approximate by chars (~4 chars/token).
+The tokenizer, embedding model and faiss are loaded lazily (or by warm_up()), so importing
+this module is cheap; model_status() reports where loading stands.
 """
 
 from __future__ import annotations
-import re, requests, os
-from typing import Dict, List
-from bs4 import BeautifulSoup
+import bisect, hashlib, re, os, threading, time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from lxml import etree
+from lxml.etree import tounicode
 from readability import Document
+from readability.cleaners import clean_attributes
+from readability.htmls import build_doc, shorten_title
 import html2text
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
+from bm25 import BM25Index, rrf, tokenize as bm25_tokenize
+from singleflight import SingleFlight
+from telemetry import CACHE_EVENTS, PAGE_CHUNKS, span
 
-try:
-    import tiktoken
-    _enc = tiktoken.get_encoding("cl100k_base")
-    def _tok_len(s: str) -> int: return len(_enc.encode(s))
-    _TOK = True
-except Exception:
-    def _tok_len(s: str) -> int: return max(1, len(s) // 4)
-    _TOK = False
-
-import requests
-
-def is_pdf_url(url: str) -> bool:
-    """Check if the URL points to a PDF by extension or content-type."""
-    # Quick check by extension or known pattern
-    if url.lower().endswith('.pdf') or 'arxiv.org/pdf/' in url.lower():
-        return True
-    
+_enc = None
+_TOK = None  # None until the tokenizer load has been attempted
+
+def _load_tokenizer() -> None:
+    global _enc, _TOK
     try:
-        # Send a HEAD request to check headers without downloading full content
-        response = requests.head(url, allow_redirects=True, timeout=5)
-        content_type = response.headers.get("Content-Type", "").lower()
-        return "application/pdf" in content_type
-    except requests.RequestException:
-        return False
-
-
-def extract_text_from_pdf(url: str) -> str:
-    """Extract text from PDF using pdfminer.six."""
-    from io import BytesIO
-    from pdfminer.high_level import extract_text
-    
-    response = requests.get(url)
-    response.raise_for_status()
-    pdf_file = BytesIO(response.content)
-    return extract_text(pdf_file)
+        import tiktoken
+        _enc = tiktoken.get_encoding("cl100k_base")
+        _TOK = True
+    except Exception:
+        _TOK = False
 
-def html_to_markdown(url_or_html: str) -> Dict[str, str]:
-    """Fetch/clean content from URL or HTML, convert to Markdown."""
-    # Handle PDF URLs
-    if (url_or_html.startswith(("http://", "https://")) and 
-        is_pdf_url(url_or_html)):
+def _tok_len(s: str) -> int:
+    if _TOK is None:
+        _load_tokenizer()
+    return len(_enc.encode(s)) if _TOK else max(1, len(s) // 4)
+
+def count_tokens(text: str) -> int:
+    """Token length as the context budgets count it (cl100k, else chars/4)."""
+    return _tok_len(text) if text else 0
+
+from fetch import fetch_url
+
+# PDF pages are marked in the markdown so chunks keep their page numbers
+_PAGE_MARK = re.compile(r"(?m)^<!-- page (\d+) -->$")
+PDF_MAX_PAGES = int(os.getenv("TTTK_PDF_MAX_PAGES", 0))  # 0 = no page budget
+PDF_EARLY_STOP = os.getenv("TTTK_PDF_EARLY_STOP", "1") != "0"
+PDF_NEIGHBOR_PAGES = int(os.getenv("TTTK_PDF_NEIGHBOR_PAGES", 2))
+
+
+def iter_pdf_pages(fp):
+    """
+    Yield (page_number, page_count, text) one page at a time from a seekable binary PDF file.
+    pdfminer parses objects from the file on demand, so memory follows the page, not the document.
+    page_count is None when the page tree doesn't declare it.
+    """
+    from io import StringIO
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    doc = PDFDocument(PDFParser(fp))
+    try:
+        page_count = int(resolve1(resolve1(doc.catalog["Pages"])["Count"]))
+    except Exception:
+        page_count = None
+    rsrcmgr = PDFResourceManager(caching=True)
+    out = StringIO()
+    device = TextConverter(rsrcmgr, out, laparams=LAParams())
+    try:
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for number, page in enumerate(PDFPage.create_pages(doc), 1):
+            interpreter.process_page(page)
+            text = out.getvalue()
+            out.seek(0)
+            out.truncate()
+            yield number, page_count, text
+    finally:
+        device.close()
+
+
+def _squash(s: str) -> str:
+    return " ".join(s.split()).casefold()
+
+
+def pdf_page(fp, title: str, selection: str = "", max_pages: Optional[int] = None) -> Dict:
+    """
+    Markdown page for a PDF, extracted page by page with a `<!-- page N -->` marker per page.
+    Stops after `max_pages` (default TTTK_PDF_MAX_PAGES) and, with early stop on, a few pages
+    past the page containing `selection`. "complete" is False when pages were skipped.
+    """
+    budget = max_pages or PDF_MAX_PAGES or None
+    needle = _squash(selection)[:80] if PDF_EARLY_STOP else ""
+    parts, complete, read = ["# PDF Content"], True, 0
+    with span("pdf_extract"):
+        for number, page_count, text in iter_pdf_pages(fp):
+            parts.append(f"<!-- page {number} -->\n\n{text.strip()}")
+            read = number
+            if needle and needle in _squash(text):
+                needle = ""
+                budget = min(budget or number + PDF_NEIGHBOR_PAGES, number + PDF_NEIGHBOR_PAGES)
+            if budget and number >= budget:
+                complete = page_count is not None and number >= page_count
+                break
+    return {"title": title, "markdown": "\n\n".join(parts), "complete": complete, "pages_read": read}
+
+
+def page_from_response(response: dict, url: str, selection: str = "",
+                       max_pages: Optional[int] = None) -> Dict[str, str]:
+    """Markdown page from a fetch_url() result; its Content-Type decides PDF vs HTML."""
+    if response["is_pdf"]:
+        from io import BytesIO
+        fp = response.get("file") or BytesIO(response["body"])
         try:
-            text = extract_text_from_pdf(url_or_html)
-            return {
-                "title": os.path.basename(url_or_html),
-                "markdown": f"# PDF Content\n\n{text}"
-            }
+            page = pdf_page(fp, os.path.basename(url), selection=selection, max_pages=max_pages)
         except Exception as e:
             raise ValueError(f"Failed to process PDF: {str(e)}")
+        finally:
+            fp.close()
+    else:
+        page = _html_page(response["text"])
+    page["etag"] = response.get("etag", "")
+    page["last_modified"] = response.get("last_modified", "")
+    return page
 
-    # Handle HTML content
-    html = (requests.get(url_or_html).text 
-            if url_or_html.startswith(("http://", "https://")) 
-            else url_or_html)
 
-    # HTML processing
-    soup = BeautifulSoup(html, "lxml")
-    for tag in soup(["script", "style", "noscript", "iframe", "svg"]):
-        tag.decompose()
-    cleaned_html = str(soup)
+def html_to_markdown(url_or_html: str, selection: str = "", max_pages: Optional[int] = None) -> Dict[str, str]:
+    """Fetch/clean content from URL or HTML, convert to Markdown."""
+    # One pooled GET; PDFs are detected from the response instead of a separate HEAD
+    # and spooled to disk, so `selection`/`max_pages` can end PDF extraction early
+    if url_or_html.startswith(("http://", "https://")):
+        return page_from_response(fetch_url(url_or_html, spool=True), url_or_html,
+                                  selection=selection, max_pages=max_pages)
+    return _html_page(url_or_html)
+
+
+# Elements serialized without an end tag (libxml2's HTML table), so html2text never sees one
+_VOID_TAGS = frozenset("area base basefont br col frame hr img input isindex link meta param".split())
+_TEXT_ENTITIES = {"&": "amp", "<": "lt", ">": "gt"}
+_TEXT_ESCAPED = re.compile(r"[&<>]")
+
+
+class _ArticleTree:
+    """readability summary kept as its lxml element; len() is what summary()'s retry check needs."""
+
+    def __init__(self, node, min_length: int):
+        self.node, self.min_length = node, min_length
+
+    def __len__(self) -> int:
+        # text never exceeds the serialized markup, so serialize only when the text alone is short
+        length = len(self.node.text_content())
+        if length >= self.min_length:
+            return length
+        return len(clean_attributes(tounicode(self.node, method="html")))
+
+
+class _TreeDocument(Document):
+    """readability Document whose summary() returns the article subtree instead of HTML text."""
+
+    def get_clean_html(self):
+        return _ArticleTree(self.html, self.retry_length)
+
+
+def _feed_text(h2t: html2text.HTML2Text, text: Optional[str]) -> None:
+    """Text as HTMLParser reports it for serialized markup: &, < and > arrive as entity refs."""
+    if not text:
+        return
+    start = 0
+    for m in _TEXT_ESCAPED.finditer(text):
+        if m.start() > start:
+            h2t.handle_data(text[start:m.start()])
+        h2t.handle_entityref(_TEXT_ENTITIES[m.group()])
+        start = m.end()
+    if start < len(text):
+        h2t.handle_data(text[start:])
+
+
+def _tree_to_markdown(h2t: html2text.HTML2Text, node) -> str:
+    """html2text over an lxml subtree, driving its parser callbacks instead of re-parsing markup."""
+    h2t.start = True
+    for event, el in etree.iterwalk(node, events=("start", "end")):
+        if not isinstance(el.tag, str):  # comments / processing instructions: only their tail is text
+            if event == "end":
+                _feed_text(h2t, el.tail)
+            continue
+        if event == "start":
+            h2t.handle_starttag(el.tag, list(el.attrib.items()))
+            _feed_text(h2t, el.text)
+        else:
+            if el.tag not in _VOID_TAGS:
+                h2t.handle_endtag(el.tag)
+            _feed_text(h2t, el.tail)
+    return h2t.optwrap(h2t.finish())
+
+
+def _html_page(html: str) -> Dict[str, str]:
+    """Clean raw HTML, extract the main content and convert it to Markdown."""
+    # One lxml parse; readability scores a copy of this tree and hands back the article
+    # subtree, which html2text renders directly (no serialize / re-parse in between)
+    with span("clean_html"):
+        tree, _ = build_doc(html)
+        etree.strip_elements(tree, "script", "style", "noscript", "iframe", "svg", with_tail=False)
 
     # Main content extraction
-    doc = Document(cleaned_html)
-    title = (doc.short_title() or (soup.title.string if soup.title else "")).strip()
-    main_html = doc.summary(html_partial=True) or (soup.body.decode() if soup.body else cleaned_html)
+    with span("readability"):
+        doc = _TreeDocument(tree)
+        article = doc.summary(html_partial=True)
+        title_el = tree.find(".//title")
+        title = (shorten_title(tree) or (title_el.text if title_el is not None else "") or "").strip()
 
     # HTML -> Markdown
-    h2t = html2text.HTML2Text()
-    h2t.ignore_links = False
-    h2t.ignore_images = True
-    h2t.body_width = 0  # Don't wrap text
-    md = h2t.handle(main_html)
+    with span("html2text"):
+        h2t = html2text.HTML2Text()
+        h2t.ignore_links = False
+        h2t.ignore_images = True
+        h2t.body_width = 0  # Don't wrap text
+        node = article.node
+        if not node.text_content().strip():  # no article found: fall back to the whole body
+            body = tree.find("body")
+            node = body if body is not None else tree
+        md = _tree_to_markdown(h2t, node)
 
     # Normalize whitespace and clean up markdown
     md = re.sub(r"[ \t]+\n", "\n", md)
     md = re.sub(r"\n{3,}", "\n\n", md).strip()
     md = re.sub(r"\[([^\]]+)\]\(\s*\)", r"\1", md)  # Remove empty links
 
-    return {"title": title, "markdown": md}
-
-import re
-from typing import List
-
-def split_markdown(md: str, max_tokens: int = 350) -> List[str]:
-    """Split Markdown by headings/paragraphs and pack into chunks under max_tokens."""
-    # 1) split by headings to keep structure, then paragraphs
-    blocks = re.split(r"(?m)^#{1,6}\s+.*$", md)
-    paras: List[str] = []
-    for b in blocks:
-        for p in re.split(r"\n\s*\n", b):
-            p = p.strip()
-            if p:
-                paras.append(p)
-
-    # 2) pack paragraphs into chunks under the token cap
-    chunks: List[str] = []
-    buf, buf_tok = [], 0
-    for p in paras:
-        t = _tok_len(p)
-
-        # if a single paragraph is too big, split roughly by sentences
-        if t > max_tokens:
-            sentences = re.split(r"(?<=[.!?])\s+", p)
-            cur, cur_tok = [], 0
-            for s in sentences:
-                st = _tok_len(s)
-                if cur and cur_tok + st > max_tokens:
-                    chunks.append(" ".join(cur))
-                    cur, cur_tok = [], 0
-                cur.append(s)
-                cur_tok += st
-            if cur:
-                chunks.append(" ".join(cur))
+    return {"title": title, "markdown": md, "etag": "", "last_modified": ""}
+
+_HEADING = re.compile(r"(#{1,6})\s+(.*?)[ \t#]*$")
+_SENTENCE_GAP = re.compile(r"(?<=[.!?])\s+")
+CHUNK_OVERLAP = int(os.getenv("TTTK_CHUNK_OVERLAP", 0))  # tokens repeated from the previous chunk
+CHUNKER_VERSION = 3  # part of the page-cache key; bump when chunk boundaries or stored spans change
+
+
+def _blocks(md: str):
+    """Yield ("heading" | "page" | "para", start, end) for each block of `md`, in one scan of its lines."""
+    pos, n, para = 0, len(md), None
+    while pos < n:
+        nl = md.find("\n", pos)
+        end = n if nl < 0 else nl
+        line = md[pos:end]
+        if not line.strip():
+            if para:
+                yield ("para", *para)
+                para = None
+        else:
+            first = pos + len(line) - len(line.lstrip())
+            last = pos + len(line.rstrip())
+            if _HEADING.match(line) or _PAGE_MARK.match(line):
+                if para:
+                    yield ("para", *para)
+                    para = None
+                yield ("page" if _PAGE_MARK.match(line) else "heading", first, last)
+            else:
+                para = (para[0], last) if para else (first, last)
+        pos = end + 1
+    if para:
+        yield ("para", *para)
+
+
+def _token_spans(text: str, start: int, max_tokens: int) -> List[tuple]:
+    """
+    (start, end, n_tokens) pieces of one block, each under max_tokens, tokenizing the block once.
+    Long blocks are cut at sentence ends, and a sentence longer than the cap at a token boundary.
+    """
+    if _TOK is None:
+        _load_tokenizer()
+    if _TOK:
+        tokens = _enc.encode(text)
+        total = len(tokens)
+        if total <= max_tokens:
+            return [(start, start + len(text), total)]
+        _, offsets = _enc.decode_with_offsets(tokens)
+        tok_at = lambda c: bisect.bisect_left(offsets, c)
+        char_at = lambda t: offsets[t] if t < len(offsets) else len(text)
+    else:
+        total = max(1, len(text) // 4)
+        if total <= max_tokens:
+            return [(start, start + len(text), total)]
+        tok_at = lambda c: c // 4
+        char_at = lambda t: min(len(text), t * 4)
+
+    bounds = [m.end() for m in _SENTENCE_GAP.finditer(text)] + [len(text)]
+    cuts, cur, prev = [], 0, 0
+    for b in bounds:
+        if tok_at(b) - tok_at(cur) > max_tokens and prev > cur:
+            cuts.append((cur, prev))
+            cur = prev
+        while tok_at(b) - tok_at(cur) > max_tokens:
+            cut = max(cur + 1, char_at(tok_at(cur) + max_tokens))
+            cuts.append((cur, cut))
+            cur = cut
+        prev = b
+    if cur < len(text):
+        cuts.append((cur, len(text)))
+
+    spans = []
+    for s, e in cuts:
+        piece = text[s:e]
+        s += len(piece) - len(piece.lstrip())
+        e -= len(piece) - len(piece.rstrip())
+        if e > s:
+            spans.append((start + s, start + e, max(1, tok_at(e) - tok_at(s))))
+    return spans
+
+
+def iter_chunks(md: str, max_tokens: int = 350, overlap: Optional[int] = None):
+    """
+    Single pass over `md` yielding one dict per chunk, packed by token count:
+      {"text": md[start:end], "headings": [h1, h2, ...], "page": int | None,
+       "start", "end" (character offsets), "token_start", "token_end"}
+    `overlap` tokens of trailing blocks (default TTTK_CHUNK_OVERLAP) are repeated at the start of
+    the next chunk. A chunk never spans a PDF page marker, never ends on a heading, and a heading
+    ends a chunk that is at least half full.
+    """
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    headings, page = [], None
+    # buf holds (start, end, n_tokens, token_start, heading path, is_heading)
+    buf, buf_tok, tok_pos = [], 0, 0
+
+    def chunk():
+        return {"text": md[buf[0][0]:buf[-1][1]], "headings": list(buf[0][4]), "page": page,
+                "start": buf[0][0], "end": buf[-1][1],
+                "token_start": buf[0][3], "token_end": buf[-1][3] + buf[-1][2]}
+
+    for kind, start, end in _blocks(md):
+        if kind == "page":
+            if buf:
+                yield chunk()
+                buf, buf_tok = [], 0
+            page = int(re.search(r"\d+", md[start:end]).group())
             continue
+        if kind == "heading":
+            m = _HEADING.match(md[start:end])
+            level = len(m.group(1))
+            headings = [h for h in headings if h[0] < level] + [(level, m.group(2))]
+            if buf and buf_tok >= max_tokens // 2:
+                yield chunk()
+                buf, buf_tok = [], 0
+        path = tuple(title for _, title in headings)
+        for s, e, n in _token_spans(md[start:end], start, max_tokens):
+            if buf and buf_tok + n > max_tokens:
+                # trailing headings move on with the text they introduce
+                pending = []
+                while buf and buf[-1][5]:
+                    pending.insert(0, buf.pop())
+                tail = []
+                if buf:
+                    yield chunk()
+                    # carry trailing blocks (never the whole chunk) that fit in the overlap
+                    carried = sum(u[2] for u in pending)
+                    for unit in reversed(buf[1:]):
+                        if carried + unit[2] > overlap or carried + unit[2] + n > max_tokens:
+                            break
+                        tail.insert(0, unit)
+                        carried += unit[2]
+                buf = tail + pending
+                buf_tok = sum(u[2] for u in buf)
+            buf.append((s, e, n, tok_pos, path, kind == "heading"))
+            buf_tok += n
+            tok_pos += n
+    if buf:
+        yield chunk()
 
-        # normal packing
-        if buf and buf_tok + t > max_tokens:
-            chunks.append("\n\n".join(buf))
-            buf, buf_tok = [], 0
-        buf.append(p)
-        buf_tok += t
 
-    if buf:
-        chunks.append("\n\n".join(buf))
+def _chunker_tag() -> str:
+    return f"v{CHUNKER_VERSION}-overlap{CHUNK_OVERLAP}"
+
+
+def chunk_markdown(md: str, max_tokens: int = 350, overlap: Optional[int] = None) -> List[dict]:
+    """The iter_chunks dicts of `md` as a list (texts with their offsets, headings and pages)."""
+    with span("chunk"):
+        chunks = list(iter_chunks(md, max_tokens=max_tokens, overlap=overlap))
+    PAGE_CHUNKS.observe(len(chunks))
     return chunks
 
+
+def split_markdown(md: str, max_tokens: int = 350, overlap: Optional[int] = None) -> List[str]:
+    """Split Markdown into chunks under max_tokens (the texts of chunk_markdown)."""
+    return [c["text"] for c in chunk_markdown(md, max_tokens=max_tokens, overlap=overlap)]
+
+
+def chunk_spans(chunks: List[dict]) -> List[dict]:
+    """iter_chunks dicts without their text: what the page cache keeps beside the chunk texts."""
+    return [{k: v for k, v in c.items() if k != "text"} for c in chunks]
+
 # def choose_chunks(highlight: str, chunks: List[str], top_k: int = 3) -> List[str]:
 #     """Return top_k chunks most relevant to the highlight."""
 #     api_key = ""
@@ -172,59 +427,259 @@ def split_markdown(md: str, max_tokens: int = 350) -> List[str]:
 
 # Load a local embedding model
 # (all-MiniLM-L6-v2 is small, fast, and good for semantic similarity)
+# The backend (embedding_backend.py, TTTK_EMBED_BACKEND) and faiss are imported on first use,
+# once, behind a lock.
 
-try:
-    from sentence_transformers import SentenceTransformer
-    _embedder = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
-except Exception:
-    _embedder = None
+from embedding_backend import DEFAULT_MODEL as _EMBED_MODEL, create_backend, vector_space_for
 
-try:
-    import faiss
-    _has_faiss = True
-except Exception:
-    _has_faiss = False
+# "hybrid": vector + BM25 rankings fused by reciprocal rank; "vector": embeddings only;
+# "bm25": lexical only, the embedding model is never loaded (low-resource hosts)
+RANKER = os.getenv("TTTK_RANKER", "hybrid")
 
+_model_lock = threading.Lock()
+_embedder = None
+_faiss = None
+_model_state = {"embedder": "not_loaded", "faiss": "not_loaded", "backend": None, "load_seconds": None,
+                "warm_seconds": None, "error": ""}
 
-def _keyword_score(query: str, text: str) -> float:
-    """Tiny fallback scorer if sentence-transformers isn't available."""
-    q = set(re.findall(r"\w+", query.lower()))
-    t = re.findall(r"\w+", text.lower())
-    if not q or not t: return 0.0
-    hits = sum(t.count(w) for w in q)
-    cov  = len({w for w in q if w in t}) / max(1, len(q))
-    return hits / max(1, len(t)) + 0.2 * cov
 
+def get_embedder():
+    """
+    The shared embedding backend, loaded on first call; None if it can't be loaded.
+    A non-default backend that fails to load falls back to sentence-transformers.
+    """
+    global _embedder
+    if _model_state["embedder"] in ("ready", "unavailable", "disabled"):
+        return _embedder
+    if RANKER == "bm25":
+        _model_state["embedder"] = "disabled"
+        return None
+    with _model_lock:
+        if _model_state["embedder"] == "not_loaded":
+            _model_state["embedder"] = "loading"
+            started = time.perf_counter()
+            kinds = [os.getenv("TTTK_EMBED_BACKEND", "sentence-transformers")]
+            if kinds[0] != "sentence-transformers":
+                kinds.append("sentence-transformers")
+            for kind in kinds:
+                try:
+                    _embedder = create_backend(kind, _EMBED_MODEL)
+                    _model_state["embedder"] = "ready"
+                    _model_state["backend"] = _embedder.info()
+                    break
+                except Exception as e:
+                    _embedder = None
+                    _model_state["embedder"] = "unavailable"
+                    _model_state["error"] = f"{kind}: {e}"
+            _model_state["load_seconds"] = round(time.perf_counter() - started, 3)
+    return _embedder
+
+
+def get_faiss():
+    """The faiss module, imported on first call; None if it isn't installed."""
+    global _faiss
+    if _model_state["faiss"] == "not_loaded":
+        with _model_lock:
+            if _model_state["faiss"] == "not_loaded":
+                try:
+                    import faiss
+                    _faiss = faiss
+                    _model_state["faiss"] = "ready"
+                except Exception:
+                    _model_state["faiss"] = "unavailable"
+    return _faiss
+
+
+def model_status() -> dict:
+    """Loading state of the lazy dependencies (for readiness checks)."""
+    status = dict(_model_state)
+    status["model"] = _EMBED_MODEL
+    status["tokenizer"] = "not_loaded" if _TOK is None else ("ready" if _TOK else "unavailable")
+    status["ready"] = status["embedder"] in ("ready", "unavailable", "disabled")
+    status["ranker"] = RANKER
+    return status
+
+
+def warm_up(background: bool = False):
+    """Load tokenizer, embedding model, faiss and the vector store now instead of on first request."""
+    def _load():
+        started = time.perf_counter()
+        if _TOK is None:
+            _load_tokenizer()
+        get_embedder()
+        get_faiss()
+        get_vector_store()
+        _model_state["warm_seconds"] = round(time.perf_counter() - started, 3)
+
+    if not background:
+        _load()
+        return None
+    thread = threading.Thread(target=_load, name="textify-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+_bm25_cache: "OrderedDict[str, BM25Index]" = OrderedDict()
+_bm25_lock = threading.Lock()
+
+
+def bm25_index(chunks: List[str]) -> BM25Index:
+    """BM25 index over a page's chunks, built once per distinct chunk list (small in-process LRU)."""
+    digest = hashlib.sha256("\x00".join(chunks).encode("utf-8", "ignore")).hexdigest()
+    with _bm25_lock:
+        index = _bm25_cache.get(digest)
+        if index is not None:
+            _bm25_cache.move_to_end(digest)
+            return index
+    index = BM25Index(chunks)
+    with _bm25_lock:
+        _bm25_cache[digest] = index
+        while len(_bm25_cache) > 64:
+            _bm25_cache.popitem(last=False)
+    return index
+
+
+def embed_chunks(chunks: List[str], batch_size: Optional[int] = None):
+    """Encode chunks into a float32 matrix, or None when no embedder is available."""
+    embedder = get_embedder() if chunks else None
+    if embedder is None:
+        return None
+    with span("embed"):
+        return embedder.encode(chunks, batch_size=batch_size)
+
+
+def _vector_space() -> str:
+    """
+    Name of the space cached embeddings belong to ("" without an embedder). Until the model
+    has loaded this is the configured backend's space, so cache lookups never load it.
+    """
+    state = _model_state["embedder"]
+    if state == "ready":
+        return _embedder.vector_space
+    if state in ("unavailable", "disabled") or RANKER == "bm25":
+        return ""
+    return vector_space_for(os.getenv("TTTK_EMBED_BACKEND"), _EMBED_MODEL)
 
-def choose_chunk_indices(query: str, chunks: List[str], top_k: int = 3) -> List[int]:
+
+def choose_chunk_indices(query: str, chunks: List[str], top_k: int = 3, chunk_vecs=None,
+                         page_key: str = "", exclude=()) -> List[int]:
     """
     Return indices of the top_k chunks most relevant to the query.
-    Prefers local embeddings; falls back to keyword overlap.
+    Ranks with local embeddings and BM25, fused by reciprocal rank (see RANKER); BM25 alone
+    when no embedder is available.
+    Pass `chunk_vecs` (e.g. from the page cache) to skip re-encoding the chunks, and
+    `page_key` to search the page's rows in the shared vector store instead of building an index.
+    Indices in `exclude` are never returned.
     """
-    if not chunks:
+    exclude = set(exclude)
+    if not chunks or top_k <= 0:
         return []
+    pool = [i for i in range(len(chunks)) if i not in exclude]
+
+    embedder = get_embedder()
+    if embedder is None:
+        with span("bm25"):
+            return [i for i, _ in bm25_index(chunks).search(query, top_k, candidates=pool)]
+    if RANKER == "vector":
+        return _vector_ranking(embedder, query, chunks, top_k, chunk_vecs, page_key, exclude, pool)
+
+    # hybrid: fuse the two rankings over a deeper candidate list
+    depth = max(4 * top_k, 20)
+    semantic = _vector_ranking(embedder, query, chunks, depth, chunk_vecs, page_key, exclude, pool)
+    with span("bm25"):
+        lexical = [i for i, _ in bm25_index(chunks).search(query, depth, candidates=pool)]
+    return rrf([semantic, lexical], top_k)
+
+
+def _vector_ranking(embedder, query: str, chunks: List[str], top_k: int, chunk_vecs, page_key: str,
+                    exclude: set, pool: List[int]) -> List[int]:
+    """Up to top_k chunk indices by embedding distance (see choose_chunk_indices)."""
+    with span("embed_query"):
+        qv = embedder.encode([query])[0]
+    store = get_vector_store() if page_key else None
+    if store is not None:
+        with span("vector_search"):
+            idxs = [i for i in store.search_page(page_key, qv, top_k + len(exclude)) if i not in exclude]
+        if idxs:
+            return idxs[:top_k]
+    if chunk_vecs is not None:
+        cvs = chunk_vecs[pool] if exclude else chunk_vecs
+    else:
+        cvs = embed_chunks([chunks[i] for i in pool])
+    if cvs is None or not len(pool):
+        return []
+    top_k = min(top_k, len(pool))
 
-    # Semantic (preferred)
-    if _embedder is not None:
-        import numpy as np
-        qv = _embedder.encode([query], convert_to_numpy=True)[0]
-        cvs = _embedder.encode(chunks, convert_to_numpy=True)
-
-        if _has_faiss:
+    faiss = get_faiss()
+    with span("vector_search"):
+        if faiss is not None:
             index = faiss.IndexFlatL2(cvs.shape[1])
-            index.add(cvs.astype('float32'))
+            index.add(np.ascontiguousarray(cvs, dtype='float32'))
             _, idx = index.search(qv[np.newaxis, :].astype('float32'), top_k)
-            return idx[0].tolist()
+            return [pool[i] for i in idx[0].tolist()]
 
         # Pure NumPy cosine similarity
         sims = (cvs @ qv) / (np.linalg.norm(cvs, axis=1) * (np.linalg.norm(qv) + 1e-9))
         order = np.argsort(-sims)[:top_k]
-        return order.tolist()
+        return [pool[i] for i in order.tolist()]
+
+
+ANCHOR_ENABLED = os.getenv("TTTK_ANCHOR", "1") != "0"
+ANCHOR_NEIGHBORS = int(os.getenv("TTTK_ANCHOR_NEIGHBORS", 1))  # chunks kept on each side of the anchor
+ANCHOR_WINDOW = int(os.getenv("TTTK_ANCHOR_WINDOW", 6))  # chunks ranked around it when nothing is stored
+ANCHOR_MIN_CHARS = 12
+ANCHOR_FUZZY = 0.6  # share of the selection's word trigrams a chunk must contain
+_MD_NOISE = re.compile(r"!?\[([^\]]*)\]\([^)]*\)|[*_`#>|~]|-\n")
+
 
-    # Fallback: keyword overlap
-    scored = [(_keyword_score(query, c), i) for i, c in enumerate(chunks)]
-    scored.sort(reverse=True)
-    return [i for s, i in scored[:top_k] if s > 0]
+def _squash_markdown(s: str) -> str:
+    """Markdown reduced to the words a reader sees: link text only, no emphasis, spacing/case folded."""
+    return _squash(_MD_NOISE.sub(lambda m: m.group(1) or "", s))
+
+
+def anchor_indices(selection: str, chunks: List[str], neighbors: Optional[int] = None) -> tuple:
+    """
+    Locate the selection in the chunks without embeddings.
+    Returns (indices, method): the chunk(s) holding the selection, then up to `neighbors` chunks on
+    each side, nearest first; method is "exact", "normalized", "fuzzy" or "" when not found.
+    """
+    neighbors = ANCHOR_NEIGHBORS if neighbors is None else neighbors
+    text = selection.strip()
+    if len(text) < ANCHOR_MIN_CHARS or not chunks:
+        return [], ""
+
+    hits, method = [i for i, c in enumerate(chunks) if text in c][:1], "exact"
+    if not hits:
+        method = "normalized"
+        needle = _squash_markdown(text)
+        if len(needle) < ANCHOR_MIN_CHARS:  # mostly markdown punctuation: it would match anywhere
+            return [], ""
+        flat = [_squash_markdown(c) for c in chunks]
+        hits = [i for i, c in enumerate(flat) if needle in c][:1]
+        if not hits and len(needle) > 2 * 60:
+            # selection spanning a chunk boundary: its head and its tail land in adjacent chunks
+            head = next((i for i, c in enumerate(flat) if needle[:60] in c), None)
+            if head is not None and head + 1 < len(flat) and needle[-60:] in flat[head + 1]:
+                hits = [head, head + 1]
+        if not hits:
+            method = "fuzzy"
+            words = needle.split()
+            grams = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+            best, best_share = None, 0.0
+            for i, c in enumerate(flat):
+                share = sum(1 for g in grams if g in c) / len(grams)
+                if share > best_share:
+                    best, best_share = i, share
+            hits = [best] if best is not None and best_share >= ANCHOR_FUZZY else []
+    if not hits:
+        return [], ""
+
+    out = list(hits)
+    for step in range(1, neighbors + 1):
+        for i in (hits[0] - step, hits[-1] + step):
+            if 0 <= i < len(chunks):
+                out.append(i)
+    return out, method
 
 
 def choose_chunks(query: str, chunks: List[str], top_k: int = 3) -> List[str]:
@@ -240,35 +695,322 @@ def _clean_markdown_for_prompt(s: str) -> str:
     return s.strip()
 
 
-def build_context(selected_text: str, chunks: List[str], top_k: int = 3) -> dict:
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TTTK_CONTEXT_TOKEN_BUDGET", 1000))  # 0 = no budget, plain top_k
+MMR_LAMBDA = float(os.getenv("TTTK_MMR_LAMBDA", 0.7))  # 1.0 = relevance only, lower = more diverse
+MMR_DUPLICATE = 0.9  # similarity at which a chunk counts as a copy of one already taken
+_CHUNK_OVERHEAD = 12  # label + separator tokens per chunk
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens."""
+    if _tok_len(text) <= max_tokens:
+        return text
+    if _TOK:
+        return _enc.decode(_enc.encode(text)[:max_tokens])
+    return text[:max_tokens * 4]
+
+
+def _mmr_within_budget(candidates: List[int], texts: Dict[int, str], budget: int, limit: int,
+                       chunk_vecs=None) -> List[int]:
+    """
+    Greedy maximal marginal relevance over `candidates` (most relevant first) under a token budget:
+    each step takes the chunk maximising MMR_LAMBDA * relevance - (1 - MMR_LAMBDA) * max similarity
+    to those already taken, among the chunks that still fit and aren't near-copies of one taken.
+    Similarity is cosine over chunk_vecs, or word-set Jaccard without them.
+    """
+    n = len(candidates)
+    relevance = {i: 1.0 - rank / n for rank, i in enumerate(candidates)}
+    cost = {i: _tok_len(texts[i]) + _CHUNK_OVERHEAD for i in candidates}
+    if chunk_vecs is not None:
+        vecs = np.asarray(chunk_vecs[candidates], dtype=np.float32)
+        vecs /= np.linalg.norm(vecs, axis=1, keepdims=True) + 1e-9
+        row = {i: r for r, i in enumerate(candidates)}
+        sims = vecs @ vecs.T
+        similarity = lambda a, b: float(sims[row[a], row[b]])
+    else:
+        words = {i: set(bm25_tokenize(texts[i])) for i in candidates}
+        similarity = lambda a, b: len(words[a] & words[b]) / (len(words[a] | words[b]) or 1)
+
+    picked, left = [], budget
+    remaining = list(candidates)
+    while remaining and len(picked) < limit:
+        fits = [i for i in remaining if cost[i] <= left]
+        if not fits:
+            break
+        redundancy = {i: max((similarity(i, j) for j in picked), default=0.0) for i in fits}
+        for i in fits:
+            if redundancy[i] >= MMR_DUPLICATE:
+                remaining.remove(i)
+        fits = [i for i in fits if redundancy[i] < MMR_DUPLICATE]
+        if not fits:
+            continue
+        best = max(fits, key=lambda i: MMR_LAMBDA * relevance[i] - (1 - MMR_LAMBDA) * redundancy[i])
+        picked.append(best)
+        remaining.remove(best)
+        left -= cost[best]
+    return picked
+
+
+def build_context(selected_text: str, chunks: List[str], top_k: int = 3, chunk_vecs=None,
+                  page_key: str = "", pages: Optional[List[Optional[int]]] = None, anchor=None,
+                  token_budget: Optional[int] = None) -> dict:
     """
     Returns a dictionary with one big `context` string plus metadata.
     {
       "context": str,
       "selected_text": str,
-      "selected_indices": [int],
-      "selected_chunks": [str]
+      "selected_indices": [int],       # document order
+      "selected_chunks": [str],
+      "selected_pages": [int | None],  # PDF page of each chunk (the "page" of its span)
+      "anchor": str,                   # how the selection was located ("" = ranked only)
+      "tokens_used": int,              # tokens in `context`
+      "token_budget": int
     }
+    The chunks holding the selection and their neighbours come first (see anchor_indices);
+    only the rest is ranked. Without chunk_vecs (or page_key), the rest comes from BM25 over the
+    ANCHOR_WINDOW chunks around the anchor, so no chunk is encoded. Pass `anchor` to reuse an
+    anchor_indices() result.
+    With a token budget (default TTTK_CONTEXT_TOKEN_BUDGET) up to top_k chunks are picked by MMR
+    from twice as many candidates, so `context` never exceeds the budget and near-duplicate
+    chunks don't crowd out the rest.
     """
-    idxs = choose_chunk_indices(selected_text, chunks, top_k=top_k)
+    budget = CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    depth = 2 * top_k if budget else top_k
+    if anchor is None:
+        with span("anchor"):
+            anchor = anchor_indices(selected_text, chunks) if ANCHOR_ENABLED else ([], "")
+    anchored, method = anchor
+    idxs = anchored[:depth]
+    if len(idxs) < depth and idxs and chunk_vecs is None and not page_key:
+        # no stored vectors: fill up lexically from the window around the anchor rather than
+        # encoding chunks on every request
+        lo, hi = max(0, min(idxs) - ANCHOR_WINDOW), min(len(chunks), max(idxs) + ANCHOR_WINDOW + 1)
+        with span("bm25"):
+            idxs += [i for i, _ in bm25_index(chunks).search(
+                selected_text, depth - len(idxs), candidates=[i for i in range(lo, hi) if i not in idxs])]
+    elif len(idxs) < depth:
+        idxs += choose_chunk_indices(selected_text, chunks, top_k=depth - len(idxs), chunk_vecs=chunk_vecs,
+                                     page_key=page_key, exclude=idxs)
+
+    header = "Selected text:\n{}\n\nRelevant context:\n"
+    if budget:
+        selected_text = truncate_tokens(selected_text, budget // 4)
+        texts = {i: _clean_markdown_for_prompt(chunks[i]) for i in idxs}
+        room = budget - _tok_len(header.format(selected_text))
+        with span("mmr"):
+            idxs = sorted(_mmr_within_budget(idxs, texts, room, top_k, chunk_vecs)) if idxs and room > 0 else []
     chosen = [_clean_markdown_for_prompt(chunks[i]) for i in idxs]
+    chosen_pages = [pages[i] if pages else None for i in idxs]
 
-    labeled = [f"[Chunk {j+1}] {txt}" for j, txt in enumerate(chosen)]
-    context_str = (
-        f"Selected text:\n{selected_text}\n\n"
-        f"Relevant context:\n" + "\n\n---\n\n".join(labeled)
-    )
+    labeled = [f"[Chunk {j+1}{f', page {p}' if p else ''}] {txt}"
+               for j, (txt, p) in enumerate(zip(chosen, chosen_pages))]
+    context_str = header.format(selected_text) + "\n\n---\n\n".join(labeled)
+    if budget and _tok_len(context_str) > budget:  # label/separator estimate was short; hard stop
+        context_str = truncate_tokens(context_str, budget)
+    tokens_used = _tok_len(context_str)
 
     return {
         "context": context_str,
         "selected_text": selected_text,
         "selected_indices": idxs,
-        "selected_chunks": chosen
+        "selected_chunks": chosen,
+        "selected_pages": chosen_pages,
+        "anchor": method,
+        "tokens_used": tokens_used,
+        "token_budget": budget
     }
 
-def build_context_from_source(selected_text: str, url_or_html: str, top_k: int = 10, max_tokens: int = 500) -> dict:
-    page = html_to_markdown(url_or_html)
-    chunks = split_markdown(page["markdown"], max_tokens=max_tokens)
-    ctx = build_context(selected_text, chunks, top_k=top_k)
+from page_cache import PageCache, content_hash, is_url
+
+try:
+    _page_cache = PageCache() if os.getenv("TTTK_PAGE_CACHE", "1") != "0" else None
+except Exception:  # e.g. the cache directory can't be created
+    _page_cache = None
+
+
+_vector_stores: Dict[str, object] = {}  # vector space -> its VectorStore (None if it failed to open)
+
+
+def get_vector_store():
+    """
+    The shared chunk vector store of the current vector space (opened on first use, without
+    loading the model); None if disabled or no embedder.
+    """
+    space = _vector_space()
+    if not space or os.getenv("TTTK_VECTOR_STORE", "1") == "0":
+        return None
+    if space not in _vector_stores:
+        with _model_lock:
+            if space not in _vector_stores:
+                try:
+                    from vector_store import VectorStore
+                    _vector_stores[space] = VectorStore(model=space)
+                except Exception:
+                    _vector_stores[space] = None
+    return _vector_stores[space]
+
+
+def _attach_embeddings(key: str, page: dict, source: str, compute: bool = True) -> dict:
+    """
+    Fill page["embeddings"], reading from the shared vector store and encoding only on a miss.
+    With compute=False nothing is encoded (nor the model loaded); embeddings stay None unless
+    already stored.
+    """
+    if not _vector_space():
+        return page
+    store = get_vector_store()
+    if store is None:
+        if page.get("embeddings") is None and compute:
+            page["embeddings"] = embed_chunks(page["chunks"])
+        return page
+    digest = content_hash(page["markdown"])
+    vecs = store.get_page(key, digest)
+    if vecs is None:
+        fresh = page.get("embeddings")
+        if fresh is None and compute:
+            fresh = embed_chunks(page["chunks"])
+        if fresh is None:
+            return page
+        store.add_page(key, fresh, url=source if is_url(source) else "",
+                               offsets=[s["start"] for s in page["spans"]],
+                               content_hash=digest)
+        vecs = store.get_page(key, digest)
+        if vecs is None:
+            vecs = fresh
+    page["embeddings"] = vecs
+    return page
+
+
+def load_page(url_or_html: str, max_tokens: int = 500, use_cache: bool = True, selection: str = "",
+              max_pages: Optional[int] = None, embed: bool = True) -> dict:
+    """
+    Return {"key", "title", "markdown", "chunks", "spans", "embeddings"} for a URL or raw HTML;
+    spans[i] holds the offsets, headings and page of chunks[i] (see chunk_spans).
+    Served from the page cache when the entry is fresh, revalidated (304) or unchanged;
+    embeddings come from the shared vector store when it is enabled.
+    embed=False never encodes: "embeddings" is None unless they were stored earlier
+    (ensure_embeddings() fills them in later).
+    For PDFs, `selection` and `max_pages` may end extraction early (see pdf_page); such a
+    partial entry is only reused for selections it contains.
+    """
+    model = _vector_space()
+    cache = _page_cache if use_cache else None
+    if cache is None:
+        page = html_to_markdown(url_or_html, selection=selection, max_pages=max_pages)
+        chunked = chunk_markdown(page["markdown"], max_tokens=max_tokens)
+        chunks = [c["text"] for c in chunked]
+        return {"key": "", "title": page.get("title", ""), "markdown": page["markdown"],
+                "chunks": chunks, "spans": chunk_spans(chunked),
+                "embeddings": embed_chunks(chunks) if embed else None,
+                "source": url_or_html, "complete": page.get("complete", True)}
+
+    key = cache.key_for(url_or_html, max_tokens, _chunker_tag())
+    cached = cache.get(key)
+    if cached is not None and not cached["meta"].get("complete", True) and (
+            not selection or _squash(selection)[:80] not in _squash(cached["markdown"])):
+        cached = None
+    if cached is not None:
+        cached["key"] = key
+        cached["source"] = url_or_html
+        cached["complete"] = cached["meta"].get("complete", True)
+    if cached is not None and cached["meta"].get("model") == model:
+        # raw HTML is content-addressed, so its entry can never be out of date
+        if cached["fresh"] or not is_url(url_or_html):
+            CACHE_EVENTS.inc(cache="page", result="hit")
+            return _attach_embeddings(key, cached, url_or_html, compute=embed)
+        # stale: one conditional GET; a 304 keeps the entry, a 200 body is used directly
+        response = fetch_url(url_or_html, etag=cached["meta"].get("etag", ""),
+                             last_modified=cached["meta"].get("last_modified", ""), spool=True)
+        if response["not_modified"]:
+            CACHE_EVENTS.inc(cache="page", result="revalidated")
+            cache.touch(key)
+            return _attach_embeddings(key, cached, url_or_html, compute=embed)
+        CACHE_EVENTS.inc(cache="page", result="stale")
+        page = page_from_response(response, url_or_html, selection=selection, max_pages=max_pages)
+    else:
+        CACHE_EVENTS.inc(cache="page", result="miss")
+        page = html_to_markdown(url_or_html, selection=selection, max_pages=max_pages)
+
+    if cached is not None and cached["meta"].get("content_hash") == content_hash(page["markdown"]):
+        # page body unchanged since the last fetch: keep its chunks, re-embed only on model change
+        chunks, spans = cached["chunks"], cached["spans"]
+        vecs = cached["embeddings"] if cached["meta"].get("model") == model else None
+    else:
+        chunked = chunk_markdown(page["markdown"], max_tokens=max_tokens)
+        chunks, spans = [c["text"] for c in chunked], chunk_spans(chunked)
+        vecs = None
+
+    return _save_page(cache, key, url_or_html, page, chunks, spans, vecs, embed=embed)
+
+
+def ensure_embeddings(page: dict) -> dict:
+    """Encode (and store) a load_page(embed=False) result's chunk embeddings if it has none."""
+    if page.get("embeddings") is None:
+        if not page.get("key"):
+            page["embeddings"] = embed_chunks(page["chunks"])
+            return page
+        _attach_embeddings(page["key"], page, page.get("source", ""))
+        # without a vector store the page cache keeps the matrix
+        if page["embeddings"] is not None and get_vector_store() is None and _page_cache is not None:
+            _page_cache.put_embeddings(page["key"], page["embeddings"])
+    return page
+
+
+def _save_page(cache, key: str, source: str, page: dict, chunks: List[str], spans: List[dict], vecs,
+               embed: bool = True) -> dict:
+    result = {"key": key, "title": page.get("title", ""), "markdown": page["markdown"], "chunks": chunks,
+              "spans": spans, "embeddings": vecs, "source": source, "complete": page.get("complete", True)}
+    _attach_embeddings(key, result, source, compute=embed)
+    # with a vector store the matrix lives there; don't keep a second copy in the page cache
+    cache.put(key, source=source, title=result["title"], markdown=result["markdown"],
+              chunks=chunks, spans=spans, embeddings=None if get_vector_store() is not None else result["embeddings"],
+              model=_vector_space(), etag=page.get("etag", ""),
+              last_modified=page.get("last_modified", ""), complete=page.get("complete", True))
+    return result
+
+
+def store_page(url_or_html: str, page: dict, chunks: List[dict], embeddings=None, max_tokens: int = 500) -> dict:
+    """
+    Put already-processed artifacts (html_to_markdown page + chunk_markdown chunks) into
+    the page cache, so build_context_from_source(url_or_html, max_tokens=...) hits it.
+    """
+    texts, spans = [c["text"] for c in chunks], chunk_spans(chunks)
+    if _page_cache is None:
+        return {"key": "", "title": page.get("title", ""), "markdown": page["markdown"],
+                "chunks": texts, "spans": spans, "embeddings": embeddings}
+    key = _page_cache.key_for(url_or_html, max_tokens, _chunker_tag())
+    return _save_page(_page_cache, key, url_or_html, page, texts, spans, embeddings)
+
+
+# Concurrent builds of the same page (a shared link opened by many users at once) fetch,
+# parse and embed it once; every caller still ranks the shared chunks for its own selection
+_page_flight = SingleFlight("page")
+_embed_flight = SingleFlight("embed")
+
+
+def _shared_page(url_or_html: str, max_tokens: int, selection: str, max_pages: Optional[int], embed: bool) -> dict:
+    """load_page, joined with a concurrent load of the same source (URL, or hash of raw HTML)."""
+    key = PageCache.key_for(url_or_html, max_tokens, _chunker_tag())  # normalized URL / HTML content hash
+    load = lambda: load_page(url_or_html, max_tokens=max_tokens, selection=selection, max_pages=max_pages,
+                             embed=embed)
+    page = _page_flight.do((key, max_pages, embed), load)
+    if not page.get("complete", True) and selection and _squash(selection)[:80] not in _squash(page["markdown"]):
+        page = load()  # the shared PDF extraction stopped before this caller's selection
+    return page
+
+
+def build_context_from_source(selected_text: str, url_or_html: str, top_k: int = 10, max_tokens: int = 500,
+                              max_pages: Optional[int] = None, token_budget: Optional[int] = None) -> dict:
+    # chunks are only encoded when the selection can't be anchored in the page
+    page = _shared_page(url_or_html, max_tokens, selected_text, max_pages, embed=not ANCHOR_ENABLED)
+    with span("anchor"):
+        anchor = anchor_indices(selected_text, page["chunks"]) if ANCHOR_ENABLED else ([], "")
+    if not anchor[0]:
+        # the page dict may be shared with concurrent builds: encode it once
+        _embed_flight.do(id(page), lambda: ensure_embeddings(page))
+    ctx = build_context(selected_text, page["chunks"], top_k=top_k, chunk_vecs=page["embeddings"],
+                        page_key=page["key"] if get_vector_store() is not None and page["embeddings"] is not None else "",
+                        pages=[s["page"] for s in page["spans"]], anchor=anchor,
+                        token_budget=token_budget)
     ctx["title"] = page.get("title", "")
-    return ctx
\ No newline at end of file
+    return ctx
@@ -0,0 +1,278 @@
+# transcription.py
+"""
+Speech-to-text jobs behind POST /api/voice/transcribe.
+
+    spooled, digest, size = spool_upload(request.stream)     # 64 KB blocks, hashed on the way
+    job = jobs.submit(spooled, digest, size, "clip.webm", "audio/webm")
+    jobs.wait(job["job_id"], timeout=10)                       # or poll jobs.get(job_id)
+
+The upload is spooled (in memory up to TTTK_TRANSCRIBE_SPOOL_BYTES, on disk beyond) while
+its sha256 is computed, so identical audio is answered from the cache before anything is
+sent upstream; on a miss the provider streams the spooled file from disk. Jobs run on a
+bounded pool (TTTK_TRANSCRIBE_WORKERS) with at most TTTK_TRANSCRIBE_MAX_PENDING queued or
+running; beyond that submit() raises TranscriptionBusy. Concurrent uploads of the same
+audio share one job. Finished jobs are kept for TTTK_TRANSCRIBE_JOB_TTL seconds for polling.
+
+TTTK_TRANSCRIBE_PROVIDER picks the backend: "elevenlabs" (default, eleven_api.voice_api)
+or "stub", a local deterministic provider for tests and offline development. The provider
+is created on the first upload, so the server runs without the voice SDK installed.
+"""
+
+from __future__ import annotations
+import hashlib, logging, os, tempfile, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from response_cache import ResponseCache, _MISS
+from telemetry import CACHE_EVENTS, span
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+MAX_BYTES = int(os.getenv("TTTK_TRANSCRIBE_MAX_BYTES", 25 * 1024 * 1024))
+SPOOL_BYTES = int(os.getenv("TTTK_TRANSCRIBE_SPOOL_BYTES", 1024 * 1024))
+
+
+class UploadTooLarge(ValueError):
+    """The audio body is larger than TTTK_TRANSCRIBE_MAX_BYTES."""
+
+
+class TranscriptionBusy(RuntimeError):
+    """Every transcription slot is taken; the client should retry later."""
+
+
+class TranscriptionUnavailable(RuntimeError):
+    """The configured provider can't be created (e.g. its SDK isn't installed)."""
+
+
+def spool_upload(stream: BinaryIO, max_bytes: int = MAX_BYTES) -> Tuple[BinaryIO, str, int]:
+    """Copy `stream` into a spooled temp file in blocks: (file rewound to 0, sha256 hex, size)."""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    digest, size = hashlib.sha256(), 0
+    try:
+        while True:
+            block = stream.read(BLOCK_SIZE)
+            if not block:
+                break
+            size += len(block)
+            if size > max_bytes:
+                raise UploadTooLarge(f"Audio exceeds {max_bytes} bytes")
+            digest.update(block)
+            spooled.write(block)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled, digest.hexdigest(), size
+
+
+# -- providers ----------------------------------------------------------------------
+
+class TranscriptionProvider:
+    """transcribe(audio, filename, content_type) -> text; `audio` is a binary file positioned at 0."""
+    name = "provider"
+    model = ""
+
+    def transcribe(self, audio: BinaryIO, filename: str, content_type: str) -> str:
+        raise NotImplementedError
+
+
+class ElevenLabsProvider(TranscriptionProvider):
+    """ElevenLabs speech-to-text through eleven_api.voice_api (the SDK streams the file)."""
+    name = "elevenlabs"
+
+    def __init__(self, api_key: Optional[str] = None):
+        from eleven_api import voice_api  # imported here: the SDK is only needed once a recording arrives
+        self.client = voice_api(api_key)
+        self.model = self.client.model_id
+
+    def transcribe(self, audio: BinaryIO, filename: str, content_type: str) -> str:
+        text = self.client.transcribe(audio, filename, content_type)
+        if text == self.client.FAILED:
+            raise RuntimeError("ElevenLabs returned no transcription")
+        return text
+
+
+class StubProvider(TranscriptionProvider):
+    """Deterministic local transcripts derived from the audio bytes; no network."""
+    name = "stub"
+    model = "stub-1"
+
+    def __init__(self, delay: Optional[float] = None):
+        self.delay = float(delay if delay is not None else os.getenv("TTTK_TRANSCRIBE_STUB_DELAY", 0))
+        self.calls = 0
+
+    def transcribe(self, audio: BinaryIO, filename: str, content_type: str) -> str:
+        digest, size = hashlib.sha256(), 0
+        for block in iter(lambda: audio.read(BLOCK_SIZE), b""):
+            digest.update(block)
+            size += len(block)
+        if self.delay:
+            time.sleep(self.delay)
+        self.calls += 1
+        return f"stub transcript of {filename} ({size} bytes, {digest.hexdigest()[:12]})"
+
+
+def create_provider(name: Optional[str] = None) -> TranscriptionProvider:
+    name = (name or os.getenv("TTTK_TRANSCRIBE_PROVIDER", "elevenlabs")).lower()
+    if name == "stub":
+        return StubProvider()
+    if name == "elevenlabs":
+        return ElevenLabsProvider()
+    raise ValueError(f"Unknown transcription provider '{name}' (expected elevenlabs or stub)")
+
+
+# -- jobs ----------------------------------------------------------------------------
+
+class TranscriptionJobs:
+    """Bounded worker pool + job table + content-hash transcription cache."""
+
+    def __init__(self, provider: Optional[TranscriptionProvider] = None, cache: Optional[ResponseCache] = None,
+                 workers: Optional[int] = None, max_pending: Optional[int] = None,
+                 job_ttl: Optional[float] = None):
+        self._provider = provider  # None: create_provider() on first use
+        self.cache = cache if cache is not None else ResponseCache(db_path=os.getenv("TTTK_TRANSCRIBE_CACHE_DB", ""))
+        self.workers = int(workers or os.getenv("TTTK_TRANSCRIBE_WORKERS", 2))
+        self.max_pending = int(max_pending or os.getenv("TTTK_TRANSCRIBE_MAX_PENDING", 16))
+        self.job_ttl = float(job_ttl or os.getenv("TTTK_TRANSCRIBE_JOB_TTL", 600))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="transcribe")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.RLock()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._inflight: Dict[str, str] = {}  # sha256 -> job_id of the queued/running job
+        self._stats = {"submitted": 0, "cached": 0, "joined": 0, "completed": 0, "failed": 0, "rejected": 0}
+
+    @property
+    def provider(self) -> TranscriptionProvider:
+        if self._provider is None:
+            with self._lock:
+                if self._provider is None:
+                    try:
+                        self._provider = create_provider()
+                    except Exception as e:
+                        logger.warning(f"Transcription provider unavailable: {e}")
+                        raise TranscriptionUnavailable(f"Transcription provider unavailable: {e}") from e
+        return self._provider
+
+    def cache_key(self, digest: str) -> str:
+        return ResponseCache.key("transcription", self.provider.model, digest, self.provider.name)
+
+    def submit(self, audio: BinaryIO, digest: str, size: int, filename: str = "audio",
+               content_type: str = "application/octet-stream") -> Dict[str, Any]:
+        """Job snapshot: done at once on a cache hit, else queued. Takes ownership of `audio`."""
+        try:
+            key = self.cache_key(digest)
+        except TranscriptionUnavailable:
+            audio.close()
+            raise
+        self._prune()
+        cached = self.cache.get(key)
+        if cached is not _MISS:
+            audio.close()
+            CACHE_EVENTS.inc(cache="transcription", result="hit")
+            with self._lock:
+                return self._new_job(digest, size, status="done", text=cached, cached=True)
+        # joining a running job and starting a new one happen in one critical section, so
+        # identical concurrent uploads can't both start a job
+        with self._lock:
+            job_id = self._inflight.get(digest)
+            if job_id is not None:  # the same recording is already being transcribed
+                self._stats["joined"] += 1
+                audio.close()
+                return dict(self._jobs[job_id])
+            if not self._slots.acquire(blocking=False):
+                self._stats["rejected"] += 1
+                audio.close()
+                raise TranscriptionBusy(f"{self.max_pending} transcriptions already pending")
+            job = self._new_job(digest, size, status="queued")
+            self._inflight[digest] = job["job_id"]
+        CACHE_EVENTS.inc(cache="transcription", result="miss")
+        try:
+            future = self._executor.submit(self._run, job["job_id"], audio, filename, content_type)
+        except Exception as e:  # e.g. RuntimeError once the pool is shut down
+            self._slots.release()
+            audio.close()
+            self._finish(job["job_id"], {"status": "error", "error": str(e)}, "failed")
+            logger.warning(f"Transcription {job['job_id']} not started: {e}")
+            return self.get(job["job_id"])
+        future.add_done_callback(lambda _: self._slots.release())
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until the job finishes (or `timeout` passes), then return its snapshot."""
+        with self._lock:
+            done = self._done.get(job_id)
+        if done is not None:
+            done.wait(timeout)
+        return self.get(job_id)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+            provider = self._provider
+            return {**self._stats, "jobs": statuses, "workers": self.workers, "max_pending": self.max_pending,
+                    "provider": provider.name if provider else os.getenv("TTTK_TRANSCRIBE_PROVIDER", "elevenlabs"),
+                    "model": provider.model if provider else None, "cache": self.cache.stats()}
+
+    # -- internals ------------------------------------------------------------------
+
+    def _new_job(self, digest: str, size: int, status: str, text: Optional[str] = None,
+                 cached: bool = False) -> Dict[str, Any]:
+        """Register a job (lock held by the caller) and return its snapshot."""
+        now = time.time()
+        job = {"job_id": uuid.uuid4().hex, "status": status, "sha256": digest, "bytes": size, "text": text,
+               "error": None, "cached": cached, "created_at": now, "finished_at": now if status == "done" else None}
+        done = threading.Event()
+        if status == "done":
+            done.set()
+        self._jobs[job["job_id"]] = job
+        self._done[job["job_id"]] = done
+        self._stats["cached" if cached else "submitted"] += 1
+        return dict(job)
+
+    def _run(self, job_id: str, audio: BinaryIO, filename: str, content_type: str) -> None:
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = "running"
+        try:
+            with span("transcribe"):
+                text = self.provider.transcribe(audio, filename, content_type)
+            self.cache.put(self.cache_key(job["sha256"]), text)
+            update, outcome = {"status": "done", "text": text}, "completed"
+        except Exception as e:
+            logger.warning(f"Transcription {job_id} failed: {e}")
+            update, outcome = {"status": "error", "error": str(e)}, "failed"
+        finally:
+            audio.close()
+        self._finish(job_id, update, outcome)
+
+    def _finish(self, job_id: str, update: Dict[str, Any], outcome: str) -> None:
+        """Record a job's result, free its digest for new jobs and wake its waiters."""
+        with self._lock:
+            job = self._jobs[job_id]
+            job.update(update, finished_at=time.time())
+            self._stats[outcome] += 1
+            self._inflight.pop(job["sha256"], None)
+            done = self._done[job_id]
+        done.set()
+
+    def _prune(self) -> None:
+        """Forget finished jobs older than job_ttl."""
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["finished_at"] is not None and job["finished_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+                del self._done[job_id]
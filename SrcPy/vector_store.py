@@ -0,0 +1,281 @@
+# vector_store.py
+"""
+Persistent chunk embedding store shared by every worker.
+
+Layout under `root`:
+- meta.json          : dim, model name and the current generation (rewritten only when
+                       the dimension is first set and after a compaction)
+- vectors.<gen>.f32  : float32 matrix of every chunk embedding, appended page by page and
+                       opened as a read-only memory map (zero-copy, shared via the OS page cache)
+- pages.<gen>.log    : append-only JSON lines, one per added page (key, url, row range,
+                       chunk character offsets, markdown content hash); the last line for a
+                       key wins, so a refresh only reads the lines added since the last one
+
+A newer version of a page appends new rows and leaves the old ones dead. Once dead rows
+pass TTTK_VECTOR_COMPACT_RATIO of the matrix, the live rows are copied into the next
+generation's files and meta.json is switched to it; readers follow on their next refresh.
+Appends first cut both files back to what the log has committed, so the bytes of a writer
+that crashed half-way are never mistaken for the next page's rows.
+
+Search is exact and brute force: every query is scoped to one page, so search_page scans
+that page's slice of the memory map (tens to hundreds of rows). There is no FAISS/ANN index;
+a store-wide one would scan or filter far more rows than the page holds.
+"""
+
+from __future__ import annotations
+import json, logging, os, re, threading, time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tttk", "vectors")
+
+
+class FileLock:
+    """
+    Inter-process lock (flock; no-op where fcntl is unavailable). Not thread-safe on its own:
+    hold a threading lock around it, as VectorStore and PageCache do.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        self._fh.close()
+
+
+def file_stamp(path: str) -> Optional[tuple]:
+    """Identity of a file's current version; os.replace gives every write a new inode."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+class VectorStore:
+    """Memory-mapped float32 chunk matrix + append-only page log, compacted when mostly dead."""
+
+    def __init__(self, root: Optional[str] = None, model: str = "",
+                 compact_ratio: Optional[float] = None, compact_min_rows: int = 4096):
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model) or "default"
+        self.root = root or os.path.join(os.getenv("TTTK_VECTOR_STORE_DIR", _DEFAULT_DIR), slug)
+        self.model = model
+        self.compact_ratio = float(compact_ratio if compact_ratio is not None
+                                   else os.getenv("TTTK_VECTOR_COMPACT_RATIO", 0.5))
+        self.compact_min_rows = compact_min_rows
+        os.makedirs(self.root, exist_ok=True)
+        self._meta_path = os.path.join(self.root, "meta.json")
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(os.path.join(self.root, ".lock"))
+        self._meta: Dict[str, Any] = {"dim": 0, "model": model, "generation": 0}
+        self._meta_stamp: Optional[tuple] = None
+        self._reset()
+        with self._file_lock:
+            self._check_layout()
+        self._refresh()
+
+    # ---- pages ------------------------------------------------------------
+
+    def get_page(self, key: str, content_hash: str = "") -> Optional[np.ndarray]:
+        """Zero-copy view of a page's chunk vectors, or None if missing/outdated."""
+        with self._lock:
+            self._refresh()
+            page = self._pages.get(key)
+            if page is None or (content_hash and page.get("content_hash") != content_hash):
+                return None
+            return self._mmap[page["start"]:page["start"] + page["count"]]
+
+    def page_info(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            page = self._pages.get(key)
+            return dict(page) if page is not None else None
+
+    def add_page(self, key: str, embeddings: np.ndarray, *, url: str = "",
+                 offsets: Optional[List[int]] = None, content_hash: str = "") -> None:
+        """Append a page's vectors; a newer version of the same page supersedes the old rows."""
+        vecs = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if vecs.ndim != 2 or not len(vecs):
+            return
+        with self._lock, self._file_lock:
+            self._refresh()
+            if self._meta["dim"] and self._meta["dim"] != vecs.shape[1]:
+                raise ValueError(f"dimension mismatch: store={self._meta['dim']} page={vecs.shape[1]}")
+            page = self._pages.get(key)
+            if page is not None and content_hash and page.get("content_hash") == content_hash:
+                return
+            if not self._meta["dim"]:
+                self._meta["dim"] = vecs.shape[1]
+                self._write_meta()
+
+            # drop whatever a writer that crashed before committing its log line left behind
+            start = self._rows
+            self._truncate(self._vec_path(), start * self._meta["dim"] * 4)
+            self._truncate(self._log_path(), self._log_offset)
+            with open(self._vec_path(), "ab") as f:
+                f.write(vecs.tobytes())
+            record = {"key": key, "url": url, "start": start, "count": len(vecs),
+                      "offsets": list(offsets or []), "content_hash": content_hash, "added_at": time.time()}
+            with open(self._log_path(), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")  # the page exists once this line is complete
+            self._refresh()
+            if self._rows >= self.compact_min_rows and self._rows - self._live > self.compact_ratio * self._rows:
+                self._compact()
+
+    def search_page(self, key: str, query_vec: np.ndarray, top_k: int) -> List[int]:
+        """Top-k chunk indices within one page (L2, exact, on the memory-mapped slice)."""
+        vecs = self.get_page(key)
+        if vecs is None or not len(vecs):
+            return []
+        q = np.asarray(query_vec, dtype=np.float32).reshape(-1)
+        dists = ((vecs - q) ** 2).sum(axis=1)
+        k = min(top_k, len(dists))
+        order = np.argpartition(dists, k - 1)[:k]
+        return order[np.argsort(dists[order])].tolist()
+
+    def compact(self) -> None:
+        """Copy the live rows into a new generation now, whatever the dead fraction."""
+        with self._lock, self._file_lock:
+            self._refresh()
+            self._compact()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            return {
+                "pages": len(self._pages),
+                "rows": self._rows,
+                "dead_rows": self._rows - self._live,
+                "dim": self._meta["dim"],
+                "generation": self._meta["generation"],
+            }
+
+    # ---- internals --------------------------------------------------------
+
+    def _vec_path(self, generation: Optional[int] = None) -> str:
+        gen = self._meta["generation"] if generation is None else generation
+        return os.path.join(self.root, f"vectors.{gen}.f32")
+
+    def _log_path(self, generation: Optional[int] = None) -> str:
+        gen = self._meta["generation"] if generation is None else generation
+        return os.path.join(self.root, f"pages.{gen}.log")
+
+    def _reset(self) -> None:
+        """Forget the parsed log (a new generation is read from its first line)."""
+        self._pages: Dict[str, Dict[str, Any]] = {}
+        self._rows = 0
+        self._live = 0
+        self._log_offset = 0
+        self._mmap: Optional[np.memmap] = None
+
+    def _refresh(self) -> None:
+        """Follow a compaction by another worker, read new log lines and remap the matrix."""
+        stamp = file_stamp(self._meta_path)
+        if stamp is not None and stamp != self._meta_stamp:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["generation"] != self._meta["generation"]:
+                self._reset()
+            self._meta, self._meta_stamp = meta, stamp
+        try:
+            if os.path.getsize(self._log_path()) <= self._log_offset:
+                return
+            with open(self._log_path(), "rb") as f:
+                f.seek(self._log_offset)
+                tail = f.read()
+        except OSError:
+            return
+        end = tail.rfind(b"\n") + 1  # a line without its newline is still being written
+        if not end:
+            return
+        for line in tail[:end].splitlines():
+            record = json.loads(line)
+            old = self._pages.get(record["key"])
+            self._live += record["count"] - (old["count"] if old else 0)
+            self._pages[record["key"]] = record
+            self._rows = record["start"] + record["count"]
+        self._log_offset += end
+        if self._rows and self._meta["dim"]:
+            self._mmap = np.memmap(self._vec_path(), dtype=np.float32, mode="r",
+                                   shape=(self._rows, self._meta["dim"]))
+
+    def _compact(self) -> None:
+        """Write the live rows and their log as the next generation, then switch meta.json (locks held)."""
+        old_gen, new_gen = self._meta["generation"], self._meta["generation"] + 1
+        new_vec, new_log = self._vec_path(new_gen), self._log_path(new_gen)
+        start = 0
+        with open(new_vec, "wb") as vf, open(new_log, "w", encoding="utf-8") as lf:
+            for page in sorted(self._pages.values(), key=lambda p: p["start"]):
+                vf.write(np.ascontiguousarray(self._mmap[page["start"]:page["start"] + page["count"]]).tobytes())
+                lf.write(json.dumps({**page, "start": start}) + "\n")
+                start += page["count"]
+            for f in (vf, lf):  # on disk before meta.json points at them
+                f.flush()
+                os.fsync(f.fileno())
+        dead = self._rows - self._live
+        self._meta["generation"] = new_gen
+        self._write_meta()  # readers switch to the new files from here on
+        self._reset()
+        self._refresh()
+        for path in (self._vec_path(old_gen), self._log_path(old_gen)):
+            try:
+                os.remove(path)  # workers still mapping the old matrix keep their view until they refresh
+            except OSError:
+                pass
+        logger.info(f"Vector store compacted: {dead} dead rows dropped, {start} live rows in generation {new_gen}")
+
+    def _write_meta(self) -> None:
+        tmp = f"{self._meta_path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f)
+        os.replace(tmp, self._meta_path)
+        self._meta_stamp = file_stamp(self._meta_path)
+
+    @staticmethod
+    def _truncate(path: str, size: int) -> None:
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _check_layout(self) -> None:
+        """
+        Move the single-matrix layout's files aside (*.old, never deleted) and remove the files
+        of unfinished compactions (file lock held).
+        """
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                generation = json.load(f).get("generation")
+        except (OSError, ValueError):
+            generation = None
+        if generation is None and os.path.exists(self._meta_path):
+            moved = []
+            for name in ("meta.json", "vectors.f32", "index.faiss"):
+                path = os.path.join(self.root, name)
+                if os.path.exists(path):
+                    os.replace(path, path + ".old")
+                    moved.append(name)
+            logger.warning(f"Vector store {self.root} used the single-matrix layout: moved {', '.join(moved)} "
+                           f"to *.old (no longer read; delete them when done). Pages are re-encoded on their next visit")
+        keep = {f"vectors.{generation}.f32", f"pages.{generation}.log"}
+        stale = [name for name in os.listdir(self.root)
+                 if name not in keep and re.fullmatch(r"vectors\.\d+\.f32|pages\.\d+\.log", name)]
+        for name in stale:
+            os.remove(os.path.join(self.root, name))
+        if stale:
+            logger.info(f"Removed files of an unfinished compaction: {', '.join(sorted(stale))}")
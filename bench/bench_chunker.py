@@ -0,0 +1,92 @@
+# bench_chunker.py
+"""
+Throughput and memory of the markdown chunker on large pages.
+
+    python bench/bench_chunker.py [page.md ...] [--sizes 0.1 1 10] [--max-tokens 320] [--overlap 0]
+
+Without files, synthetic markdown (headings, paragraphs, long run-on paragraphs) is generated
+at each size in MB. For each input:
+- mb_per_sec / chunks_per_sec : iterating textify.iter_chunks to the end
+- peak_kb                     : tracemalloc peak while iterating (chunks are consumed, not kept);
+                                flat across sizes means memory follows the block, not the page
+- list_peak_kb                : the same for split_markdown, which keeps every chunk
+"""
+
+import argparse, json, os, random, sys, time, tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SrcPy"))
+import textify
+
+_WORDS = ("retrieval context chunk token embedding page section model query answer latency "
+          "cache vector index document paragraph heading sentence offset budget").split()
+
+
+def synthetic_markdown(mb: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, size, n = [], 0, 0
+    while size < mb * 1e6:
+        n += 1
+        if n % 12 == 1:
+            block = f"{'#' * rng.randint(1, 3)} Section {n}"
+        else:
+            sentences = rng.randint(2, 60 if n % 7 == 0 else 8)
+            block = " ".join(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(6, 20))).capitalize() + "."
+                             for _ in range(sentences))
+        parts.append(block)
+        size += len(block) + 2
+    return "\n\n".join(parts)
+
+
+def measure(md: str, max_tokens: int, overlap: int) -> dict:
+    list(textify.iter_chunks(md[:20000], max_tokens, overlap))  # load tokenizer, warm caches
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = 0
+    for _ in textify.iter_chunks(md, max_tokens, overlap):
+        chunks += 1
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    textify.split_markdown(md, max_tokens, overlap)
+    _, list_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    mb = len(md) / 1e6
+    return {"mb": round(mb, 2), "chunks": chunks, "seconds": round(seconds, 3),
+            "mb_per_sec": round(mb / seconds, 2), "chunks_per_sec": round(chunks / seconds, 1),
+            "peak_kb": round(peak / 1024, 1), "list_peak_kb": round(list_peak / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Markdown chunker throughput / memory")
+    parser.add_argument("files", nargs="*", help="Markdown files (default: synthetic pages)")
+    parser.add_argument("--sizes", nargs="+", type=float, default=[0.1, 1, 10], help="Synthetic sizes in MB")
+    parser.add_argument("--max-tokens", type=int, default=320)
+    parser.add_argument("--overlap", type=int, default=0)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    inputs = []
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            inputs.append((os.path.basename(path), f.read()))
+    if not inputs:
+        inputs = [(f"synthetic-{mb}MB", synthetic_markdown(mb)) for mb in args.sizes]
+
+    textify._load_tokenizer()
+    results = {"tokenizer": "tiktoken" if textify._TOK else "approx (chars/4)", "runs": {}}
+    print(f"tokenizer: {results['tokenizer']}")
+    for name, md in inputs:
+        results["runs"][name] = measure(md, args.max_tokens, args.overlap)
+        print(f"{name:20s} {json.dumps(results['runs'][name])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
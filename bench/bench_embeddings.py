@@ -0,0 +1,108 @@
+# bench_embeddings.py
+"""
+Compare embedding backends against the sentence-transformers baseline.
+
+    python bench/bench_embeddings.py page.html other.md https://example.com/docs \
+        --backends sentence-transformers onnx onnx-int8 torch-int8 --threads 4 --top-k 5
+
+For every backend:
+- chunks_per_sec       : encoding throughput over all chunks (after one warm-up batch)
+- topk_agreement       : mean |top-k(backend) & top-k(baseline)| / k over the queries
+- top1_agreement       : share of queries whose best chunk matches the baseline's
+- mean_cosine_to_base  : mean cosine between a chunk's vector and its baseline vector
+Queries are the first sentence of evenly spaced chunks (or --queries, one per line).
+The first backend listed is the baseline.
+"""
+
+import argparse, json, os, sys, time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SrcPy"))
+import textify
+from embedding_backend import BACKENDS, create_backend
+
+
+def load_chunks(sources, max_tokens):
+    chunks = []
+    for source in sources:
+        if source.endswith((".md", ".txt")):
+            with open(source, "r", encoding="utf-8") as f:
+                markdown = f.read()
+        else:
+            markdown = textify.html_to_markdown(source)["markdown"]
+        chunks.extend(textify.split_markdown(markdown, max_tokens=max_tokens))
+    return chunks
+
+
+def sample_queries(chunks, n):
+    step = max(1, len(chunks) // n)
+    queries = []
+    for chunk in chunks[::step][:n]:
+        text = " ".join(chunk.replace("#", " ").split())
+        queries.append(text.split(". ")[0][:200])
+    return queries
+
+
+def top_k(chunk_vecs, query_vecs, k):
+    return np.argsort(-(query_vecs @ chunk_vecs.T), axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend throughput and top-k agreement")
+    parser.add_argument("sources", nargs="+", help="URLs, HTML files or markdown/text files")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--max-tokens", type=int, default=320)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--num-queries", type=int, default=50)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.sources, args.max_tokens)
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = sample_queries(chunks, args.num_queries)
+    k = min(args.top_k, len(chunks))
+    print(f"{len(chunks)} chunks, {len(queries)} queries, top-k={k}")
+
+    results, base = {}, None
+    for kind in args.backends:
+        try:
+            backend = create_backend(kind, batch_size=args.batch_size, threads=args.threads)
+        except Exception as e:
+            results[kind] = {"error": str(e)}
+            print(f"{kind:22s} unavailable: {e}")
+            continue
+        backend.encode(chunks[:args.batch_size])  # warm-up
+        started = time.perf_counter()
+        chunk_vecs = backend.encode(chunks)
+        seconds = time.perf_counter() - started
+        query_vecs = backend.encode(queries)
+        ranked = top_k(chunk_vecs, query_vecs, k)
+
+        row = {**backend.info(), "chunks_per_sec": round(len(chunks) / seconds, 1),
+               "encode_seconds": round(seconds, 3)}
+        if base is None:
+            base = {"kind": kind, "chunk_vecs": chunk_vecs, "ranked": ranked}
+        else:
+            overlap = [len(set(a) & set(b)) / k for a, b in zip(ranked, base["ranked"])]
+            row["baseline"] = base["kind"]
+            row["topk_agreement"] = round(float(np.mean(overlap)), 4)
+            row["top1_agreement"] = round(float(np.mean(ranked[:, 0] == base["ranked"][:, 0])), 4)
+            if chunk_vecs.shape == base["chunk_vecs"].shape:
+                row["mean_cosine_to_base"] = round(float(np.mean(np.sum(chunk_vecs * base["chunk_vecs"], axis=1))), 5)
+        results[kind] = row
+        print(f"{kind:22s} {json.dumps({key: v for key, v in row.items() if key not in ('model', 'onnx_path')})}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
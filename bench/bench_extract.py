@@ -0,0 +1,131 @@
+# bench_extract.py
+"""
+HTML extraction: textify's single-parse path vs. the old parse / serialize / re-parse chain.
+
+    python bench/bench_extract.py [page.html ...] [--repeats 5]
+
+The old path (kept here only as the reference) parsed the page with BeautifulSoup, serialized
+it for readability to parse again, and had html2text parse readability's HTML a third time.
+textify now parses once with lxml, strips script/style in the tree, lets readability score
+that tree and renders markdown from the article subtree directly.
+
+Every document (the HTML corpus in bench/corpus, the edge cases below and any pages given
+on the command line) must produce the same title and markdown on both paths; the exit
+status is 1 on any difference. Timings are p50 ms over --repeats runs per path.
+"""
+
+import argparse, gzip, json, os, re, sys, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "corpus")
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "SrcPy"))
+
+import html2text
+from bs4 import BeautifulSoup
+from readability import Document
+import textify
+
+
+def legacy_html_page(html: str) -> dict:
+    """textify._html_page before the single-parse path (kept here only as the reference)."""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "noscript", "iframe", "svg"]):
+        tag.decompose()
+    cleaned_html = str(soup)
+    doc = Document(cleaned_html)
+    title = (doc.short_title() or (soup.title.string if soup.title else "")).strip()
+    main_html = doc.summary(html_partial=True) or (soup.body.decode() if soup.body else cleaned_html)
+    h2t = html2text.HTML2Text()
+    h2t.ignore_links = False
+    h2t.ignore_images = True
+    h2t.body_width = 0
+    md = h2t.handle(main_html)
+    md = re.sub(r"[ \t]+\n", "\n", md)
+    md = re.sub(r"\n{3,}", "\n\n", md).strip()
+    md = re.sub(r"\[([^\]]+)\]\(\s*\)", r"\1", md)
+    return {"title": title, "markdown": md, "etag": "", "last_modified": ""}
+
+
+_PARAGRAPH = ("Retrieval context is built from the page the user is reading, chunked by headings "
+              "and ranked against the highlighted selection before the prompt is assembled. ")
+
+# Markup the generated corpus doesn't exercise: entities, comments, emphasis next to text,
+# hidden elements, nested lists, code, tables, inline SVG and a page too short for readability
+EDGE_CASES = {
+    "entities": f"<html><head><title>A &amp; B &mdash; Entities</title></head><body><article>"
+                f"<p>{_PARAGRAPH}Fish &amp; chips &lt;tag&gt; 5 &gt; 3, caf&eacute;&nbsp;au lait, &#8220;quoted&#8221;"
+                f" &rsquo;s a*b_c [x](y) #hash</p><p>{_PARAGRAPH * 2}</p></article></body></html>",
+    "inline": f"<html><body><div id='content'><h1>Heading <em>one</em></h1><p>{_PARAGRAPH}<b>bold</b>text"
+              f" <i> spaced </i>, <strong>strong</strong>. <a href='/x?a=1&amp;b=2' title='T &quot;q&quot;'>link"
+              f"</a><!-- comment -->after<br>line<br/>break</p><p>{_PARAGRAPH * 2}<code>x &lt; y</code></p>"
+              f"<pre>  pre &amp; formatted\n    code</pre></div></body></html>",
+    "hidden": f"<html><body><main><p>{_PARAGRAPH * 2}</p><p hidden>hidden text</p>"
+              f"<p style='display:none'>invisible</p><noscript>enable js</noscript>"
+              f"<svg><text>svg label</text></svg>tail after svg<iframe src='/ad'></iframe>"
+              f"<ul><li>one<ul><li>nested</li></ul></li><li>two</li></ul>"
+              f"<ol start='3'><li>three</li></ol><table><tr><th>k</th><th>v</th></tr><tr><td>a</td>"
+              f"<td>1</td></tr></table><hr><blockquote>{_PARAGRAPH}</blockquote></main></body></html>",
+    "short": "<html><head><title>Short | Site</title></head><body><p>Only a line.</p></body></html>",
+    "fragment": f"<div><p>{_PARAGRAPH * 3}</p><script>var x = '</p>';</script><style>p {{}}</style></div>",
+}
+
+
+def load_corpus():
+    with open(os.path.join(CORPUS, "manifest.json")) as f:
+        manifest = json.load(f)
+    docs = {}
+    for name, entry in manifest.items():
+        if entry["kind"] != "html":
+            continue
+        path = os.path.join(CORPUS, entry["file"])
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rb") as f:
+            docs[name] = f.read().decode("utf-8")
+    return docs
+
+
+def p50_ms(fn, html, repeats):
+    fn(html)  # warm-up
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn(html)
+        times.append((time.perf_counter() - started) * 1000)
+    return sorted(times)[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-parse HTML extraction: equivalence and speedup")
+    parser.add_argument("pages", nargs="*", help="Extra HTML files to compare")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    docs = {**load_corpus(), **EDGE_CASES}
+    for path in args.pages:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            docs[os.path.basename(path)] = f.read()
+
+    mismatches = 0
+    print(f"{'document':16s} {'KB':>8s} {'legacy ms':>10s} {'single ms':>10s} {'speedup':>8s}  output")
+    for name, html in docs.items():
+        old, new = legacy_html_page(html), textify._html_page(html)
+        same = old == new
+        mismatches += not same
+        legacy, single = p50_ms(legacy_html_page, html, args.repeats), p50_ms(textify._html_page, html, args.repeats)
+        print(f"{name:16s} {len(html) / 1024:8.1f} {legacy:10.2f} {single:10.2f} {legacy / single:7.2f}x  "
+              f"{'identical' if same else 'DIFFERENT'}")
+        if not same:
+            for key in ("title", "markdown"):
+                if old[key] != new[key]:
+                    at = next((i for i, (a, b) in enumerate(zip(old[key], new[key])) if a != b),
+                              min(len(old[key]), len(new[key])))
+                    print(f"    {key} differs at {at}: {old[key][max(0, at - 40):at + 40]!r}\n"
+                          f"    {' ' * len(key)}          vs {new[key][max(0, at - 40):at + 40]!r}")
+    if mismatches:
+        print(f"\n{mismatches} document(s) differ from the legacy extraction")
+        sys.exit(1)
+    print("\nall documents identical to the legacy extraction")
+
+
+if __name__ == "__main__":
+    main()
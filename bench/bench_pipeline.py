@@ -0,0 +1,177 @@
+# bench_pipeline.py
+"""
+Stage-level benchmark of the textify pipeline on the checked-in corpus (bench/corpus), offline.
+
+    python bench/bench_pipeline.py [--docs html-small pdf-medium ...] [--repeats 5]
+    python bench/bench_pipeline.py --save-baseline bench/baseline_pipeline.json
+    python bench/bench_pipeline.py --baseline bench/baseline_pipeline.json [--tolerance 0.25]
+
+Stages, each timed on its own with the previous stage's output as input:
+- extract : HTML -> markdown (_html_page via html_to_markdown) or PDF -> markdown (pdf_page)
+- chunk   : chunk_markdown
+- anchor  : anchor_indices(selection, chunks)
+- rank    : choose_chunk_indices(selection, chunks), BM25 index built fresh each repeat
+- context : build_context(selection, chunks) under the default token budget
+Per stage: p50 / p95 / max latency in ms over --repeats runs (raise it for a meaningful p95)
+and the tracemalloc peak of one extra run (kept apart so tracing doesn't skew the timings);
+extract also reports MB/s of input and chunk reports chunks/sec.
+
+Ranking runs with TTTK_RANKER=bm25 unless --ranker says otherwise, so no model is
+downloaded. With --baseline, a stage regresses when its p50 (or peak memory) is more than
+--tolerance above the baseline's and by more than --min-ms; the exit status is 1 then.
+Baselines are machine-specific: record them on the machine you compare on.
+"""
+
+import argparse, gc, gzip, json, os, sys, time, tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORPUS = os.path.join(HERE, "corpus")
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "SrcPy"))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def load_document(entry):
+    path = os.path.join(CORPUS, entry["file"])
+    if entry["kind"] == "pdf":
+        with open(path, "rb") as f:
+            return f.read()
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        return f.read().decode("utf-8")
+
+
+def stages(textify, entry, document, max_tokens, top_k):
+    """(name, fn) pairs; each fn returns the stage output, fed to the next stage."""
+    from io import BytesIO
+    selection = entry["selection"]
+    state = {}
+
+    def extract():
+        if entry["kind"] == "pdf":
+            page = textify.pdf_page(BytesIO(document), entry["file"])
+        else:
+            page = textify.html_to_markdown(document)
+        state["markdown"] = page["markdown"]
+        return page
+
+    def chunk():
+        chunked = textify.chunk_markdown(state["markdown"], max_tokens)
+        state["chunks"], state["pages"] = [c["text"] for c in chunked], [c["page"] for c in chunked]
+        return state["chunks"]
+
+    def anchor():
+        return textify.anchor_indices(selection, state["chunks"])
+
+    def rank():
+        textify._bm25_cache.clear()  # time the index build, as for a page seen the first time
+        return textify.choose_chunk_indices(selection, state["chunks"], top_k=top_k)
+
+    def context():
+        textify._bm25_cache.clear()
+        return textify.build_context(selection, state["chunks"], top_k=top_k,
+                                     pages=state["pages"])
+
+    return [("extract", extract), ("chunk", chunk), ("anchor", anchor), ("rank", rank), ("context", context)]
+
+
+def measure(fn, repeats):
+    fn()  # warm-up: imports, tokenizer, regex caches
+    times = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"p50_ms": round(percentile(times, 0.5), 3), "p95_ms": round(percentile(times, 0.95), 3),
+            "max_ms": round(max(times), 3), "peak_kb": round(peak / 1024, 1), "runs": repeats}
+
+
+def run_document(textify, name, entry, repeats, max_tokens, top_k):
+    document = load_document(entry)
+    results = {}
+    for stage, fn in stages(textify, entry, document, max_tokens, top_k):
+        row = measure(fn, repeats)
+        if stage == "extract":
+            row["mb_per_sec"] = round(entry["bytes"] / 1e6 / (row["p50_ms"] / 1000), 2)
+        if stage == "chunk":
+            row["chunks"] = len(fn())
+            row["chunks_per_sec"] = round(row["chunks"] / (row["p50_ms"] / 1000), 1)
+        results[stage] = row
+        print(f"  {stage:8s} {json.dumps(row)}")
+    return results
+
+
+def compare(results, baseline, tolerance, min_ms):
+    """Human-readable regressions of `results` against `baseline` (same doc/stage layout)."""
+    regressions = []
+    for doc, doc_stages in results["docs"].items():
+        for stage, row in doc_stages.items():
+            base = baseline.get("docs", {}).get(doc, {}).get(stage)
+            if base is None:
+                continue
+            slower = row["p50_ms"] - base["p50_ms"]
+            if slower > min_ms and row["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+                regressions.append(f"{doc}/{stage}: p50 {base['p50_ms']} -> {row['p50_ms']} ms "
+                                   f"(+{slower / base['p50_ms']:.0%})")
+            if base["peak_kb"] > 64 and row["peak_kb"] > base["peak_kb"] * (1 + tolerance):
+                regressions.append(f"{doc}/{stage}: peak {base['peak_kb']} -> {row['peak_kb']} KB "
+                                   f"(+{row['peak_kb'] / base['peak_kb'] - 1:.0%})")
+    return regressions
+
+
+def main():
+    with open(os.path.join(CORPUS, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    parser = argparse.ArgumentParser(description="Per-stage textify benchmark on the offline corpus")
+    parser.add_argument("--docs", nargs="+", choices=list(manifest), default=list(manifest))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--max-tokens", type=int, default=320)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--ranker", default="bm25", choices=["bm25", "hybrid", "vector"])
+    parser.add_argument("--baseline", help="Compare against this baseline JSON; exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="Write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / memory growth (0.25 = 25%%)")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="Ignore p50 differences smaller than this")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    os.environ["TTTK_RANKER"] = args.ranker
+    import textify
+    textify._load_tokenizer()
+    results = {"tokenizer": "tiktoken" if textify._TOK else "approx (chars/4)", "ranker": args.ranker,
+               "max_tokens": args.max_tokens, "top_k": args.top_k, "docs": {}}
+    print(f"tokenizer: {results['tokenizer']}, ranker: {args.ranker}")
+    for name in args.docs:
+        print(name)
+        results["docs"][name] = run_document(textify, name, manifest[name], args.repeats, args.max_tokens, args.top_k)
+
+    for path in filter(None, (args.json, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("tokenizer") != results["tokenizer"] or baseline.get("ranker") != results["ranker"]:
+            print(f"note: baseline used tokenizer={baseline.get('tokenizer')}, ranker={baseline.get('ranker')}")
+        regressions = compare(results, baseline, args.tolerance, args.min_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nno regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench_ranker.py
+"""
+Lexical ranking without an embedding model: BM25 inverted index vs. the old keyword scorer.
+
+    python bench/bench_ranker.py [page.md ...] [--chunks 200 2000 20000] [--queries 200] [--top-k 5]
+
+Each query is a handful of words drawn from one target chunk (plus common filler words);
+recall@k is how often the target chunk is ranked in the top k. Timings are per query;
+bm25_build_ms is the one-off index build per page.
+"""
+
+import argparse, json, os, random, re, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SrcPy"))
+import textify
+from bm25 import BM25Index
+
+
+def legacy_keyword_score(query: str, text: str) -> float:
+    """The scorer textify used before BM25 (kept here only as the baseline)."""
+    q = set(re.findall(r"\w+", query.lower()))
+    t = re.findall(r"\w+", text.lower())
+    if not q or not t: return 0.0
+    hits = sum(t.count(w) for w in q)
+    cov = len({w for w in q if w in t}) / max(1, len(q))
+    return hits / max(1, len(t)) + 0.2 * cov
+
+
+def legacy_rank(query, chunks, top_k):
+    scored = sorted(((legacy_keyword_score(query, c), i) for i, c in enumerate(chunks)), reverse=True)
+    return [i for s, i in scored[:top_k] if s > 0]
+
+
+_COMMON = "the of and to in is that for with as on by this are be".split()
+
+
+def synthetic_chunks(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    vocab = [f"term{i}" for i in range(max(500, n * 5))]
+    return [" ".join(rng.choice(_COMMON) if rng.random() < 0.5 else rng.choice(vocab) for _ in range(120))
+            for _ in range(n)]
+
+
+def make_queries(chunks, n, seed=1):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        target = rng.randrange(len(chunks))
+        words = [w for w in re.findall(r"\w+", chunks[target].lower()) if w not in _COMMON]
+        if len(words) < 3:
+            continue
+        queries.append((" ".join(rng.sample(words, 3) + rng.sample(_COMMON, 3)), target))
+    return queries
+
+
+def evaluate(name, chunks, queries, top_k, legacy_limit):
+    row = {"chunks": len(chunks), "queries": len(queries)}
+    started = time.perf_counter()
+    index = BM25Index(chunks)
+    row["bm25_build_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    started, hits = time.perf_counter(), 0
+    for q, target in queries:
+        hits += target in [i for i, _ in index.search(q, top_k)]
+    row["bm25_ms_per_query"] = round((time.perf_counter() - started) * 1000 / len(queries), 3)
+    row["bm25_recall_at_k"] = round(hits / len(queries), 3)
+
+    legacy_queries = queries[:legacy_limit]
+    started, hits = time.perf_counter(), 0
+    for q, target in legacy_queries:
+        hits += target in legacy_rank(q, chunks, top_k)
+    row["legacy_ms_per_query"] = round((time.perf_counter() - started) * 1000 / len(legacy_queries), 3)
+    row["legacy_recall_at_k"] = round(hits / len(legacy_queries), 3)
+    row["speedup"] = round(row["legacy_ms_per_query"] / max(row["bm25_ms_per_query"], 1e-6), 1)
+    print(f"{name:18s} {json.dumps(row)}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BM25 vs legacy keyword ranking")
+    parser.add_argument("files", nargs="*", help="Markdown files (default: synthetic pages)")
+    parser.add_argument("--chunks", nargs="+", type=int, default=[200, 2000, 20000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--legacy-queries", type=int, default=20, help="The legacy scorer is slow; cap its queries")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.files:
+        with open(path, "r", encoding="utf-8") as f:
+            pages.append((os.path.basename(path), textify.split_markdown(f.read(), 320)))
+    if not pages:
+        pages = [(f"synthetic-{n}", synthetic_chunks(n)) for n in args.chunks]
+
+    results = {name: evaluate(name, chunks, make_queries(chunks, args.queries), args.top_k, args.legacy_queries)
+               for name, chunks in pages}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
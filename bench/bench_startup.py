@@ -0,0 +1,75 @@
+# bench_startup.py
+"""
+Startup / import cost of the backend.
+
+    python bench/bench_startup.py [--runs 5] [--json out.json]
+
+Each measurement runs in a fresh interpreter so nothing is already imported:
+- import_textify   : `import textify` (should not pull in torch / sentence_transformers / faiss)
+- import_get_net   : `import get_net` (everything start_server needs before binding the socket)
+- first_response   : import get_net + one request through the Flask test client
+- model_warm_up    : textify.warm_up() cold (tokenizer, embedding model, faiss, vector store)
+Peak RSS is ru_maxrss of the child process.
+"""
+
+import argparse, json, os, statistics, subprocess, sys
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SrcPy")
+
+_PROBE = r"""
+import json, resource, sys, time
+sys.path.insert(0, {src!r})
+t0 = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - t0
+heavy = [m for m in ("torch", "sentence_transformers", "faiss") if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  "heavy_modules": heavy}}))
+"""
+
+CASES = {
+    "import_textify": "import textify",
+    "import_get_net": "import get_net",
+    "first_response": "import get_net\nget_net.app.test_client().delete('/api/chat/delete/none')",
+    "model_warm_up": "import textify\ntextify.warm_up()",
+}
+
+
+def run_case(body: str) -> dict:
+    out = subprocess.run([sys.executable, "-c", _PROBE.format(src=SRC, body=body)],
+                         capture_output=True, text=True, cwd=SRC,
+                         env={**os.environ, "TTTK_WARM_MODELS": "0"})
+    if out.returncode != 0:
+        return {"error": out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "failed"}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure backend import and startup cost")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for name, body in CASES.items():
+        samples = [run_case(body) for _ in range(args.runs)]
+        ok = [s for s in samples if "error" not in s]
+        if not ok:
+            results[name] = {"error": samples[0]["error"]}
+        else:
+            seconds = [s["seconds"] for s in ok]
+            results[name] = {
+                "median_seconds": round(statistics.median(seconds), 4),
+                "min_seconds": round(min(seconds), 4),
+                "peak_rss_mb": round(max(s["peak_rss_mb"] for s in ok), 1),
+                "heavy_modules": ok[-1]["heavy_modules"],
+            }
+        print(f"{name:16s} {json.dumps(results[name])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# make_corpus.py
+"""
+Regenerate the offline benchmark corpus in bench/corpus (deterministic, no network).
+
+    python bench/make_corpus.py
+
+- small / medium / huge .html : article pages with navigation, scripts, styles, headings,
+  lists, tables and a footer, like a saved web page (huge is gzipped to keep the repo light)
+- small / medium / huge .pdf  : text PDFs of 3 / 40 / 250 pages (Helvetica, Flate streams)
+- REAL_PAGES                  : real pages saved as shipped (a Node.js API docs page, the
+  table-heavy rustc platform-support page, a rustdoc book chapter as the prose page and a
+  typeset paper PDF with CJK text); they are checked in as-is, never regenerated
+manifest.json lists each document with a selection taken from its middle, which the
+benchmarks use as the user's highlighted text. The files are checked in; only rerun
+this when the corpus itself should change (and re-record the baselines afterwards).
+Sources and licenses of the real pages are in their manifest entries and in NOTICE.
+"""
+
+import gzip, json, os, random, zlib
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+
+_WORDS = ("retrieval context chunk token embedding page section model query answer latency cache "
+          "vector index document paragraph heading sentence offset budget network protocol browser "
+          "extension server request response stream worker thread memory throughput benchmark "
+          "selection summary history conversation learning curriculum definition topic mood").split()
+
+# Real pages: file in bench/corpus, where it came from, its license and a selection from its middle
+REAL_PAGES = {
+    "real-docs": {"file": "node-events.html.gz", "kind": "html", "license": "MIT",
+                  "source": "https://nodejs.org/api/events.html (Node.js v20.19.5 docs)",
+                  "selection": "Installing a listener using this symbol does not change the behavior once "
+                               "an 'error' event is emitted."},
+    "real-table": {"file": "rustc-platform-support.html", "kind": "html", "license": "MIT OR Apache-2.0",
+                   "source": "https://doc.rust-lang.org/1.90.0/rustc/platform-support.html",
+                   "selection": "mipsel-unknown-linux-musl MIPS (little endian) Linux with musl 1.2.3"},
+    "real-article": {"file": "rustdoc-what-to-include.html", "kind": "html", "license": "MIT OR Apache-2.0",
+                     "source": "https://doc.rust-lang.org/1.90.0/rustdoc/write-documentation/what-to-include.html",
+                     "selection": "In order to help both your audience and your test suite, this example "
+                                  "needs some additional code:"},
+    "real-pdf": {"file": "typeprof-ppl2019.pdf", "kind": "pdf", "pages": 19, "license": "MIT",
+                 "source": "typeprof 0.15.2 gem, doc/ppl2019.pdf (PPL 2019 paper, Japanese)",
+                 "selection": "Steep は，プログラマによって与えられたシグネチャに対する Ruby プログラムの整合性を検査\n"
+                              "するツールである．"},
+}
+
+SIZES = {"small": 12, "medium": 120, "huge": 1200}      # HTML sections
+PDF_PAGES = {"small": 3, "medium": 40, "huge": 250}
+
+
+def sentence(rng: random.Random) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(rng.randint(8, 22))).capitalize() + "."
+
+
+def paragraph(rng: random.Random) -> str:
+    return " ".join(sentence(rng) for _ in range(rng.randint(3, 8)))
+
+
+def make_html(sections: int, seed: int):
+    rng = random.Random(seed)
+    body, paragraphs = [], []
+    for n in range(1, sections + 1):
+        body.append(f"<h2>Section {n}: {sentence(rng)[:40]}</h2>")
+        for _ in range(rng.randint(2, 5)):
+            p = paragraph(rng)
+            paragraphs.append(p)
+            body.append(f'<p>{p} <a href="/ref/{n}">reference {n}</a></p>')
+        if n % 4 == 0:
+            body.append("<ul>" + "".join(f"<li>{sentence(rng)}</li>" for _ in range(5)) + "</ul>")
+        if n % 9 == 0:
+            rows = "".join(f"<tr><td>{rng.choice(_WORDS)}</td><td>{rng.randint(1, 999)}</td></tr>" for _ in range(6))
+            body.append(f"<table><tr><th>name</th><th>value</th></tr>{rows}</table>")
+    nav = "".join(f'<li><a href="/p/{i}">{rng.choice(_WORDS)}</a></li>' for i in range(40))
+    html = (
+        "<!DOCTYPE html><html><head><title>Benchmark article</title>"
+        "<style>body{font-family:sans-serif} .nav li{display:inline}</style>"
+        "<script>window.analytics = {track: function(){}};</script></head><body>"
+        f'<nav class="nav"><ul>{nav}</ul></nav>'
+        f"<article><h1>Benchmark article</h1>{''.join(body)}</article>"
+        '<aside class="sidebar"><h3>Related</h3><p>Other pages you may like.</p></aside>'
+        "<footer><p>Copyright. All rights reserved.</p></footer>"
+        "<script>console.log('loaded');</script></body></html>"
+    )
+    return html, paragraphs[len(paragraphs) // 2].split(". ")[0] + "."
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages: int, seed: int):
+    """A minimal text-only PDF: one content stream of wrapped Helvetica lines per page."""
+    rng = random.Random(seed)
+    page_lines, sentences = [], []
+    for _ in range(pages):
+        lines, words = [], []
+        for _ in range(6):
+            s = sentence(rng)
+            sentences.append(s)
+            words.extend(s.split())
+        while words:
+            lines.append(" ".join(words[:14]))
+            words = words[14:]
+        page_lines.append(lines)
+
+    objects = {1: b"<< /Type /Catalog /Pages 2 0 R >>",
+               3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for i, lines in enumerate(page_lines):
+        page_id, content_id = 4 + 2 * i, 5 + 2 * i
+        kids.append(f"{page_id} 0 R")
+        ops = "BT /F1 10 Tf 14 TL 50 790 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in lines) + " ET"
+        stream = zlib.compress(ops.encode("latin-1"))
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        objects[content_id] = (f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+                               + stream + b"\nendstream")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>".encode()
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += f"{number} 0 obj\n".encode() + objects[number] + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offsets[n]:010d} 00000 n \n" for n in sorted(objects)).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out), sentences[len(sentences) // 2]
+
+
+def main():
+    os.makedirs(CORPUS, exist_ok=True)
+    manifest = {}
+    for seed, (size, sections) in enumerate(SIZES.items()):
+        html, selection = make_html(sections, seed)
+        name = f"{size}.html.gz" if size == "huge" else f"{size}.html"
+        data = html.encode("utf-8")
+        with open(os.path.join(CORPUS, name), "wb") as f:
+            f.write(gzip.compress(data, mtime=0) if name.endswith(".gz") else data)
+        manifest[f"html-{size}"] = {"file": name, "kind": "html", "bytes": len(data), "selection": selection}
+    for seed, (size, pages) in enumerate(PDF_PAGES.items(), 10):
+        pdf, selection = make_pdf(pages, seed)
+        name = f"{size}.pdf"
+        with open(os.path.join(CORPUS, name), "wb") as f:
+            f.write(pdf)
+        manifest[f"pdf-{size}"] = {"file": name, "kind": "pdf", "bytes": len(pdf), "pages": pages,
+                                   "selection": selection}
+    for name, entry in REAL_PAGES.items():
+        path = os.path.join(CORPUS, entry["file"])
+        with (gzip.open if path.endswith(".gz") else open)(path, "rb") as f:
+            manifest[name] = {"file": entry["file"], "kind": entry["kind"], "bytes": len(f.read()),
+                              **{k: v for k, v in entry.items() if k not in ("file", "kind")}}
+    with open(os.path.join(CORPUS, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    for name, entry in manifest.items():
+        print(f"{name:12s} {entry['file']:28s} {entry['bytes'] / 1024:9.1f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,29 @@
 #!/usr/bin/env python3
 """
 Startup script for the TTTM chatbot server
+
+    python start_server.py                      # run the server
+    python start_server.py ingest URL|FILE ...  # pre-warm the page cache
 """
 
+import argparse
+import json
 import os
 import sys
 from dotenv import load_dotenv
 
+# Before importing SrcPy: its modules read their TTTK_* settings at import time
+load_dotenv()
+
 # Add the current directory to Python path so we can import from SrcPy
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from SrcPy.get_net import app, conversation_manager
+from SrcPy.get_net import (app, conversation_manager, context_executor, summary_executor, chat_client,
+                          transcription_jobs, CONTEXT_MAX_TOKENS, warm_models_when_listening)
 
-load_dotenv()
+HOST, PORT, DEBUG = 'localhost', 5000, True
 
-def main():
+def serve():
     print("🚀 Starting TTTM Chatbot Server")
     print("=" * 40)
     
@@ -30,23 +39,87 @@ def main():
     print("\n📡 Server will run on: http://localhost:5000")
     print("🌐 Extension should connect to this URL")
     print("\n🔧 Available endpoints:")
+    print("   GET  /api/ready - Readiness (embedding model state)")
     print("   POST /api/chat/new - Create new conversation")
     print("   POST /api/chat/message - Send message")
+    print("   POST /api/chat/message/stream - Send message, stream reply (SSE)")
     print("   GET  /api/chat/history/<id> - Get conversation history")
     print("   DELETE /api/chat/delete/<id> - Delete conversation")
     print("   GET  /api/conversations - List active conversations")
+    print("   GET  /api/conversations/metrics - Conversation store metrics")
+    print("   GET  /api/llm/metrics - LLM call latency, retries and errors")
+    print("   POST /api/voice/transcribe - Transcribe audio (202 + job id, ?wait=seconds to block)")
+    print("   GET  /api/voice/transcribe/<job_id> - Transcription job status / text")
+    print("   GET  /api/voice/metrics - Transcription jobs, pool limits and cache hits")
+    print("   GET  /metrics - Prometheus metrics (stage latency, LLM calls, fetch bytes, caches)")
     
     print("\n🚀 Starting server...")
     print("   Press Ctrl+C to stop")
     print("=" * 40)
     
+    # Models load in the background after the socket is bound; with the debug reloader
+    # only the child process (WERKZEUG_RUN_MAIN) actually serves
+    if os.getenv('TTTK_WARM_MODELS', '1') != '0' and (not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true'):
+        warm_models_when_listening(HOST, PORT)
+
     try:
-        app.run(host='localhost', port=5000, debug=True)
+        app.run(host=HOST, port=PORT, debug=DEBUG)
     except KeyboardInterrupt:
         print("\n\n👋 Server stopped by user")
         print("🧹 Cleaning up conversations...")
-        conversation_manager.active_conversations.clear()
+        context_executor.shutdown(wait=False, cancel_futures=True)
+        summary_executor.shutdown(wait=False, cancel_futures=True)
+        transcription_jobs.close()
+        chat_client.close()  # flush answers still queued for the result sinks
+        conversation_manager.clear()
         print("✅ Cleanup complete")
 
+def ingest(args):
+    from SrcPy.ingest import ingest_sources, read_source_list
+
+    sources = list(args.sources)
+    if args.file:
+        sources += read_source_list(args.file)
+    if not sources:
+        print("⚠️  Nothing to ingest: pass URLs, path=URL pairs or --file")
+        return 1
+
+    print(f"📥 Ingesting {len(sources)} source(s)...")
+    report = ingest_sources(
+        sources,
+        max_tokens=args.max_tokens,
+        fetch_workers=args.fetch_workers,
+        parse_workers=args.parse_workers,
+        batch_size=args.batch_size
+    )
+    for name, stage in report["stages"].items():
+        print(f"   {name:<6} {stage['items']:>6} items in {stage['seconds']:.2f}s ({stage['items_per_sec']} /s)")
+    for failure in report["failed"]:
+        print(f"   ❌ {failure['stage']}: {failure['source']} - {failure['error']}")
+    print(f"✅ Cached {report['pages']} page(s), {report['chunks']} chunks in {report['total_seconds']:.2f}s")
+    if args.json:
+        print(json.dumps(report, indent=2))
+    return 0 if not report["failed"] else 1
+
+def main():
+    parser = argparse.ArgumentParser(description="TTTM chatbot server")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("serve", help="run the server (default)")
+    ingest_parser = commands.add_parser("ingest", help="pre-warm the page cache with URLs or saved copies of them")
+    ingest_parser.add_argument("sources", nargs="*",
+                               help="URLs, or local HTML/PDF copies as path=URL (the URL users will open)")
+    ingest_parser.add_argument("-f", "--file", help="file with one URL or path=URL per line")
+    ingest_parser.add_argument("--max-tokens", type=int, default=CONTEXT_MAX_TOKENS, help="chunk size (match the server)")
+    ingest_parser.add_argument("--fetch-workers", type=int, default=8)
+    ingest_parser.add_argument("--parse-workers", type=int, default=None, help="0 parses in-process")
+    ingest_parser.add_argument("--batch-size", type=int, default=256, help="embedding batch size")
+    ingest_parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        return ingest(args)
+    serve()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,13 @@
+# conftest.py
+"""
+Unit tests for the SrcPy modules: python -m pytest -q tests
+
+The server modules are flat imports from SrcPy (as start_server.py runs them). Models are
+never warmed and ranking uses BM25, so the tests run offline.
+"""
+
+import os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "SrcPy"))
+os.environ.setdefault("TTTK_WARM_MODELS", "0")
+os.environ.setdefault("TTTK_RANKER", "bm25")
@@ -0,0 +1,122 @@
+# test_conversation_store.py
+"""SQLiteConversationStore: per-part writes, stale objects, abandoned builds, limits, idle expiry and several processes."""
+
+import multiprocessing, sqlite3, time
+from concurrent.futures import Future
+
+from conversation_store import SQLiteConversationStore
+from get_net import ChatbotConversation
+
+
+def _store(path, max_conversations=100, max_bytes=10**9):
+    return SQLiteConversationStore(str(path), ChatbotConversation.from_state, max_conversations, max_bytes)
+
+
+def _new(store, text="selected text"):
+    conversation = ChatbotConversation(text, "https://example.com")
+    conversation.on_change = store.update
+    store.put(conversation)
+    return conversation
+
+
+def _recount(path):
+    with sqlite3.connect(str(path)) as db:
+        return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM conversations").fetchone()
+
+
+def test_parts_written_by_one_worker_are_read_by_another(tmp_path):
+    a, b = _store(tmp_path / "c.db"), _store(tmp_path / "c.db")
+    conversation = _new(a)
+    conversation.add_message("why?", "because")
+    with conversation._lock:
+        conversation.context = {"context": "page text"}
+        conversation._changed("context")
+    other = b.get(conversation.conversation_id)
+    assert other.chat_history == conversation.chat_history and other.context == {"context": "page text"}
+    assert other.version == conversation.version
+    assert b.load_context(conversation.conversation_id) == (False, {"context": "page text"})
+    assert a.get(conversation.conversation_id) is conversation  # unchanged: served from the cache
+
+
+def test_object_behind_another_worker_is_reloaded(tmp_path):
+    a, b = _store(tmp_path / "c.db"), _store(tmp_path / "c.db")
+    mine = _new(a)
+    theirs = b.get(mine.conversation_id)
+    theirs.on_change = b.update
+    theirs.add_message("first", "one")
+    mine.add_message("second", "two")  # both turns are kept, but this object missed the first
+    assert mine.version == -1
+    reloaded = a.get(mine.conversation_id)
+    assert reloaded is not mine
+    assert [m["user_question"] for m in reloaded.chat_history] == ["first", "second"]
+
+
+def test_count_and_byte_limits_use_the_running_totals(tmp_path):
+    path = tmp_path / "c.db"
+    store = _store(path, max_conversations=3)
+    conversations = [_new(store, f"text {n}") for n in range(5)]
+    assert store.get(conversations[0].conversation_id) is None
+    assert store.metrics()["live_conversations"] == 3
+    assert store.metrics()["evictions"]["count"] == 2
+    conversations[-1].add_message("q" * 500, "a" * 500)
+    assert tuple(store._totals(store._db())) == _recount(path)
+
+    small = _store(tmp_path / "small.db", max_bytes=200)
+    first, second = _new(small, "x" * 120), _new(small, "y" * 120)
+    assert small.get(first.conversation_id) is None and small.get(second.conversation_id) is not None
+    assert small.metrics()["evictions"]["bytes"] == 1
+
+
+def test_expire_idle_releases_the_cached_objects(tmp_path):
+    path = tmp_path / "c.db"
+    store = _store(path)
+    idle, active = _new(store), _new(store)
+    idle.context_future = Future()
+    with sqlite3.connect(str(path)) as db:
+        db.execute("UPDATE conversations SET last_activity = ? WHERE id = ?",
+                   (time.time() - 3600, idle.conversation_id))
+    assert store.expire_idle(60) == 1
+    assert idle.context_future.cancelled()  # released, not left running in this worker
+    assert store.get(idle.conversation_id) is None and store.get(active.conversation_id) is active
+    assert store.metrics()["live_conversations"] == 1 and store.metrics()["evictions"]["idle"] == 1
+
+
+def test_pending_build_of_a_dead_worker_falls_back_to_the_selection(tmp_path):
+    a, b = _store(tmp_path / "c.db"), _store(tmp_path / "c.db")
+    conversation = _new(a)
+    with conversation._lock:
+        conversation.context_pending = time.time() - 3600  # queued by a worker that never finished it
+        conversation._changed("context")
+    other = b.get(conversation.conversation_id)
+    other.on_change, other.load_context = b.update, b.load_context
+    assert other.context_status() == "ready"
+    started = time.monotonic()
+    other.wait_for_context(timeout=5)
+    assert time.monotonic() - started < 1
+    assert other.context == other.fallback_context()
+    assert a.load_context(conversation.conversation_id) == (0.0, other.fallback_context())
+
+
+def _worker(path, worker):
+    store = _store(path, max_conversations=20)
+    for n in range(15):
+        conversation = _new(store, f"worker {worker} text {n}")
+        conversation.add_message(f"question {n}", "answer " * n)
+        if n % 4 == 0:
+            store.delete(conversation.conversation_id)
+
+
+def test_totals_stay_exact_across_processes(tmp_path):
+    path = tmp_path / "c.db"
+    _store(path)
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_worker, args=(str(path), w)) for w in range(3)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    store = _store(path, max_conversations=20)
+    count, size = _recount(path)
+    assert count <= 20
+    assert (store.metrics()["live_conversations"], store.metrics()["estimated_bytes"]) == (count, size)
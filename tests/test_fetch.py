@@ -0,0 +1,29 @@
+# test_fetch.py
+"""decode_html: BOM, Content-Type charset, <meta charset> and the utf-8/windows-1252 fallback."""
+
+import codecs
+
+from fetch import decode_html
+
+_TEXT = "Größe – café"
+
+
+def test_bom_wins_over_everything():
+    body = codecs.BOM_UTF16_LE + f"<p>{_TEXT}</p>".encode("utf-16-le")
+    assert decode_html(body, "text/html; charset=iso-8859-1") == f"<p>{_TEXT}</p>"
+    assert decode_html(codecs.BOM_UTF8 + _TEXT.encode()) == _TEXT
+
+
+def test_header_charset_then_meta_charset():
+    latin = f"<meta charset='utf-8'><p>{_TEXT}</p>".encode("cp1252")
+    assert _TEXT in decode_html(latin, "text/html; charset=windows-1252")
+    meta = '<head><meta charset="shift_jis"></head><p>日本語</p>'.encode("shift_jis")
+    assert "日本語" in decode_html(meta, "text/html")
+    equiv = ('<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">'
+             "<p>Привет</p>").encode("koi8-r")
+    assert "Привет" in decode_html(equiv, "text/html; charset=bogus")
+
+
+def test_undeclared_bytes_fall_back_to_utf8_then_windows_1252():
+    assert decode_html(f"<p>{_TEXT}</p>".encode()) == f"<p>{_TEXT}</p>"
+    assert decode_html(f"<p>{_TEXT}</p>".encode("cp1252")) == f"<p>{_TEXT}</p>"
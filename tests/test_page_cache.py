@@ -0,0 +1,107 @@
+# test_page_cache.py
+"""PageCache: round trip, keys, a byte cap shared by several workers, concurrent writes."""
+
+import multiprocessing, os, threading, time
+
+import numpy as np
+
+import page_cache
+from page_cache import PageCache, normalize_url
+
+
+def _put(cache, key, size=1000, embeddings=None):
+    cache.put(key, source=f"https://example.com/{key}", title=key, markdown="x" * size,
+              chunks=["x" * size], spans=[{"start": 0, "end": size, "headings": [], "page": None}],
+              embeddings=embeddings)
+
+
+def _page_files(root):
+    return sorted(n for n in os.listdir(root) if n.endswith((".json", ".npy")) and n != "index.json")
+
+
+def test_round_trip_and_embeddings(tmp_path):
+    cache = PageCache(root=str(tmp_path))
+    _put(cache, "a", embeddings=np.ones((1, 4)))
+    page = cache.get("a")
+    assert page["title"] == "a" and page["fresh"] and page["embeddings"].shape == (1, 4)
+    assert page["spans"] == [{"start": 0, "end": 1000, "headings": [], "page": None}]
+    cache.put_embeddings("a", np.zeros((1, 4)))
+    assert not cache.get("a")["embeddings"].any()
+    assert cache.get("missing") is None
+
+
+def test_key_ignores_tracking_params_and_fragments():
+    assert normalize_url("HTTPS://Example.com:443/a?utm_source=x&b=2#top") == "https://example.com/a?b=2"
+    assert PageCache.key_for("https://example.com/a?fbclid=1", 320) == PageCache.key_for("https://example.com/a", 320)
+    assert PageCache.key_for("https://example.com/a", 320) != PageCache.key_for("https://example.com/a", 200)
+
+
+def test_entries_of_other_workers_are_seen_and_evicted(tmp_path):
+    a = PageCache(root=str(tmp_path), max_bytes=7000)
+    b = PageCache(root=str(tmp_path), max_bytes=7000)
+    _put(a, "one")
+    _put(b, "two")
+    _put(a, "three")
+    assert a.get("two") is not None and a.stats()["entries"] == 3
+    _put(a, "four")  # over the cap: the oldest entry goes, whichever worker wrote it
+    assert b.get("one") is None
+    assert {k for k in ("two", "three", "four") if b.get(k)} == {"two", "three", "four"}
+    assert b.stats()["bytes"] <= 7000
+    assert _page_files(str(tmp_path)) == ["four.json", "three.json", "two.json"]
+
+
+def _writer(root, worker):
+    cache = PageCache(root=root, max_bytes=20_000)
+    for n in range(15):
+        _put(cache, f"w{worker}-{n}", size=600, embeddings=np.ones((2, 8)))
+
+
+def test_byte_cap_holds_across_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_writer, args=(str(tmp_path), w)) for w in range(3)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    cache = PageCache(root=str(tmp_path), max_bytes=20_000)
+    stats = cache.stats()
+    assert 0 < stats["bytes"] <= 20_000
+    on_disk = sum(os.path.getsize(os.path.join(str(tmp_path), n)) for n in _page_files(str(tmp_path)))
+    assert on_disk == stats["bytes"]  # no file outlives its index entry
+
+
+def test_concurrent_embedding_writes_to_one_key(tmp_path):
+    cache = PageCache(root=str(tmp_path))
+    _put(cache, "a")
+    errors = []
+
+    def write(value):
+        try:
+            for _ in range(20):
+                cache.put_embeddings("a", np.full((50, 64), value, dtype=np.float32))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(v,)) for v in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    embeddings = cache.get("a")["embeddings"]
+    assert embeddings.shape == (50, 64) and len(np.unique(embeddings)) == 1
+    assert not [n for n in os.listdir(str(tmp_path)) if n.endswith(".tmp.npy")]
+
+
+def test_orphaned_files_are_removed_on_open(tmp_path, monkeypatch):
+    cache = PageCache(root=str(tmp_path))
+    _put(cache, "kept")
+    orphan = os.path.join(str(tmp_path), "orphan.json")
+    with open(orphan, "w") as f:
+        f.write("{}")
+    old = time.time() - 3600
+    os.utime(orphan, (old, old))
+    monkeypatch.setattr(page_cache, "_ORPHAN_SECONDS", 60.0)
+    PageCache(root=str(tmp_path))
+    assert _page_files(str(tmp_path)) == ["kept.json"]
@@ -0,0 +1,48 @@
+# test_semantic_cache.py
+"""Semantic cache: scoped hits across conversations, misses in other threads, bypass without an embedder."""
+
+import hashlib, itertools
+
+import numpy as np
+
+import get_net
+
+_calls = itertools.count()  # LLM answers differ from one call to the next
+
+
+def _embed(texts):
+    return np.array([np.frombuffer(hashlib.sha256(t.encode()).digest(), dtype=np.uint8).astype(np.float32)
+                     for t in texts])
+
+
+def _ask(monkeypatch, questions):
+    monkeypatch.setattr(get_net.semantic_cache, "embed", _embed)
+    monkeypatch.setattr(get_net.chat_client, "askSpecific", lambda prompt: f"answer {next(_calls)}")
+    conversation = get_net.ChatbotConversation("selected text")
+    monkeypatch.setattr(conversation, "context_text", lambda: "page context")
+    hits = []
+    for question in questions:
+        answer, hit = conversation.generate_llm_response(question)
+        conversation.add_message(question, answer)
+        hits.append(hit)
+    return hits
+
+
+def test_follow_ups_hit_after_the_same_question_in_another_conversation(monkeypatch):
+    get_net.semantic_cache.clear()
+    assert _ask(monkeypatch, ["what is X?", "why?"]) == [False, False]
+    assert _ask(monkeypatch, ["what is X?", "why?"]) == [True, True]
+    # only the last question scopes a follow-up, not everything said before it
+    assert _ask(monkeypatch, ["what is Z?", "what is X?", "why?"]) == [False, False, True]
+    assert _ask(monkeypatch, ["what is Y?", "why?"]) == [False, False]  # "why?" after another question
+
+
+def test_lookup_without_an_embedder_is_counted_as_bypass(monkeypatch):
+    events = get_net.CACHE_EVENTS._values
+    before = events[("semantic", "miss")], events[("semantic", "bypass")]
+    monkeypatch.setattr(get_net.semantic_cache, "embed", lambda texts: None)
+    monkeypatch.setattr(get_net.chat_client, "askSpecific", lambda prompt: "answer")
+    conversation = get_net.ChatbotConversation("selected text")
+    monkeypatch.setattr(conversation, "context_text", lambda: "page context")
+    assert conversation.generate_llm_response("what is X?") == ("answer", False)
+    assert (events[("semantic", "miss")], events[("semantic", "bypass")]) == (before[0], before[1] + 1)
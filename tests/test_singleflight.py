@@ -0,0 +1,71 @@
+# test_singleflight.py
+"""SingleFlight: concurrent callers share one call and its exception; nothing is kept afterwards."""
+
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _concurrent(flight, fn, callers=8):
+    """Run flight.do("k", fn) from `callers` threads while fn is blocked; results or exceptions."""
+    outcomes = []
+
+    def call():
+        try:
+            outcomes.append(flight.do("k", fn, timeout=5))
+        except Exception as e:
+            outcomes.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    return threads, outcomes
+
+
+def test_concurrent_callers_share_one_execution():
+    flight, release, runs = SingleFlight("test-share"), threading.Event(), []
+
+    def fn():
+        runs.append(1)
+        release.wait(5)
+        return object()
+
+    threads, outcomes = _concurrent(flight, fn)
+    while flight.metrics()["executed"] + flight.metrics()["coalesced"] < len(threads):
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(runs) == 1 and len(outcomes) == 8
+    assert all(o is outcomes[0] for o in outcomes)  # the very same result object
+    assert flight.metrics() == {"executed": 1, "coalesced": 7, "in_flight": 0}
+
+
+def test_exception_reaches_every_waiter():
+    flight, release = SingleFlight("test-error"), threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise ValueError("upstream failed")
+
+    threads, outcomes = _concurrent(flight, fn, callers=4)
+    while flight.metrics()["executed"] + flight.metrics()["coalesced"] < len(threads):
+        release.wait(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(outcomes) == 4 and all(isinstance(o, ValueError) for o in outcomes)
+    assert flight.metrics()["in_flight"] == 0
+
+
+def test_results_are_not_kept_after_the_call_returns():
+    flight, runs = SingleFlight("test-nocache"), []
+    assert flight.do("k", lambda: runs.append(1) or len(runs)) == 1
+    assert flight.do("k", lambda: runs.append(1) or len(runs)) == 2
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
+    assert flight.do("k", lambda: "recovered") == "recovered"
+    assert flight.do("other", lambda: "independent") == "independent"
+    assert flight.metrics() == {"executed": 5, "coalesced": 0, "in_flight": 0}
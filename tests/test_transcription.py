@@ -0,0 +1,85 @@
+# test_transcription.py
+"""TranscriptionJobs: caching, dedup of concurrent uploads, the pending cap and submit failures."""
+
+import io, threading
+
+import pytest
+
+from response_cache import ResponseCache
+from transcription import StubProvider, TranscriptionBusy, TranscriptionJobs, spool_upload, UploadTooLarge
+
+
+def _jobs(**kwargs):
+    return TranscriptionJobs(provider=kwargs.pop("provider", StubProvider()), cache=ResponseCache(db_path=""),
+                             **kwargs)
+
+
+def _upload(data: bytes):
+    return spool_upload(io.BytesIO(data))
+
+
+def test_spool_upload_hashes_and_limits():
+    spooled, digest, size = _upload(b"x" * 200_000)
+    assert size == 200_000 and len(digest) == 64 and spooled.read() == b"x" * 200_000
+    with pytest.raises(UploadTooLarge):
+        spool_upload(io.BytesIO(b"x" * 10), max_bytes=5)
+
+
+def test_second_upload_is_a_cache_hit():
+    jobs = _jobs()
+    try:
+        first = jobs.submit(*_upload(b"audio-1"), "a.webm", "audio/webm")
+        done = jobs.wait(first["job_id"], timeout=5)
+        assert done["status"] == "done" and not done["cached"]
+        second = jobs.submit(*_upload(b"audio-1"), "a.webm", "audio/webm")
+        assert second["status"] == "done" and second["cached"] and second["text"] == done["text"]
+        assert jobs.provider.calls == 1
+    finally:
+        jobs.close()
+
+
+def test_concurrent_identical_uploads_share_one_job():
+    provider = StubProvider(delay=0.2)
+    jobs = _jobs(provider=provider, max_pending=4)
+    ids, barrier = [], threading.Barrier(16)
+
+    def upload():
+        upload_args = _upload(b"same recording")
+        barrier.wait()
+        ids.append(jobs.submit(*upload_args)["job_id"])
+
+    threads = [threading.Thread(target=upload) for _ in range(16)]
+    try:
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(set(ids)) == 1
+        assert jobs.wait(ids[0], timeout=5)["status"] == "done"
+        assert provider.calls == 1
+    finally:
+        jobs.close()
+
+
+def test_pending_cap_rejects_with_busy():
+    jobs = _jobs(provider=StubProvider(delay=0.3), workers=1, max_pending=1)
+    try:
+        jobs.submit(*_upload(b"first"))
+        with pytest.raises(TranscriptionBusy):
+            jobs.submit(*_upload(b"second"))
+        assert jobs.metrics()["rejected"] == 1
+    finally:
+        jobs.close()
+
+
+def test_submit_after_shutdown_frees_the_slot_and_fails_the_job():
+    jobs = _jobs(max_pending=1)
+    jobs.close()
+    audio, digest, size = _upload(b"late")
+    job = jobs.submit(audio, digest, size)
+    assert job["status"] == "error" and job["error"]
+    assert audio.closed
+    assert jobs.wait(job["job_id"], timeout=1)["status"] == "error"
+    # the slot and the digest are free again: a new submit fails the same way instead of "busy"
+    assert jobs.submit(*_upload(b"late"))["status"] == "error"
+    assert jobs.metrics()["failed"] == 2
@@ -0,0 +1,108 @@
+# test_vector_store.py
+"""VectorStore: page log, superseded rows, compaction, crash recovery and several processes."""
+
+import json, multiprocessing, os
+
+import numpy as np
+
+from vector_store import VectorStore
+
+
+def _vecs(seed, rows, dim=8):
+    return np.random.default_rng(seed).random((rows, dim), dtype=np.float32)
+
+
+def test_add_and_read_back(tmp_path):
+    store = VectorStore(root=str(tmp_path))
+    a, b = _vecs(1, 3), _vecs(2, 5)
+    store.add_page("a", a, url="https://a", offsets=[0, 10, 20], content_hash="ha")
+    store.add_page("b", b, content_hash="hb")
+    np.testing.assert_array_equal(store.get_page("a"), a)
+    np.testing.assert_array_equal(store.get_page("b", "hb"), b)
+    assert store.get_page("b", "other") is None
+    assert store.page_info("a")["offsets"] == [0, 10, 20]
+    assert store.search_page("b", b[3], top_k=2)[0] == 3
+    # a second instance (another worker) sees the same pages
+    np.testing.assert_array_equal(VectorStore(root=str(tmp_path)).get_page("a"), a)
+
+
+def test_new_version_supersedes_and_compaction_reclaims(tmp_path):
+    store = VectorStore(root=str(tmp_path), compact_ratio=0.5, compact_min_rows=0)
+    store.add_page("keep", _vecs(0, 4), content_hash="k")
+    reader = VectorStore(root=str(tmp_path))
+    for version in range(4):
+        store.add_page("page", _vecs(10 + version, 4), content_hash=f"v{version}")
+    stats = store.stats()
+    assert stats["generation"] >= 1 and stats["dead_rows"] < stats["rows"] / 2
+    vec_file = os.path.join(str(tmp_path), f"vectors.{stats['generation']}.f32")
+    assert os.path.getsize(vec_file) == stats["rows"] * 8 * 4
+    np.testing.assert_array_equal(store.get_page("page"), _vecs(13, 4))
+    np.testing.assert_array_equal(store.get_page("keep"), _vecs(0, 4))
+    # a worker opened before the compaction follows it on its next read
+    np.testing.assert_array_equal(reader.get_page("page", "v3"), _vecs(13, 4))
+    assert reader.stats()["generation"] == stats["generation"]
+
+
+def test_same_content_is_not_appended_twice(tmp_path):
+    store = VectorStore(root=str(tmp_path))
+    store.add_page("a", _vecs(1, 3), content_hash="h")
+    store.add_page("a", _vecs(1, 3), content_hash="h")
+    assert store.stats()["rows"] == 3
+
+
+def test_crash_between_vector_append_and_log_line(tmp_path):
+    store = VectorStore(root=str(tmp_path))
+    store.add_page("a", _vecs(1, 3))
+    # a writer dies after appending its vectors and half of its log line
+    with open(os.path.join(str(tmp_path), "vectors.0.f32"), "ab") as f:
+        f.write(_vecs(99, 7).tobytes())
+    with open(os.path.join(str(tmp_path), "pages.0.log"), "a") as f:
+        f.write('{"key": "lost", "start": 3, "cou')
+
+    survivor = VectorStore(root=str(tmp_path))
+    assert survivor.page_info("lost") is None
+    survivor.add_page("b", _vecs(2, 5))
+    np.testing.assert_array_equal(survivor.get_page("b"), _vecs(2, 5))
+    np.testing.assert_array_equal(survivor.get_page("a"), _vecs(1, 3))
+    assert survivor.page_info("b")["start"] == 3
+    assert os.path.getsize(os.path.join(str(tmp_path), "vectors.0.f32")) == 8 * 8 * 4
+    with open(os.path.join(str(tmp_path), "pages.0.log")) as f:
+        assert [json.loads(line)["key"] for line in f] == ["a", "b"]
+
+
+def test_old_single_file_layout_is_set_aside(tmp_path):
+    with open(os.path.join(str(tmp_path), "meta.json"), "w") as f:
+        json.dump({"dim": 8, "rows": 3, "pages": {"a": {"start": 0, "count": 3}}}, f)
+    with open(os.path.join(str(tmp_path), "vectors.f32"), "wb") as f:
+        f.write(_vecs(1, 3).tobytes())
+    with open(os.path.join(str(tmp_path), "index.faiss"), "wb") as f:
+        f.write(b"faiss")
+    with open(os.path.join(str(tmp_path), "notes.txt"), "w") as f:
+        f.write("not ours")
+    store = VectorStore(root=str(tmp_path))
+    assert store.get_page("a") is None and not os.path.exists(os.path.join(str(tmp_path), "vectors.f32"))
+    assert {"meta.json.old", "vectors.f32.old", "index.faiss.old", "notes.txt"} <= set(os.listdir(str(tmp_path)))
+    store.add_page("a", _vecs(1, 3))
+    np.testing.assert_array_equal(store.get_page("a"), _vecs(1, 3))
+
+
+def _add_pages(root, worker, pages):
+    store = VectorStore(root=root, compact_ratio=0.5, compact_min_rows=16)
+    for n in range(pages):
+        store.add_page(f"w{worker}-{n % 5}", _vecs(worker * 1000 + n, 3), content_hash=str(n))
+
+
+def test_concurrent_writers_in_several_processes(tmp_path):
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=_add_pages, args=(str(tmp_path), w, 20)) for w in range(3)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+        assert p.exitcode == 0
+    store = VectorStore(root=str(tmp_path))
+    for w in range(3):
+        for key in range(5):
+            # the last version written of each page: n = 15 + key
+            np.testing.assert_array_equal(store.get_page(f"w{w}-{key}"), _vecs(w * 1000 + 15 + key, 3))
+    assert store.stats()["pages"] == 15